@@ -0,0 +1,320 @@
+### CAMERA MOTION FROM VIDEO FEEDBACK ###
+# Measures how far the camera has actually turned from the global shift between consecutive frames
+# (phase correlation on downscaled grayscale), so pans can be stopped on target instead of after a guessed time.
+
+import json
+import os
+
+import cv2
+import numpy as np
+
+from cue_scheduler import SystemClock, Timeline, summarize_jitter
+
+ANALYSIS_WIDTH = 320      # frames are downscaled to this width before phase correlation
+MIN_RESPONSE = 0.05       # phase correlation peaks weaker than this (blur, scene change) are ignored
+SETTLE_SHIFT = 1.0        # pixels per frame (full resolution) under which the camera counts as stopped
+SETTLE_TIMEOUT = 1.0      # seconds to wait for the camera to stop after ptzstop
+RATE_SMOOTHING = 0.3      # weight of a new measurement in the persisted rates
+
+# Image motion per second of each command at the default speeds, from the old hard-coded pan rates
+DEFAULT_RATES = {'left': (1920 / 2 - 301) / .62, 'right': (1736 - 1920 / 2) / .56, 'up': 600.0, 'down': 600.0}
+
+# Sign of the image shift (dx, dy) when the camera turns in each direction: panning right moves the scene left
+DIRECTION_SIGNS = {'left': (1, 0), 'right': (-1, 0), 'up': (0, 1), 'down': (0, -1)}
+
+
+def frame_feed(cap, clock=SystemClock):
+    """
+    Callable returning the next new Frame-like (image, timestamp, seq) from a capture, or None on timeout.
+    Uses LatestFrameGrabber.peek where available so the main loop still gets every frame it would have;
+    other captures' frames are stamped with clock.monotonic() when read.
+    """
+    if hasattr(cap, 'peek'):
+        last_seq = [0]
+
+        def next_frame(timeout=1.0):
+            frame = cap.peek(last_seq[0], timeout)
+            if frame is not None:
+                last_seq[0] = frame.seq
+            return frame
+        return next_frame
+
+    seq = [0]
+
+    def read_frame(timeout=1.0):
+        ret, image = cap.read()
+        if not ret:
+            return None
+        seq[0] += 1
+        return image, clock.monotonic(), seq[0]
+    return read_frame
+
+
+class MotionEstimator:
+    """
+    Accumulates the global image shift between consecutive frames while the camera moves.
+
+    Each frame is converted to grayscale, downscaled to ANALYSIS_WIDTH and windowed, and its translation
+    against the previous frame is found with cv2.phaseCorrelate. Shifts are reported in full-resolution pixels.
+
+    Parameters:
+    next_frame (callable): Returns the next (image, timestamp, seq), e.g. frame_feed(cap).
+    """
+
+    def __init__(self, next_frame, analysis_width=ANALYSIS_WIDTH):
+        self.next_frame = next_frame
+        self.analysis_width = analysis_width
+        self._window = None
+        self.reset()
+
+    def reset(self):
+        """Starts measuring from the next frame."""
+        self._previous = None
+        self.scale = 1.0
+        self.shift = np.zeros(2)  # accumulated (dx, dy) in full-resolution pixels
+        self.last_shift = np.zeros(2)
+        self.timestamp = None
+
+    def _prepare(self, image):
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        self.scale = image.shape[1] / self.analysis_width
+        small = cv2.resize(gray, (self.analysis_width, int(round(image.shape[0] / self.scale))),
+                           interpolation=cv2.INTER_AREA)
+        small = np.float32(small)
+        if self._window is None or self._window.shape != small.shape:
+            self._window = cv2.createHanningWindow(small.shape[::-1], cv2.CV_32F)
+        return small
+
+    def update(self, timeout=1.0):
+        """
+        Reads the next frame and adds its shift against the previous one.
+
+        Returns:
+        The accumulated (dx, dy), or None if no frame arrived in time.
+        """
+        frame = self.next_frame(timeout)
+        if frame is None:
+            return None
+        image, timestamp, _ = frame
+        current = self._prepare(image)
+        self.last_shift = np.zeros(2)
+        if self._previous is not None and self._previous.shape == current.shape:
+            (dx, dy), response = cv2.phaseCorrelate(self._previous, current, self._window)
+            if response >= MIN_RESPONSE:
+                self.last_shift = np.array([dx, dy]) * self.scale
+                self.shift += self.last_shift
+        self._previous = current
+        self.timestamp = timestamp
+        return self.shift
+
+    def travelled(self, direction):
+        """Pixels the camera has turned in a direction since reset(), from the accumulated image shift."""
+        return float(np.dot(DIRECTION_SIGNS[direction], self.shift))
+
+
+class MotionRates:
+    """
+    Measured image motion of each move command, persisted as JSON so later moves start from a good estimate.
+
+    For every (direction, speed) it keeps the pixels per second of command time (including the camera's
+    start-up lag, so it is directly usable for timed moves) and the coast, the pixels the camera still
+    moves after ptzstop.
+
+    Parameters:
+    path (str): JSON file the rates are kept in, None to not persist them.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.rates = {}
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self.rates = json.load(f)
+
+    @staticmethod
+    def _key(direction, speed):
+        return f"{direction}@{speed}"
+
+    def rate(self, direction, speed=24):
+        """Pixels per second, the measured one if there is one, else DEFAULT_RATES (at the default speed)."""
+        measured = self.rates.get(self._key(direction, speed))
+        if measured is not None:
+            return measured['rate']
+        return DEFAULT_RATES[direction] * speed / 24
+
+    def coast(self, direction, speed=24):
+        measured = self.rates.get(self._key(direction, speed))
+        return measured['coast'] if measured is not None else 0.0
+
+    def is_measured(self, direction, speed=24):
+        return self._key(direction, speed) in self.rates
+
+    def record(self, direction, speed, rate, coast):
+        """Blends a new measurement into the rates and saves them."""
+        key = self._key(direction, speed)
+        if key in self.rates:
+            old = self.rates[key]
+            rate = old['rate'] + RATE_SMOOTHING * (rate - old['rate'])
+            coast = old['coast'] + RATE_SMOOTHING * (coast - old['coast'])
+            count = old['count'] + 1
+        else:
+            count = 1
+        self.rates[key] = {'rate': rate, 'coast': coast, 'count': count}
+        if self.path is not None:
+            with open(self.path, 'w') as f:
+                json.dump(self.rates, f, indent=2)
+
+    def time_for(self, direction, pixels, speed=24):
+        """Seconds of a timed move that turns the camera by pixels, allowing for the coast after ptzstop."""
+        return max(pixels - self.coast(direction, speed), 0.0) / self.rate(direction, speed)
+
+
+def move_closed_loop(send, estimator, direction, pixels, rates, speed=24, timeout=None, clock=SystemClock):
+    """
+    Turns the camera by a number of image pixels, watching the video to stop on target.
+
+    The move is stopped early by the expected coast (and half a frame of motion), then the estimator keeps following the image until the
+    camera has stopped. The measured rate and coast are recorded in rates, so the next move (and timed moves
+    using rates.time_for) needs less correction.
+
+    Parameters:
+    send (callable): Sends one camera command, e.g. PTZTransport.send.
+    estimator (MotionEstimator): Watches the video while the camera moves.
+    direction (str): "left", "right", "up" or "down".
+    pixels (float): How far to turn, in pixels of image motion.
+    rates (MotionRates): Measured rates, updated after the move.
+    timeout (float): Seconds after which the camera is stopped anyway; default twice the expected time plus 1 s.
+    clock: Times the move with clock.monotonic, e.g. SystemClock or a VirtualClock.
+
+    Returns:
+    The pixels actually turned.
+    """
+    if pixels <= 0:
+        return 0.0
+    expected = pixels / rates.rate(direction, speed)
+    timeout = 2 * expected + 1.0 if timeout is None else timeout
+    stop_at = pixels - rates.coast(direction, speed)
+
+    estimator.reset()
+    estimator.update()  # reference frame
+    start = clock.monotonic()
+    send(direction, speed)  # tilts keep PTZTransport.send's default tilt speed
+    travelled = 0.0
+    while clock.monotonic() - start < timeout:
+        if estimator.update() is None:
+            print("No video while the camera moved, stopping.")
+            break
+        travelled = estimator.travelled(direction)
+        # Half a frame's motion early, so that on average it stops on target rather than a frame late
+        if travelled + np.dot(DIRECTION_SIGNS[direction], estimator.last_shift) / 2 >= stop_at:
+            break
+    else:
+        print(f"Camera didn't turn {pixels:.0f} px {direction} within {timeout:.1f} s ({travelled:.0f} px).")
+    stopped = clock.monotonic()
+    send("ptzstop")
+    at_stop = travelled
+
+    # Follow the camera until it has come to rest
+    while clock.monotonic() - stopped < SETTLE_TIMEOUT:
+        if estimator.update() is None:
+            break
+        travelled = estimator.travelled(direction)
+        if np.abs(estimator.last_shift).max() < SETTLE_SHIFT:
+            break
+
+    if at_stop > 0:
+        rates.record(direction, speed, at_stop / (stopped - start), max(travelled - at_stop, 0.0))
+    print(f"Turned {travelled:.0f} of {pixels:.0f} px {direction} in {stopped - start:.2f} s")
+    return travelled
+
+
+class ClosedLoopPans:
+    """
+    Runs cue timelines like a CueScheduler, but performs their timed pans closed-loop: every left / right event
+    followed by a ptzstop becomes a move_closed_loop by the pixels the timed pan was meant to turn, and the
+    rest of the timeline runs on the scheduler, shifted to start when the camera has come to rest.
+    Usable wherever a scheduler is, e.g. execute_planned_measure.
+
+    Parameters:
+    scheduler (CueScheduler): Runs the parts of the timelines between the pans.
+    estimator (MotionEstimator): Watches the video while the camera pans.
+    rates (MotionRates): Measured rates, updated by every pan.
+    pixels_per_second (float): Image shift per second of a timed pan, e.g. PanMap.pixels_per_second for plans
+    compiled with a pan map; default the rate in rates.
+    speed (int): Pan speed the timelines were timed for.
+    clock: Times the pans, see move_closed_loop.
+    """
+
+    def __init__(self, scheduler, estimator, rates, pixels_per_second=None, speed=24, clock=SystemClock):
+        self.scheduler = scheduler
+        self.estimator = estimator
+        self.rates = rates
+        self.pixels_per_second = pixels_per_second
+        self.speed = speed
+        self.clock = clock
+        self.cancelled = False
+        self._cancel = False
+        self._running = False
+
+    @property
+    def busy(self):
+        return self._running
+
+    def cancel(self):
+        """Stops the running timeline before its next event or pan. Returns False if none was running."""
+        if not self._running:
+            return self.scheduler.cancel()  # a timeline run on the scheduler directly
+        self._cancel = True
+        self.scheduler.cancel()
+        return True
+
+    @staticmethod
+    def split(timeline):
+        """
+        Splits a timeline at its pans.
+
+        Returns:
+        A list of timelines and (direction, seconds) pans, in order.
+        """
+        parts, events, start = [], [], 0.0
+        timed = list(timeline.events)
+        i = 0
+        while i < len(timed):
+            offset, command = timed[i]
+            if command in ("left", "right") and i + 1 < len(timed) and timed[i + 1][1] == "ptzstop":
+                parts.append(Timeline(events, offset - start))
+                parts.append((command, timed[i + 1][0] - offset))
+                events, start = [], timed[i + 1][0]
+                i += 2
+                continue
+            events.append((offset - start, command))
+            i += 1
+        parts.append(Timeline(events, timeline.duration - start))
+        return parts
+
+    def run(self, timeline, verbose=True):
+        """Performs a timeline, see CueScheduler.run. Returns the scheduler's CueReports of the timed parts."""
+        reports = []
+        self.cancelled = self._cancel = False
+        self._running = True
+        try:
+            for part in self.split(timeline):
+                if self._cancel:
+                    break
+                if isinstance(part, Timeline):
+                    reports += self.scheduler.run(part, verbose=False)
+                    if self.scheduler.cancelled:
+                        break
+                else:
+                    direction, seconds = part
+                    rate = self.pixels_per_second or self.rates.rate(direction, self.speed)
+                    move_closed_loop(self.scheduler.send, self.estimator, direction, seconds * rate, self.rates, self.speed,
+                                     clock=self.clock)
+            self.cancelled = self._cancel or self.scheduler.cancelled
+        finally:
+            self._running = False
+            self._cancel = False
+
+        if verbose and reports:
+            print(summarize_jitter(reports))
+        return reports
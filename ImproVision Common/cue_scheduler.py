@@ -0,0 +1,295 @@
+import queue
+import threading
+import time
+from collections import namedtuple
+
+
+# One fired event: when it was meant to land (offset into the timeline), what was sent,
+# how far from its deadline it landed and how long the camera took to answer.
+CueReport = namedtuple('CueReport', ['offset', 'command', 'jitter', 'latency'])
+
+# One command as a CommandRecorder saw it: the clock time it was sent at, the command and its extra arguments
+ScheduledCommand = namedtuple('ScheduledCommand', ['time', 'command', 'args'])
+
+
+class Timeline:
+    """
+    A choreography expressed as (offset, command) events on a relative time axis, plus a total duration.
+
+    Offsets are seconds from the start of the timeline. A command is either a command string for
+    send_camera_control (e.g. "up", "ptzstop") or a tuple of positional arguments for it.
+    The duration covers any trailing hold after the last command.
+    """
+
+    def __init__(self, events=(), duration=None):
+        self.events = tuple(sorted(events, key=lambda event: event[0]))  # immutable so compiled timelines can be cached and shared
+        last_offset = self.events[-1][0] if self.events else 0.0
+        self.duration = last_offset if duration is None else max(duration, last_offset)
+
+    @classmethod
+    def from_steps(cls, steps):
+        """
+        Builds a timeline from the sequential form used throughout the scripts, i.e.
+        send_camera_control(command); time.sleep(wait) for each (command, wait) step.
+        A step with command None is a pure wait.
+        """
+        events = []
+        offset = 0.0
+        for command, wait in steps:
+            if command is not None:
+                events.append((offset, command))
+            offset += wait
+        return cls(events, offset)
+
+    def then(self, other):
+        """Returns a new timeline with other starting when this one ends."""
+        shifted = tuple((self.duration + offset, command) for offset, command in other.events)
+        return Timeline(self.events + shifted, self.duration + other.duration)
+
+    __add__ = then
+
+    def to_dict(self):
+        """JSON-serializable form of the timeline."""
+        return {'duration': self.duration, 'events': [[offset, command] for offset, command in self.events]}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Inverse of to_dict; JSON turns tuple commands into lists, so they are turned back into tuples."""
+        events = [(offset, tuple(command) if isinstance(command, list) else command) for offset, command in data['events']]
+        return cls(events, data['duration'])
+
+    def __len__(self):
+        return len(self.events)
+
+    def __repr__(self):
+        return f"Timeline({len(self.events)} events, {self.duration:.2f} s)"
+
+
+class CueScheduler:
+    """
+    Fires timeline events at absolute deadlines on the monotonic clock.
+
+    Because every deadline is measured from the start of the timeline rather than from the previous
+    command, HTTP latency can't accumulate over a measure. Each command is additionally dispatched early
+    by the smoothed one-way latency (half the observed round trip) so that it reaches the camera on time.
+
+    A running timeline can be cancelled from another thread with cancel(); the camera is then sent stop_command
+    so it isn't left moving.
+
+    Parameters:
+    send (callable): Sends one command, e.g. send_camera_control or PTZTransport.send.
+    smoothing (float): Weight of the newest latency sample in the running estimate.
+    sleep (callable): Replaces the default wait, which returns as soon as the cue is cancelled.
+    stop_command (str): Sent when a cue is cancelled, None to send nothing.
+    """
+
+    def __init__(self, send, smoothing=0.2, clock=time.monotonic, sleep=None, stop_command='ptzstop'):
+        self.send = send
+        self.smoothing = smoothing
+        self.clock = clock
+        self.sleep = sleep
+        self.stop_command = stop_command
+        self.latency = 0.0  # smoothed one-way command latency in seconds
+        self.cancelled = False  # whether the last run was cancelled
+        self._cancel = threading.Event()
+        self._running = False
+
+    def _sleep_until(self, deadline):
+        """Waits for a deadline. Returns True if the cue was cancelled meanwhile."""
+        remaining = deadline - self.clock()
+        if self.sleep is None:
+            return self._cancel.wait(remaining) if remaining > 0 else self._cancel.is_set()
+        if remaining > 0:
+            self.sleep(remaining)
+        return self._cancel.is_set()
+
+    @property
+    def busy(self):
+        """Whether a timeline is running."""
+        return self._running
+
+    def cancel(self):
+        """
+        Stops the running timeline before its next event.
+
+        Returns:
+        False if no timeline was running.
+        """
+        if not self._running:
+            return False
+        self._cancel.set()
+        return True
+
+    def _dispatch(self, command):
+        if isinstance(command, tuple):
+            self.send(*command)
+        else:
+            self.send(command)
+
+    def run(self, timeline, verbose=True):
+        """
+        Executes a timeline and blocks until its full duration has elapsed or it is cancelled
+        (see the cancelled attribute).
+
+        Returns:
+        A list of CueReport, one per event fired, with the jitter between the estimated arrival at the
+        camera and the event's deadline.
+        """
+        reports = []
+        self.cancelled = False
+        self._running = True
+        try:
+            start = self.clock()
+            for offset, command in timeline.events:
+                deadline = start + offset
+                if self._sleep_until(deadline - self.latency):
+                    break
+
+                sent_at = self.clock()
+                self._dispatch(command)
+                round_trip = self.clock() - sent_at
+
+                one_way = round_trip / 2
+                self.latency += self.smoothing * (one_way - self.latency)
+                reports.append(CueReport(offset, command, sent_at + one_way - deadline, round_trip))
+            else:
+                self._sleep_until(start + timeline.duration)
+
+            if self._cancel.is_set():
+                self.cancelled = True
+                if self.stop_command is not None:
+                    self._dispatch(self.stop_command)
+                print(f"Cue cancelled after {len(reports)} of {len(timeline)} commands.")
+        finally:
+            self._running = False
+            self._cancel.clear()
+
+        if verbose and reports:
+            print(summarize_jitter(reports))
+        return reports
+
+
+class CueWorker:
+    """
+    Runs cues on a background thread, one at a time, so the vision loop doesn't stop while the camera moves.
+
+    Parameters:
+    on_done (callable): Called with the seconds each cue took, e.g. to record throughput.
+    """
+
+    def __init__(self, on_done=None):
+        self.on_done = on_done
+        self._jobs = queue.Queue(maxsize=1)
+        self._busy = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name='cue-worker', daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            function, args = job
+            start = time.perf_counter()
+            try:
+                function(*args)
+            except Exception as e:
+                print(f"Cue {getattr(function, '__name__', function)} failed: {e}")
+            finally:
+                if self.on_done is not None:
+                    self.on_done(time.perf_counter() - start)
+                self._busy.clear()
+
+    @property
+    def busy(self):
+        """Whether a cue is queued or running."""
+        return self._busy.is_set()
+
+    def submit(self, function, *args):
+        """
+        Starts function(*args) on the worker without waiting for it.
+
+        Returns:
+        False if a cue is already queued or running (the new one is not started).
+        """
+        if self._busy.is_set():
+            return False
+        self._busy.set()
+        self._jobs.put((function, args))
+        return True
+
+    def wait(self, timeout=None):
+        """Blocks until the current cue has finished. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._busy.is_set():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def stop(self, timeout=30):
+        """Lets the current cue finish, then ends the worker thread."""
+        self._jobs.put(None)
+        self._thread.join(timeout)
+
+
+class SystemClock:
+    """The real clock: time.monotonic and time.sleep. See VirtualClock for the simulated one."""
+
+    monotonic = staticmethod(time.monotonic)
+    sleep = staticmethod(time.sleep)
+    simulated = False
+
+
+class VirtualClock:
+    """
+    A monotonic clock for simulation: sleep() advances it instantly instead of waiting, so a whole performance
+    of cues replays in a fraction of a second with the exact timing it would have had.
+
+    Pass monotonic and sleep to CueScheduler (clock=..., sleep=...) and record the commands with a CommandRecorder.
+    """
+
+    simulated = True
+
+    def __init__(self, start=0.0):
+        self.now = start
+        self._lock = threading.Lock()
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            with self._lock:
+                self.now += seconds
+
+
+class CommandRecorder:
+    """
+    Stands in for the camera's send function and records every command with the clock time it was sent at.
+
+    Parameters:
+    clock (callable): Time source, e.g. VirtualClock.monotonic.
+    forward (callable): Also sends the command on, e.g. PTZTransport.send; None to only record.
+    """
+
+    def __init__(self, clock=time.monotonic, forward=None):
+        self.clock = clock
+        self.forward = forward
+        self.schedule = []  # ScheduledCommand, in the order sent
+
+    def send(self, command, *args):
+        self.schedule.append(ScheduledCommand(self.clock(), command, args))
+        if self.forward is not None:
+            return self.forward(command, *args)
+        return "success"
+
+    def clear(self):
+        self.schedule = []
+
+
+def summarize_jitter(reports):
+    """Formats a one-line jitter summary for a list of CueReport."""
+    jitters_ms = [abs(report.jitter) * 1000 for report in reports]
+    return (f"{len(reports)} cues: mean |jitter| {sum(jitters_ms) / len(jitters_ms):.1f} ms, "
+            f"max |jitter| {max(jitters_ms):.1f} ms")
@@ -0,0 +1,109 @@
+import struct
+from collections import namedtuple
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+MAX_FRAME_SHAPE = (1080, 1920, 3)
+
+# What gets passed between processes instead of the frame itself
+FrameRef = namedtuple('FrameRef', ['slot', 'seq', 'shape', 'timestamp'])
+
+RING_HEADER = struct.Struct('<IQ')  # number of slots, bytes per slot
+# Each slot starts with the seq of the frame in it (0 while it is being written)
+SLOT_HEADER = struct.Struct('<Q')
+
+
+class FrameRing:
+    """
+    Ring of uint8 frames in shared memory, so frames can move between processes without pickling.
+
+    The writer copies each frame into slot seq % slots and hands readers a small FrameRef. Readers map the slot
+    directly; the sequence number stored in the slot tells them whether it has been overwritten since. Size the
+    ring so that it holds more frames than can be queued or in flight at once.
+
+    Parameters:
+    name (str): Shared memory name; None lets the system pick one (see .name).
+    slots (int): Number of frames the ring holds.
+    max_frame_shape (tuple): Largest frame that fits in a slot.
+    """
+
+    def __init__(self, name=None, slots=8, max_frame_shape=MAX_FRAME_SHAPE, _shm=None):
+        if _shm is None:
+            slot_size = SLOT_HEADER.size + int(np.prod(max_frame_shape))
+            _shm = shared_memory.SharedMemory(name, create=True, size=RING_HEADER.size + slots * slot_size)
+            RING_HEADER.pack_into(_shm.buf, 0, slots, slot_size)
+        self.shm = _shm
+        self.name = _shm.name
+        self.slots, self.slot_size = RING_HEADER.unpack_from(_shm.buf, 0)
+
+    @classmethod
+    def attach(cls, name, untrack=True):
+        """
+        Opens a ring created by another process. Raises FileNotFoundError if it doesn't exist.
+
+        Before Python 3.13 attaching registers the segment with this process's resource tracker, which would
+        unlink it when this process exits even though the creator owns it, so by default it is unregistered.
+        Pass untrack=False in processes started by the creator with multiprocessing, which share its tracker.
+        """
+        shm = shared_memory.SharedMemory(name)
+        if untrack:
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return cls(_shm=shm)
+
+    @classmethod
+    def remove_stale(cls, name):
+        """Unlinks a ring left behind by a process that was killed."""
+        try:
+            stale = shared_memory.SharedMemory(name)
+        except FileNotFoundError:
+            return
+        stale.close()
+        stale.unlink()
+
+    def _offset(self, slot):
+        return RING_HEADER.size + slot * self.slot_size
+
+    def write(self, image, seq, timestamp=None):
+        """
+        Copies a frame into the ring. seq must be positive and increasing.
+
+        Returns:
+        The FrameRef to pass to readers, or None if the frame is too large for a slot.
+        """
+        if image.nbytes > self.slot_size - SLOT_HEADER.size:
+            return None
+        slot = seq % self.slots
+        offset = self._offset(slot)
+        buf = self.shm.buf
+        SLOT_HEADER.pack_into(buf, offset, 0)
+        np.ndarray(image.shape, np.uint8, buf, offset + SLOT_HEADER.size)[...] = image
+        SLOT_HEADER.pack_into(buf, offset, seq)
+        return FrameRef(slot, seq, image.shape, timestamp)
+
+    def is_current(self, ref):
+        """Whether the slot still holds the referenced frame."""
+        return SLOT_HEADER.unpack_from(self.shm.buf, self._offset(ref.slot))[0] == ref.seq
+
+    def view(self, ref):
+        """
+        The referenced frame in place, without copying. Check is_current afterwards: the writer may have
+        reused the slot while it was being used. Returns None if it has already been overwritten.
+        """
+        if not self.is_current(ref):
+            return None
+        return np.ndarray(ref.shape, np.uint8, self.shm.buf, self._offset(ref.slot) + SLOT_HEADER.size)
+
+    def read(self, ref):
+        """A copy of the referenced frame, or None if it was overwritten before or during the copy."""
+        image = self.view(ref)
+        if image is None:
+            return None
+        image = image.copy()
+        return image if self.is_current(ref) else None
+
+    def close(self):
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
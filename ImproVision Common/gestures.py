@@ -0,0 +1,384 @@
+import threading
+import time
+import warnings
+from collections import deque, namedtuple
+
+import numpy as np
+
+from pose_models import LEFT_SHOULDER, LEFT_WRIST, NOSE, RIGHT_SHOULDER, RIGHT_WRIST
+from tracking import IdSlots
+
+MIN_KEYPOINT_SCORE = 0.3  # nose and wrist must be at least this confident for a gesture to count
+# Body scale of people whose shoulders aren't both visible: height of their confident keypoints times this
+# (shoulder width is roughly a quarter of the head-to-hip extent of a seated musician)
+KEYPOINT_HEIGHT_TO_SHOULDER = 0.25
+
+# Per-person boolean masks from evaluate_gestures, each of shape (persons,)
+GestureMasks = namedtuple('GestureMasks', ['confident', 'left_raised', 'right_raised', 'hand_raised', 'both_raised',
+                                           'left_to_head', 'right_to_head', 'hand_to_head'])
+
+
+def stack_keypoints(results):
+    """
+    Stacks estimate_poses results into one (persons, K, 3) array of x, y, score.
+    Scores are 1 if the backend doesn't provide any.
+    """
+    if not len(results):
+        return np.zeros((0, 0, 3), dtype=np.float32)
+    stacked = []
+    for person in results:
+        instances = person.pred_instances
+        keypoints = np.asarray(instances.keypoints[0], dtype=np.float32)[:, :2]
+        scores = getattr(instances, 'keypoint_scores', None)
+        scores = np.ones(len(keypoints), dtype=np.float32) if scores is None else np.asarray(scores[0], dtype=np.float32)
+        stacked.append(np.column_stack([keypoints, scores]))
+    return np.stack(stacked)
+
+
+def evaluate_gestures(keypoints, scores=None, raise_threshold=50, head_threshold=100, min_score=MIN_KEYPOINT_SCORE,
+                      scale=None):
+    """
+    Evaluates the gesture rules for every person in one vectorized pass.
+
+    Parameters:
+    keypoints (np.ndarray): (persons, K, 3) keypoints with scores, or (persons, K, 2) plus scores.
+    scores (np.ndarray): (persons, K) keypoint scores if keypoints has no score column; None means all confident.
+    raise_threshold (float): Pixels a wrist must be above the nose to count as raised.
+    head_threshold (float): Pixels within which a wrist counts as touching the head.
+    min_score (float): Confidence gate for the nose and wrists; people or hands below it never trigger.
+    scale (np.ndarray): (persons,) body scale (see body_scale) the thresholds are multiplied by, so they are in
+    body scales rather than pixels. People whose scale is NaN never trigger. None for pixel thresholds.
+
+    Returns:
+    A GestureMasks of (persons,) boolean arrays.
+    """
+    keypoints = np.asarray(keypoints, dtype=np.float32)
+    if keypoints.ndim == 2:
+        keypoints = keypoints[None]
+    if len(keypoints) == 0:
+        empty = np.zeros(0, dtype=bool)
+        return GestureMasks(*[empty] * len(GestureMasks._fields))
+
+    picked = keypoints[:, [NOSE, LEFT_WRIST, RIGHT_WRIST]]  # (persons, 3, 2 or 3)
+    if keypoints.shape[-1] > 2:
+        picked_scores = picked[..., 2]
+    elif scores is not None:
+        picked_scores = np.asarray(scores, dtype=np.float32)[:, [NOSE, LEFT_WRIST, RIGHT_WRIST]]
+    else:
+        picked_scores = np.ones(picked.shape[:2], dtype=np.float32)
+
+    confident = picked_scores >= min_score
+    wrists_ok = confident[:, 1:] & confident[:, :1]  # (persons, 2): this wrist and the nose are confident
+    nose, wrists = picked[:, 0, :2], picked[:, 1:, :2]
+    if scale is not None:
+        scale = np.asarray(scale, dtype=np.float32).reshape(-1, 1)
+        wrists_ok &= np.isfinite(scale)
+        raise_threshold, head_threshold = raise_threshold * scale, head_threshold * scale
+
+    with np.errstate(invalid='ignore'):
+        raised = (wrists[..., 1] < nose[:, None, 1] - raise_threshold) & wrists_ok
+        to_head = (np.square(wrists - nose[:, None]).sum(axis=-1) < np.square(head_threshold)) & wrists_ok
+    return GestureMasks(confident[:, 0], raised[:, 0], raised[:, 1], raised.any(axis=1), raised.all(axis=1),
+                        to_head[:, 0], to_head[:, 1], to_head.any(axis=1))
+
+
+def keypoint_scores(keypoints, scores=None):
+    """Splits (persons, K, 3) keypoints into (persons, K, 2) and (persons, K) scores (1 if none are given)."""
+    keypoints = np.asarray(keypoints, dtype=np.float32)
+    if keypoints.ndim == 2:
+        keypoints = keypoints[None]
+    if keypoints.shape[-1] > 2:
+        return keypoints[..., :2], keypoints[..., 2]
+    if scores is None:
+        return keypoints, np.ones(keypoints.shape[:2], dtype=np.float32)
+    return keypoints, np.asarray(scores, dtype=np.float32).reshape(keypoints.shape[:2])
+
+
+def body_scale(keypoints, scores, min_score=MIN_KEYPOINT_SCORE):
+    """
+    Per-person size in pixels used to normalize gesture thresholds: the shoulder width, or for people whose
+    shoulders aren't both confident, KEYPOINT_HEIGHT_TO_SHOULDER times the height of their confident keypoints.
+    """
+    confident = scores >= min_score
+    shoulders = np.linalg.norm(keypoints[:, LEFT_SHOULDER] - keypoints[:, RIGHT_SHOULDER], axis=-1)
+    shoulders_ok = confident[:, LEFT_SHOULDER] & confident[:, RIGHT_SHOULDER]
+
+    y = np.where(confident, keypoints[..., 1], np.nan)
+    with np.errstate(all='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # people without any confident keypoint
+        height = np.nanmax(y, axis=1) - np.nanmin(y, axis=1)
+    scale = np.where(shoulders_ok, shoulders, height * KEYPOINT_HEIGHT_TO_SHOULDER)
+    return np.where(np.isfinite(scale) & (scale > 1), scale, np.nan)
+
+
+# Gestures tracked by GestureStateMachine
+GESTURE_KINDS = ('hand_raised', 'one_hand_raised', 'both_hands_raised', 'hand_to_head')
+
+
+class GestureStateMachine:
+    """
+    Per-person temporal gesture detection with body-scale thresholds, a minimum hold time and release hysteresis.
+
+    Thresholds are in units of the person's body scale (shoulder width, see body_scale), so they work the same
+    for a musician close to the camera and one at the back. A gesture fires once, when its enter condition has
+    held for hold_ms; it can only fire again after it has been released, i.e. after the looser release condition
+    has failed for release_ms. A wrist raised high while bowing for a few frames therefore doesn't trigger, and
+    a hand hovering around the threshold doesn't trigger repeatedly.
+
+    The enter and release conditions come from evaluate_gestures at body-scale thresholds, for all people in one
+    pass; state lives in arrays indexed by the recycled slot of each person's id (see tracking.IdSlots), and
+    people with a negative id (not tracked) get no state and never fire.
+
+    Parameters:
+    raise_enter (float): Wrist at least this many body scales above the nose counts as raised.
+    raise_release (float): A raised wrist counts as lowered once it is less than this far above the nose.
+    head_enter (float): Wrist closer to the nose than this (in body scales) counts as hand to head.
+    head_release (float): Hand to head ends once the wrist is further than this.
+    hold_ms (float): How long a gesture must be held before it fires.
+    release_ms (float): How long the release condition must hold before the gesture can fire again.
+    lost_ms (float): People not seen for this long have their state reset.
+    """
+
+    def __init__(self, raise_enter=0.3, raise_release=0.0, head_enter=0.6, head_release=0.8,
+                 hold_ms=300, release_ms=200, lost_ms=1000, min_score=MIN_KEYPOINT_SCORE):
+        self.raise_enter, self.raise_release = raise_enter, raise_release
+        self.head_enter, self.head_release = head_enter, head_release
+        self.hold = hold_ms / 1000
+        self.release = release_ms / 1000
+        self.lost = lost_ms / 1000
+        self.min_score = min_score
+        self.slots = IdSlots(self.lost)
+        self._allocate(16)
+
+    def _allocate(self, size):
+        """(Re)sizes the state arrays, keeping existing state."""
+        def grow(array, fill):
+            grown = np.full((len(GESTURE_KINDS), size), fill, dtype=array.dtype if array is not None else type(fill))
+            if array is not None:
+                grown[:, :array.shape[1]] = array
+            return grown
+
+        self.active = grow(getattr(self, 'active', None), False)
+        self.held_since = grow(getattr(self, 'held_since', None), np.nan)
+        self.released_since = grow(getattr(self, 'released_since', None), np.nan)
+
+    def conditions(self, keypoints, scores=None):
+        """
+        Enter and stay conditions of every gesture for every person.
+
+        Returns:
+        Two (len(GESTURE_KINDS), persons) boolean arrays: the gesture starts / is still being held.
+        """
+        keypoints, scores = keypoint_scores(keypoints, scores)
+        scale = body_scale(keypoints, scores, self.min_score)
+        entering = evaluate_gestures(keypoints, scores, self.raise_enter, self.head_enter, self.min_score, scale)
+        holding = evaluate_gestures(keypoints, scores, self.raise_release, self.head_release, self.min_score, scale)
+
+        # A wrist right above the nose is a hand on the head, not a raised hand
+        near_head = np.stack([entering.left_to_head, entering.right_to_head], axis=1)
+        raised = np.stack([entering.left_raised, entering.right_raised], axis=1) & ~near_head
+        raised_held = np.stack([holding.left_raised, holding.right_raised], axis=1) & ~near_head
+
+        enter = np.stack([raised.any(axis=1), raised.sum(axis=1) == 1, raised.all(axis=1), entering.hand_to_head])
+        stay = np.stack([raised_held.any(axis=1), raised_held.sum(axis=1) == 1, raised_held.all(axis=1),
+                         holding.hand_to_head])
+        return enter, stay
+
+    def update(self, keypoints, timestamp, scores=None, ids=None):
+        """
+        Advances every person's state by one frame.
+
+        Parameters:
+        keypoints (np.ndarray): (persons, K, 3), or (persons, K, 2) plus scores.
+        timestamp (float): Capture time of the frame in seconds (time.monotonic).
+        ids (array-like): Stable id of each person, e.g. from a tracker (-1 for untracked); default their index.
+
+        Returns:
+        A list of (gesture, person id) for the gestures that fired on this frame.
+        """
+        keypoints, scores = keypoint_scores(keypoints, scores)
+        ids = np.arange(len(keypoints)) if ids is None else np.asarray(ids, dtype=int)
+        slots, elapsed = self.slots.assign(ids, timestamp)
+        tracked = slots >= 0
+        if not tracked.any():
+            return []
+        if len(self.slots) > self.active.shape[1]:
+            self._allocate(len(self.slots))
+        ids, slots = ids[tracked], slots[tracked]
+
+        # People seen for the first time, or again after being gone for lost_ms, start from scratch
+        fresh = slots[~np.isfinite(elapsed[tracked])]
+        self.active[:, fresh] = False
+        self.held_since[:, fresh] = np.nan
+        self.released_since[:, fresh] = np.nan
+
+        enter, stay = self.conditions(keypoints[tracked], scores[tracked])
+        active = self.active[:, slots]
+        held_since = self.held_since[:, slots]
+        released_since = self.released_since[:, slots]
+
+        # Inactive: the enter condition must hold for hold seconds
+        held_since = np.where(~active & enter, np.where(np.isnan(held_since), timestamp, held_since), np.nan)
+        fire = ~active & enter & (timestamp - held_since >= self.hold)
+
+        # Active: released once the stay condition has failed for release seconds
+        released_since = np.where(active & ~stay, np.where(np.isnan(released_since), timestamp, released_since), np.nan)
+        released = active & ~stay & (timestamp - released_since >= self.release)
+
+        active = (active | fire) & ~released
+        self.active[:, slots] = active
+        self.held_since[:, slots] = np.where(fire, np.nan, held_since)
+        self.released_since[:, slots] = np.where(released, np.nan, released_since)
+
+        gesture_index, person_index = np.nonzero(fire)
+        return [(GESTURE_KINDS[g], int(ids[p])) for g, p in zip(gesture_index, person_index)]
+
+    def is_active(self, gesture, person):
+        slot = self.slots.get(person)
+        return bool(slot is not None and self.active[GESTURE_KINDS.index(gesture), slot])
+
+    def is_holding(self, gesture, person):
+        """Whether the gesture is active for the person, or being held but not for hold_ms yet."""
+        slot = self.slots.get(person)
+        if slot is None:
+            return False
+        g = GESTURE_KINDS.index(gesture)
+        return bool(self.active[g, slot] or not np.isnan(self.held_since[g, slot]))
+
+    def reset(self):
+        self.slots.reset()
+        self.active[:] = False
+        self.held_since[:] = np.nan
+        self.released_since[:] = np.nan
+
+
+# A detected gesture: what it was, when the frame it was seen in was captured (time.monotonic) and who made it
+GestureEvent = namedtuple('GestureEvent', ['kind', 'timestamp', 'person'])
+
+
+class GestureQueue:
+    """
+    Timestamped buffer of gesture events, so gestures made while the camera is busy with a cue aren't lost.
+
+    Debouncing is by time: an event is ignored if the same kind of gesture was accepted less than debounce
+    seconds earlier, however fast or slow the inference loop runs. Events older than max_age are dropped
+    when read, so a stale gesture can't trigger a cue long after it was made.
+
+    Parameters:
+    debounce (float or dict): Seconds per gesture kind (a dict) or for every kind.
+    max_age (float): Seconds after which an unread event expires, None to keep events until read.
+    max_pending (int): Events kept per kind; when full, the newest replaces the oldest.
+    clock (callable): Time source for events pushed without a timestamp.
+    """
+
+    def __init__(self, debounce=2.0, max_age=None, max_pending=None, clock=time.monotonic):
+        self.debounce = debounce
+        self.max_age = max_age
+        self.max_pending = max_pending
+        self.clock = clock
+        self._events = deque()
+        self._last_accepted = {}  # kind -> timestamp of the last accepted event
+        self._lock = threading.Lock()
+        self.accepted = 0
+        self.debounced = 0
+        self.expired = 0
+
+    def _debounce_for(self, kind):
+        return self.debounce.get(kind, 0.0) if isinstance(self.debounce, dict) else self.debounce
+
+    def push(self, kind, timestamp=None, person=None):
+        """
+        Adds an event unless the same gesture was accepted within its debounce time.
+
+        Returns:
+        Whether the event was accepted.
+        """
+        timestamp = self.clock() if timestamp is None else timestamp
+        with self._lock:
+            last = self._last_accepted.get(kind)
+            if last is not None and timestamp - last < self._debounce_for(kind):
+                self.debounced += 1
+                return False
+            self._last_accepted[kind] = timestamp
+
+            if self.max_pending is not None:
+                pending = [event for event in self._events if event.kind == kind]
+                if len(pending) >= self.max_pending:
+                    self._events.remove(pending[0])
+            self._events.append(GestureEvent(kind, timestamp, person))
+            self.accepted += 1
+            return True
+
+    def _expire(self, now):
+        if self.max_age is None:
+            return
+        while self._events and now - self._events[0].timestamp > self.max_age:
+            self._events.popleft()
+            self.expired += 1
+
+    def pop(self, kinds=None, now=None):
+        """
+        Removes and returns the oldest pending event, or the oldest of the given kinds.
+
+        Returns:
+        A GestureEvent, or None if there is none.
+        """
+        if isinstance(kinds, str):
+            kinds = (kinds,)
+        with self._lock:
+            self._expire(self.clock() if now is None else now)
+            for event in self._events:
+                if kinds is None or event.kind in kinds:
+                    self._events.remove(event)
+                    return event
+            return None
+
+    def pending(self, now=None):
+        """The pending events, oldest first, without removing them."""
+        with self._lock:
+            self._expire(self.clock() if now is None else now)
+            return list(self._events)
+
+    def clear(self):
+        with self._lock:
+            self._events.clear()
+
+    def __len__(self):
+        return len(self._events)
+
+
+def benchmark_gestures(people_counts=(1, 4, 8, 12), keypoints_per_person=133, repeats=2000):
+    """
+    Compares evaluate_gestures with the old per-person loop for growing ensembles.
+
+    Returns:
+    A dict of persons -> (vectorized, per-person loop) microseconds per frame.
+    """
+    rng = np.random.default_rng(0)
+    results = {}
+    for persons in people_counts:
+        keypoints = np.column_stack([rng.uniform(0, 1920, (persons * keypoints_per_person, 2)),
+                                     rng.uniform(0, 1, persons * keypoints_per_person)])
+        keypoints = keypoints.reshape(persons, keypoints_per_person, 3).astype(np.float32)
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            evaluate_gestures(keypoints)
+        vectorized = (time.perf_counter() - start) / repeats * 1e6
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for person in keypoints:
+                nose, left_wrist, right_wrist = person[NOSE], person[LEFT_WRIST], person[RIGHT_WRIST]
+                (left_wrist[1] < nose[1] - 50 or right_wrist[1] < nose[1] - 50,
+                 np.linalg.norm(np.array(left_wrist[:2]) - np.array(nose[:2])) < 100
+                 or np.linalg.norm(np.array(right_wrist[:2]) - np.array(nose[:2])) < 100)
+        loop = (time.perf_counter() - start) / repeats * 1e6
+
+        results[persons] = (vectorized, loop)
+        print(f"{persons:>3} people: {vectorized:6.1f} us vectorized, {loop:6.1f} us per-person loop")
+    return results
+
+
+if __name__ == "__main__":
+    benchmark_gestures()
@@ -0,0 +1,242 @@
+### TEMPORAL KEYPOINT FILTERS ###
+# Benchmark: python keypoint_filters.py
+
+import math
+import time
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+from tracking import IdSlots
+
+
+class KeypointFilter(ABC):
+    """
+    Base of the temporal keypoint filters: per-person, per-keypoint state held in arrays indexed by the
+    recycled slot of each person's id (see tracking.IdSlots), updated for all people and keypoints at once.
+    People with a negative id (not tracked) are passed through unfiltered.
+
+    Parameters:
+    lost_s (float): People not seen for this long start from scratch when they reappear.
+    """
+
+    def __init__(self, lost_s=1.0):
+        self.lost_s = lost_s
+        self.slots = IdSlots(lost_s)
+        self.num_keypoints = None
+        self._size = 0  # slots the state arrays hold
+
+    @abstractmethod
+    def _allocate(self, size, num_keypoints):
+        """Creates or grows the state arrays to hold size people."""
+
+    @abstractmethod
+    def _filter(self, keypoints, scores, slots, dt, fresh):
+        """
+        Filters the tracked people of one frame: (persons, K, 2) keypoints, (persons, K) scores or None, their
+        state slots, seconds since each was last seen and whether they start from scratch. Returns the keypoints.
+        """
+
+    def filter(self, keypoints, timestamp, scores=None, ids=None):
+        """
+        Smooths one frame of keypoints.
+
+        Parameters:
+        keypoints (np.ndarray): (persons, K, 2) keypoints in pixels.
+        timestamp (float): Capture time of the frame in seconds.
+        scores (np.ndarray): (persons, K) keypoint scores, used by filters that weigh measurements.
+        ids (array-like): Stable id of each person (e.g. from a tracker, -1 for untracked); default their index.
+
+        Returns:
+        The (persons, K, 2) filtered keypoints.
+        """
+        keypoints = np.array(keypoints, dtype=np.float64)
+        ids = np.arange(len(keypoints)) if ids is None else np.asarray(ids, dtype=int)
+        if self.num_keypoints is not None and keypoints.shape[1] != self.num_keypoints:
+            self.reset()  # different pose model, start over
+        slots, elapsed = self.slots.assign(ids, timestamp)
+        tracked = slots >= 0
+        if not tracked.any():
+            return keypoints
+        if self.num_keypoints is None or len(self.slots) > self._size:
+            self._allocate(len(self.slots), keypoints.shape[1])
+            self._size, self.num_keypoints = len(self.slots), keypoints.shape[1]
+
+        elapsed = elapsed[tracked]
+        fresh = ~np.isfinite(elapsed)  # first sighting, or back after being lost
+        scores = None if scores is None else np.asarray(scores, dtype=np.float64)[tracked]
+        keypoints[tracked] = self._filter(keypoints[tracked], scores, slots[tracked], elapsed, fresh)
+        return keypoints
+
+    def reset(self):
+        self.slots = IdSlots(self.lost_s)
+        self.num_keypoints = None
+        self._size = 0
+
+
+def _grow(array, shape, fill=0.0):
+    grown = np.full(shape, fill)
+    if array is not None and array.shape[1:] == shape[1:]:
+        grown[:len(array)] = array
+    return grown
+
+
+class OneEuroFilter(KeypointFilter):
+    """
+    One-Euro filter (Casiez et al., CHI 2012): a low-pass filter whose cutoff rises with speed, so a still
+    wrist is smoothed heavily while a fast gesture is followed with little lag.
+
+    Parameters:
+    min_cutoff (float): Cutoff frequency in Hz at rest; lower is smoother.
+    beta (float): How fast the cutoff rises with speed (per pixel/s); higher is less laggy.
+    d_cutoff (float): Cutoff frequency in Hz of the speed estimate.
+    """
+
+    def __init__(self, min_cutoff=1.0, beta=0.01, d_cutoff=1.0, lost_s=1.0):
+        super().__init__(lost_s)
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.x = None
+        self.dx = None
+
+    def _allocate(self, size, num_keypoints):
+        self.x = _grow(self.x, (size, num_keypoints, 2))
+        self.dx = _grow(self.dx, (size, num_keypoints, 2))
+
+    @staticmethod
+    def _alpha(cutoff, dt):
+        tau = 1.0 / (2 * math.pi * cutoff)
+        return 1.0 / (1.0 + tau / dt)
+
+    def _filter(self, keypoints, scores, slots, dt, fresh):
+        dt = np.where(fresh, 1.0, np.maximum(dt, 1e-3))[:, None, None]
+        x_prev, dx_prev = self.x[slots], self.dx[slots]
+
+        dx = (keypoints - x_prev) / dt
+        dx_hat = dx_prev + self._alpha(self.d_cutoff, dt) * (dx - dx_prev)
+        cutoff = self.min_cutoff + self.beta * np.linalg.norm(dx_hat, axis=-1, keepdims=True)
+        x_hat = x_prev + self._alpha(cutoff, dt) * (keypoints - x_prev)
+
+        x_hat = np.where(fresh[:, None, None], keypoints, x_hat)
+        dx_hat = np.where(fresh[:, None, None], 0.0, dx_hat)
+        self.x[slots], self.dx[slots] = x_hat, dx_hat
+        return x_hat
+
+
+class KalmanKeypointFilter(KeypointFilter):
+    """
+    Constant-velocity Kalman filter on every keypoint coordinate. Low-confidence keypoints count as noisier
+    measurements, so an occluded wrist coasts on its velocity instead of jumping.
+
+    Parameters:
+    process_noise (float): Acceleration noise spectral density in pixels^2/s^3; higher follows faster motion.
+    measurement_noise (float): Variance in pixels^2 of a keypoint with score 1.
+    min_score (float): Scores are clipped to at least this when scaling the measurement noise.
+    """
+
+    def __init__(self, process_noise=5e3, measurement_noise=25.0, min_score=0.05, lost_s=1.0):
+        super().__init__(lost_s)
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.min_score = min_score
+        self.pos = self.vel = None
+        self.p00 = self.p01 = self.p11 = None  # covariance of (position, velocity) per coordinate
+
+    def _allocate(self, size, num_keypoints):
+        shape = (size, num_keypoints, 2)
+        self.pos, self.vel = _grow(self.pos, shape), _grow(self.vel, shape)
+        self.p00, self.p01, self.p11 = _grow(self.p00, shape), _grow(self.p01, shape), _grow(self.p11, shape)
+
+    def _filter(self, keypoints, scores, slots, dt, fresh):
+        dt = np.where(fresh, 0.0, dt)[:, None, None]
+        if scores is None:
+            r = self.measurement_noise
+        else:
+            r = self.measurement_noise / np.clip(scores, self.min_score, 1.0)[..., None]
+
+        # Predict
+        pos, vel = self.pos[slots] + self.vel[slots] * dt, self.vel[slots]
+        q = self.process_noise
+        p00 = self.p00[slots] + dt * (2 * self.p01[slots] + dt * self.p11[slots]) + q * dt ** 3 / 3
+        p01 = self.p01[slots] + dt * self.p11[slots] + q * dt ** 2 / 2
+        p11 = self.p11[slots] + q * dt
+
+        # Update with the measured position
+        innovation = keypoints - pos
+        s = p00 + r
+        k0, k1 = p00 / s, p01 / s
+        pos, vel = pos + k0 * innovation, vel + k1 * innovation
+        p00, p01, p11 = (1 - k0) * p00, (1 - k0) * p01, p11 - k1 * p01
+
+        # People seen for the first time start at their measurement with an uncertain velocity
+        new = fresh[:, None, None]
+        pos = np.where(new, keypoints, pos)
+        vel = np.where(new, 0.0, vel)
+        p00 = np.where(new, r, p00)
+        p01 = np.where(new, 0.0, p01)
+        p11 = np.where(new, 1e4, p11)
+
+        self.pos[slots], self.vel[slots] = pos, vel
+        self.p00[slots], self.p01[slots], self.p11[slots] = p00, p01, p11
+        return pos
+
+
+KEYPOINT_FILTERS = {'one-euro': OneEuroFilter, 'kalman': KalmanKeypointFilter}
+
+
+def make_keypoint_filter(kind, **params):
+    """A filter by name ('one-euro' or 'kalman'), or None for kind None / 'none'."""
+    if kind in (None, 'none'):
+        return None
+    if kind not in KEYPOINT_FILTERS:
+        raise ValueError(f"Unknown keypoint filter '{kind}', expected one of {list(KEYPOINT_FILTERS)} or 'none'")
+    return KEYPOINT_FILTERS[kind](**params)
+
+
+def apply_filter(keypoint_filter, keypoints, timestamp, scores=None, ids=None):
+    """
+    Runs an optional filter (None passes keypoints through) on (persons, K, 3) keypoints with scores,
+    or on (persons, K, 2) keypoints plus scores. Returns filtered keypoints of the same shape.
+    """
+    if keypoint_filter is None or not len(keypoints):
+        return keypoints
+    keypoints = np.array(keypoints, dtype=np.float32)
+    if keypoints.shape[-1] > 2:
+        keypoints[..., :2] = keypoint_filter.filter(keypoints[..., :2], timestamp, keypoints[..., 2], ids)
+    else:
+        keypoints[...] = keypoint_filter.filter(keypoints, timestamp, scores, ids)
+    return keypoints
+
+
+def benchmark_filters(people_counts=(1, 4, 8, 12), keypoints_per_person=133, frames=1000, fps=5.0):
+    """
+    Measures the per-frame overhead of each filter on noisy synthetic keypoints, and how much it reduces
+    the frame-to-frame jitter of still keypoints.
+
+    Returns:
+    A dict of (filter, persons) -> (microseconds per frame, jitter reduction factor).
+    """
+    rng = np.random.default_rng(0)
+    results = {}
+    for persons in people_counts:
+        truth = rng.uniform(0, 1080, (persons, keypoints_per_person, 2))
+        noisy = truth + rng.normal(0, 5, (frames, persons, keypoints_per_person, 2))
+        scores = rng.uniform(0.3, 1.0, (frames, persons, keypoints_per_person))
+        raw_jitter = np.abs(np.diff(noisy, axis=0)).mean()
+
+        for kind in KEYPOINT_FILTERS:
+            keypoint_filter = make_keypoint_filter(kind)
+            filtered = np.empty_like(noisy)
+            start = time.perf_counter()
+            for i in range(frames):
+                filtered[i] = keypoint_filter.filter(noisy[i], i / fps, scores[i])
+            elapsed = (time.perf_counter() - start) / frames * 1e6
+            jitter = np.abs(np.diff(filtered[frames // 10:], axis=0)).mean()
+            results[(kind, persons)] = (elapsed, raw_jitter / jitter)
+            print(f"{kind:>8}, {persons:>2} people: {elapsed:6.1f} us per frame, jitter reduced {raw_jitter / jitter:.1f}x")
+    return results
+
+
+if __name__ == "__main__":
+    benchmark_filters()
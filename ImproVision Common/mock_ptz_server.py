@@ -0,0 +1,302 @@
+### MOCK PTZ CAMERA: A LOCAL STAND-IN FOR THE PTZOPTICS CGI INTERFACE ###
+# Serve:     python mock_ptz_server.py --port 8080 --latency 0.02
+#            then point the scripts at CAMERA_IP = "127.0.0.1:8080"
+# Benchmark: python mock_ptz_server.py --benchmark (cue timing accuracy of the compiled sweep, measured at the camera)
+
+import argparse
+import json
+import threading
+import time
+from collections import namedtuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from cue_scheduler import CueScheduler, Timeline
+
+# Kinematics; speeds are the CGI speed arguments (pan 1-24, tilt 1-20, zoom/focus 1-7 and up)
+PAN_DEGREES_PER_SPEED = 4.0    # deg/s of pan per unit of pan speed
+TILT_DEGREES_PER_SPEED = 3.0   # deg/s of tilt per unit of tilt speed
+ZOOM_PER_SPEED = 0.02          # zoom range per second per unit of zoom speed (zoom runs from 0 to 1)
+FOCUS_PER_SPEED = 0.02
+ACCELERATION = 200.0           # deg/s^2 for pan and tilt, both speeding up and braking
+HOME_SPEED = 24                # pan speed of home / preset moves
+PAN_LIMITS = (-170.0, 170.0)
+TILT_LIMITS = (-30.0, 90.0)
+STEP = 0.002                   # seconds per simulation step
+
+# A few stops, so the scheduler's latency estimate has settled before a measured run
+WARMUP_CUE = Timeline.from_steps([("ptzstop", 0.05)] * 5)
+
+# One command as it arrived: when (time.monotonic of the server), the command and its arguments,
+# and the pan / tilt at that moment
+CommandRecord = namedtuple('CommandRecord', ['time', 'command', 'args', 'pan', 'tilt'])
+
+
+class SimulatedPTZ:
+    """
+    Pan / tilt / zoom / focus state of a simulated camera, advanced on a background thread.
+
+    Pan and tilt follow a target velocity (or, after home / poscall, a target position) with limited
+    acceleration, so a short 'left' pulse moves less than its duration times the top speed, as on the
+    real camera.
+    """
+
+    def __init__(self, acceleration=ACCELERATION):
+        self.acceleration = acceleration
+        self.position = np.zeros(2)  # pan, tilt in degrees
+        self.velocity = np.zeros(2)
+        self.target_velocity = np.zeros(2)
+        self.target_position = None  # set while moving to home or a preset
+        self.zoom = 0.0
+        self.focus = 0.5
+        self.zoom_velocity = 0.0
+        self.focus_velocity = 0.0
+        self.presets = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='mock-ptz', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        last = time.monotonic()
+        while not self._stop.wait(STEP):
+            now = time.monotonic()
+            with self._lock:
+                self._advance(now - last)
+            last = now
+
+    def _advance(self, dt):
+        target_velocity = self.target_velocity
+        if self.target_position is not None:
+            # Brake in time to stop on the target: v = sqrt(2 a d) towards it, capped at the home speed
+            distance = self.target_position - self.position
+            top = np.array([PAN_DEGREES_PER_SPEED, TILT_DEGREES_PER_SPEED]) * HOME_SPEED
+            target_velocity = np.sign(distance) * np.minimum(np.sqrt(2 * self.acceleration * np.abs(distance)), top)
+            if np.all(np.abs(distance) < 0.05) and np.all(np.abs(self.velocity) < 1.0):
+                self.position = self.target_position.copy()
+                self.velocity[:] = 0
+                self.target_position = None
+                return
+        change = np.clip(target_velocity - self.velocity, -self.acceleration * dt, self.acceleration * dt)
+        self.velocity += change
+        self.position += self.velocity * dt
+        for axis, (low, high) in enumerate((PAN_LIMITS, TILT_LIMITS)):
+            if not low <= self.position[axis] <= high:
+                self.position[axis] = np.clip(self.position[axis], low, high)
+                self.velocity[axis] = 0
+        self.zoom = float(np.clip(self.zoom + self.zoom_velocity * dt, 0, 1))
+        self.focus = float(np.clip(self.focus + self.focus_velocity * dt, 0, 1))
+
+    def apply(self, command, args):
+        """Applies one CGI command, e.g. ('left', [24, 20]). Returns False for an unknown command."""
+        speed = lambda i, default: float(args[i]) if len(args) > i else default
+        with self._lock:
+            if command in ("left", "right", "up", "down"):
+                self.target_position = None
+                pan, tilt = speed(0, 24) * PAN_DEGREES_PER_SPEED, speed(1, 20) * TILT_DEGREES_PER_SPEED
+                self.target_velocity = {"left": np.array([-pan, 0.0]), "right": np.array([pan, 0.0]),
+                                        "up": np.array([0.0, tilt]), "down": np.array([0.0, -tilt])}[command]
+            elif command == "ptzstop":
+                self.target_position = None
+                self.target_velocity = np.zeros(2)
+            elif command == "home":
+                self.target_position = np.zeros(2)
+            elif command == "posset" and args:
+                self.presets[int(args[0])] = self.position.copy()
+            elif command == "poscall" and args:
+                if int(args[0]) in self.presets:
+                    self.target_position = self.presets[int(args[0])].copy()
+            elif command in ("zoomin", "zoomout"):
+                self.zoom_velocity = (1 if command == "zoomin" else -1) * speed(0, 10) * ZOOM_PER_SPEED
+            elif command == "zoomstop":
+                self.zoom_velocity = 0.0
+            elif command in ("focusin", "focusout"):
+                self.focus_velocity = (1 if command == "focusin" else -1) * speed(0, 10) * FOCUS_PER_SPEED
+            elif command == "focusstop":
+                self.focus_velocity = 0.0
+            else:
+                return False
+            return True
+
+    def state(self):
+        with self._lock:
+            return {'pan': float(self.position[0]), 'tilt': float(self.position[1]),
+                    'pan_velocity': float(self.velocity[0]), 'tilt_velocity': float(self.velocity[1]),
+                    'zoom': self.zoom, 'focus': self.focus, 'presets': sorted(self.presets)}
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=1.0)
+
+
+class MockPTZServer(ThreadingHTTPServer):
+    """
+    HTTP server answering /cgi-bin/ptzctrl.cgi?ptzcmd&<command>&<args> like the PTZOptics camera, driving a
+    SimulatedPTZ. Each request is held for the configured latency: half before the command takes effect
+    (the request travelling to the camera) and half before the reply is sent.
+
+    GET /state returns the simulated position as JSON, GET /log the command log.
+
+    Parameters:
+    address (tuple): (host, port); port 0 picks a free one (see url).
+    latency (float): Round-trip network latency in seconds.
+    jitter (float): Standard deviation in seconds of a random extra delay on each leg.
+    log_path (str): File every command is appended to as a JSON line, None for none.
+    verbose (bool): Print every command.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 8080), latency=0.0, jitter=0.0, log_path=None, verbose=True):
+        super().__init__(address, MockPTZHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.log_path = log_path
+        self.verbose = verbose
+        self.camera = SimulatedPTZ()
+        self.log = []  # CommandRecord of every command, in arrival order
+        self._log_lock = threading.Lock()
+        self._rng = np.random.default_rng()
+        self.started = time.monotonic()
+
+    @property
+    def url(self):
+        """host:port to use as the camera IP, e.g. PTZTransport(server.url)."""
+        return f"{self.server_address[0]}:{self.server_address[1]}"
+
+    def delay(self):
+        """One leg of the simulated network latency."""
+        return max(self.latency / 2 + (self._rng.normal(0, self.jitter) if self.jitter else 0.0), 0.0)
+
+    def record(self, command, args):
+        state = self.camera.state()
+        record = CommandRecord(time.monotonic(), command, args, state['pan'], state['tilt'])
+        with self._log_lock:
+            self.log.append(record)
+            if self.log_path is not None:
+                with open(self.log_path, 'a') as f:
+                    f.write(json.dumps(record._asdict()) + "\n")
+        if self.verbose:
+            print(f"[{record.time - self.started:9.3f}] {command} {'&'.join(args)} "
+                  f"(pan {record.pan:+.1f}, tilt {record.tilt:+.1f})")
+
+    def clear_log(self):
+        with self._log_lock:
+            self.log = []
+
+    def start(self):
+        """Serves on a background thread. Returns the server."""
+        threading.Thread(target=self.serve_forever, name='mock-ptz-http', daemon=True).start()
+        return self
+
+    def server_close(self):
+        super().server_close()
+        self.camera.close()
+
+
+class MockPTZHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the camera, so PTZTransport's pooled session is exercised
+    disable_nagle_algorithm = True  # otherwise headers and body wait on delayed ACKs, adding ~40 ms
+
+    def _reply(self, status, body, content_type='text/plain'):
+        body = body.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        parts = urlsplit(self.path)
+        if parts.path == '/state':
+            return self._reply(200, json.dumps(server.camera.state()), 'application/json')
+        if parts.path == '/log':
+            with server._log_lock:
+                log = [record._asdict() for record in server.log]
+            return self._reply(200, json.dumps(log), 'application/json')
+        if parts.path != '/cgi-bin/ptzctrl.cgi':
+            return self._reply(404, "not found")
+
+        fields = parts.query.split('&')
+        if len(fields) < 2 or fields[0] != 'ptzcmd':
+            return self._reply(400, "expected ptzcmd&<command>")
+        command, args = fields[1].lower(), fields[2:]
+
+        time.sleep(server.delay())
+        if not server.camera.apply(command, args):
+            return self._reply(400, f"unknown command {command}")
+        server.record(command, args)
+        time.sleep(server.delay())
+        self._reply(200, "OK")
+
+    def log_message(self, format, *args):
+        pass  # commands are logged by MockPTZServer.record
+
+
+def arrival_jitter(log, start, timeline):
+    """
+    Compares when each timeline command reached the mock camera with its deadline.
+
+    Parameters:
+    log (list): CommandRecord of the run, e.g. server.log.
+    start (float): time.monotonic() when the timeline was started.
+    timeline (Timeline): The timeline that was run.
+
+    Returns:
+    A list of arrival minus deadline, in seconds, one per event.
+    """
+    return [record.time - (start + offset) for record, (offset, _) in zip(log, timeline.events)]
+
+
+def benchmark_cues(latency=0.02, jitter=0.005):
+    """
+    Runs a compiled sweep through PTZTransport and CueScheduler against a mock camera with the given network
+    latency, and prints how far from their deadlines the commands reached the camera.
+    """
+    from movement_compiler import compile_sweep
+    from ptz_transport import PTZTransport
+
+    server = MockPTZServer(('127.0.0.1', 0), latency, jitter, verbose=False).start()
+    transport = PTZTransport(server.url)
+    scheduler = CueScheduler(transport.send)
+    timeline = compile_sweep(("up half", None, "down whole", "stay"))
+    try:
+        scheduler.run(WARMUP_CUE, verbose=False)
+        server.clear_log()
+        start = time.monotonic()
+        scheduler.run(timeline, verbose=False)
+        errors_ms = np.abs(arrival_jitter(server.log, start, timeline)) * 1000
+        print(f"{len(errors_ms)} commands at {latency * 1000:.0f} ms latency: arrival error mean {errors_ms.mean():.1f} ms, "
+              f"max {errors_ms.max():.1f} ms; camera ended at {server.camera.state()}")
+    finally:
+        transport.close()
+        server.shutdown()
+        server.server_close()
+    return errors_ms
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a simulated PTZOptics camera for offline testing.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0, help="round-trip network latency in seconds")
+    parser.add_argument('--jitter', type=float, default=0.0, help="standard deviation of each leg's extra delay")
+    parser.add_argument('--log', default=None, help="append every command to this file as JSON lines")
+    parser.add_argument('--benchmark', action='store_true', help="measure cue timing accuracy and exit")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        for latency in (0.0, 0.02, 0.1):
+            benchmark_cues(latency, args.jitter)
+    else:
+        server = MockPTZServer((args.host, args.port), args.latency, args.jitter, args.log)
+        print(f"Mock PTZ camera on http://{server.url}/cgi-bin/ptzctrl.cgi")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,209 @@
+### LOCAL CONTENT-ADDRESSED STORE FOR POSE MODEL CHECKPOINTS ###
+# Populate (offline, from a downloaded file): python model_store.py add rtmpose-m_simcc-...-cd5e845c_20230123.pth
+# Populate (on a machine with network):       python model_store.py fetch [--modes body wholebody]
+# Check:                                      python model_store.py verify
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import urllib.request
+
+# Override with IMPROVISION_MODEL_STORE, e.g. to share one store between users of the stage PC
+MODEL_STORE_DIR = os.environ.get('IMPROVISION_MODEL_STORE',
+                                  os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_store'))
+INDEX_FILE = 'index.json'  # checkpoint file name -> sha256 of its contents
+
+# OpenMMLab checkpoint names end in -<first 8 hex digits of the sha256>_<date>.pth
+OPENMMLAB_HASH = re.compile(r'-([0-9a-f]{8})(?:_\d{8})?\.pth$')
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """Hex SHA-256 of a file, read in chunks so large checkpoints don't have to fit in memory twice."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def checkpoint_name(checkpoint):
+    """File name of a checkpoint given as a URL or a path."""
+    return os.path.basename(checkpoint.split('?')[0])
+
+
+def blob_path(sha256, store_dir=None):
+    """Where a checkpoint with the given content hash lives in the store."""
+    return os.path.join(store_dir or MODEL_STORE_DIR, 'sha256', sha256[:2], sha256)
+
+
+def load_index(store_dir=None):
+    path = os.path.join(store_dir or MODEL_STORE_DIR, INDEX_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_index(index, store_dir=None):
+    store_dir = store_dir or MODEL_STORE_DIR
+    os.makedirs(store_dir, exist_ok=True)
+    tmp_path = os.path.join(store_dir, INDEX_FILE + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, os.path.join(store_dir, INDEX_FILE))
+
+
+def check_published_hash(name, sha256):
+    """
+    Compares a hash against the short hash OpenMMLab puts in its checkpoint names.
+
+    Raises:
+    ValueError: If the name carries a short hash and the contents don't match it.
+    """
+    match = OPENMMLAB_HASH.search(name)
+    if match and not sha256.startswith(match.group(1)):
+        raise ValueError(f"{name} has sha256 {sha256[:8]}..., but its name says {match.group(1)}. "
+                         "The file is corrupt or not the published checkpoint.")
+
+
+def add_checkpoint(path, name=None, store_dir=None):
+    """
+    Copies a checkpoint file into the store under its content hash and records it in the index.
+
+    Parameters:
+    path (str): The downloaded checkpoint.
+    name (str): Name to index it under, default the file name (which is what the POSE_MODES URLs end in).
+
+    Returns:
+    The sha256 of the checkpoint.
+    """
+    name = name or checkpoint_name(path)
+    sha256 = file_sha256(path)
+    check_published_hash(name, sha256)
+
+    target = blob_path(sha256, store_dir)
+    if not os.path.exists(target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(path, target + '.tmp')
+        os.replace(target + '.tmp', target)
+
+    index = load_index(store_dir)
+    index[name] = sha256
+    save_index(index, store_dir)
+    print(f"Stored {name} as {sha256}")
+    return sha256
+
+
+def fetch_checkpoint(url, store_dir=None):
+    """Downloads a checkpoint URL into the store. Run once on a machine with network access."""
+    store_dir = store_dir or MODEL_STORE_DIR
+    os.makedirs(store_dir, exist_ok=True)
+    download_path = os.path.join(store_dir, checkpoint_name(url) + '.download')
+    print(f"Downloading {url}")
+    urllib.request.urlretrieve(url, download_path)
+    try:
+        return add_checkpoint(download_path, checkpoint_name(url), store_dir)
+    finally:
+        os.remove(download_path)
+
+
+def resolve_checkpoint(checkpoint, store_dir=None, verify=True):
+    """
+    Finds a checkpoint in the local store.
+
+    Parameters:
+    checkpoint (str): URL or file name of the checkpoint, e.g. a POSE_MODES entry.
+    verify (bool): Re-hash the stored file before handing it out.
+
+    Returns:
+    The local path of the checkpoint, or None if the store doesn't have it.
+
+    Raises:
+    ValueError: If the stored file doesn't match its recorded hash.
+    """
+    name = checkpoint_name(checkpoint)
+    sha256 = load_index(store_dir).get(name)
+    if sha256 is None:
+        return None
+
+    path = blob_path(sha256, store_dir)
+    if not os.path.exists(path):
+        return None
+    if verify:
+        actual = file_sha256(path)
+        if actual != sha256:
+            raise ValueError(f"Checkpoint {name} in {path} is corrupt: sha256 {actual}, expected {sha256}. "
+                             f"Re-add it with 'python model_store.py add'.")
+    return path
+
+
+def resolve_config(model_cfg, mmpose_root=None):
+    """
+    Finds an mmpose config file given relative to the mmpose repository, e.g. 'configs/body_2d_keypoint/...'.
+
+    Looks in $MMPOSE_ROOT, then in mmpose_root and then in the configs shipped with the installed mmpose package,
+    so the conductor doesn't depend on one particular checkout in a home directory.
+
+    Raises:
+    FileNotFoundError: If none of the locations has the config.
+    """
+    candidates = []
+    for root in (os.environ.get('MMPOSE_ROOT'), mmpose_root):
+        if root:
+            candidates.append(os.path.join(root, model_cfg))
+    try:
+        import mmpose
+        candidates.append(os.path.join(os.path.dirname(mmpose.__file__), '.mim', model_cfg))
+    except ImportError:
+        pass
+
+    for path in candidates:
+        if os.path.exists(path):
+            return path
+    raise FileNotFoundError(f"Couldn't find mmpose config {model_cfg}, looked in: {', '.join(candidates)}")
+
+
+def verify_store(store_dir=None):
+    """
+    Re-hashes every indexed checkpoint.
+
+    Returns:
+    A dict of name -> 'ok', 'missing' or 'corrupt'.
+    """
+    status = {}
+    for name, sha256 in sorted(load_index(store_dir).items()):
+        path = blob_path(sha256, store_dir)
+        if not os.path.exists(path):
+            status[name] = 'missing'
+        else:
+            status[name] = 'ok' if file_sha256(path) == sha256 else 'corrupt'
+        print(f"{status[name]:>8}  {name}")
+    return status
+
+
+if __name__ == "__main__":
+    from pose_models import PERSON_DETECTOR, POSE_MODES
+
+    parser = argparse.ArgumentParser(description="Manage the local pose checkpoint store.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    add_parser = subparsers.add_parser('add', help="Add downloaded checkpoint files")
+    add_parser.add_argument('paths', nargs='+')
+    fetch_parser = subparsers.add_parser('fetch', help="Download the checkpoints of the pose modes and the person detector")
+    fetch_parser.add_argument('--modes', nargs='+', default=list(POSE_MODES), choices=list(POSE_MODES))
+    fetch_parser.add_argument('--no-detector', action='store_true', help="Skip the person detector checkpoint")
+    subparsers.add_parser('verify', help="Re-hash every stored checkpoint")
+    args = parser.parse_args()
+
+    if args.command == 'add':
+        for path in args.paths:
+            add_checkpoint(path)
+    elif args.command == 'fetch':
+        for mode in args.modes:
+            fetch_checkpoint(POSE_MODES[mode][1])
+        if not args.no_detector:
+            fetch_checkpoint(PERSON_DETECTOR[1])
+    else:
+        verify_store()
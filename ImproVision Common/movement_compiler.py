@@ -0,0 +1,110 @@
+from collections import namedtuple
+from functools import lru_cache
+
+from cue_scheduler import Timeline
+
+
+# How one movement instruction is performed by the camera:
+#   command    - tilt direction for the step ("up"/"down"), None for a movement that only holds
+#   legs       - duration of each half-step leg (one leg for a half step, two for a whole step)
+#   pause      - hold between consecutive legs
+#   settle     - hold after the last leg before returning (or the whole hold if there are no legs)
+#   return_leg - (command, duration) that brings the camera back to horizontal, or None
+MovementSpec = namedtuple('MovementSpec', ['command', 'legs', 'pause', 'settle', 'return_leg'])
+
+# Shared movement vocabulary for Guided Harmony and Equilibrium.
+# Movements that aren't listed here (e.g. "irregular") compile to an empty timeline.
+MOVEMENT_VOCABULARY = {
+    "up half": MovementSpec("up", (0.7,), 0.0, 0.7, ("down", 0.6)),
+    "up whole": MovementSpec("up", (0.6, 0.6), 0.5, 0.7, ("down", 0.75)),
+    "down half": MovementSpec("down", (0.7,), 0.0, 0.7, ("up", 0.7)),
+    "down whole": MovementSpec("down", (0.5, 0.5), 0.5, 0.7, ("up", 0.7)),
+    "stay": MovementSpec(None, (), 0.0, 1.0, None),
+}
+
+# Timing of the left-to-right sweep across the ensemble
+HOME_HOLD = 1.0       # hold at home before panning
+FIRST_PAN = 0.7       # pan from home to the musician on the far left
+NEXT_PAN = 0.5        # pan from one musician to the next on the right
+LEAD_IN = 0.5         # hold on a musician before their movement
+LEAD_OUT = 0.5        # hold on a musician after their movement
+LOOK_HOLD = 1.0       # hold on a musician that has no instruction at all
+MIN_PAN = 0.05        # calibrated pans shorter than this are skipped
+PRESET_TRAVEL = 0.6   # time allowed for the camera to reach a recalled preset
+
+# Final 'slam' cue
+SLAM_CUE = Timeline.from_steps([("home", 2), ("ptzstop", 0.5), ("up", 0.7), ("down", 1.5), ("ptzstop", 2), ("home", 1)])
+
+
+@lru_cache(maxsize=None)
+def compile_movement(movement):
+    """
+    Compiles one movement instruction (e.g. "up half") into a camera timeline.
+
+    Parameters:
+    movement (str): A key of MOVEMENT_VOCABULARY. Unknown movements compile to an empty timeline.
+
+    Returns:
+    A cached Timeline; callers must not rely on getting a fresh object.
+    """
+    spec = MOVEMENT_VOCABULARY.get(movement)
+    if spec is None:
+        return Timeline()
+
+    steps = []
+    for i, leg in enumerate(spec.legs):
+        steps.append((spec.command, leg))
+        is_last_leg = i == len(spec.legs) - 1
+        steps.append(("ptzstop", spec.settle if is_last_leg else spec.pause))
+    if not spec.legs:
+        steps.append((None, spec.settle))
+    if spec.return_leg is not None:
+        return_command, return_duration = spec.return_leg
+        steps += [(return_command, return_duration), ("ptzstop", 0)]
+    return Timeline.from_steps(steps)
+
+
+def _pan(seconds):
+    """Steps of a timed pan by signed seconds (+ right), nothing for a negligible one."""
+    if abs(seconds) < MIN_PAN:
+        return []
+    return [("right" if seconds > 0 else "left", abs(seconds)), ("ptzstop", 0)]
+
+
+@lru_cache(maxsize=4096)
+def compile_sweep(movements, pan_offsets=None, preset_slots=None):
+    """
+    Compiles a full left-to-right cue for one measure or chord change into a single timeline:
+    home, pan to the far left, each musician's movement with a pan right in between, then the slam cue.
+
+    Parameters:
+    movements (tuple): One movement per musician, left to right. None means the musician has no instruction
+    and the camera just 'looks' at them.
+    pan_offsets (tuple): Calibrated pan offset of each musician in seconds from home, + right (see pan_map).
+    With offsets every pan goes straight to the next musician's position; without, the fixed FIRST_PAN and
+    NEXT_PAN are used.
+    preset_slots (tuple): Camera preset of each musician (see ptz_presets). Takes precedence over pan offsets:
+    each musician is reached with one poscall from wherever the camera is, so there is no homing first.
+
+    Returns:
+    A cached Timeline covering the whole cue.
+    """
+    if preset_slots is not None:
+        timeline = Timeline()
+        moves = [Timeline.from_steps([(("poscall", slot), PRESET_TRAVEL)]) for slot in preset_slots]
+    else:
+        if pan_offsets is None:
+            pans = [-FIRST_PAN] + [NEXT_PAN] * (len(movements) - 1)
+        else:
+            pans = [pan_offsets[0]] + [b - a for a, b in zip(pan_offsets, pan_offsets[1:])]
+        timeline = Timeline.from_steps([("home", HOME_HOLD)])
+        moves = [Timeline.from_steps(_pan(pan)) for pan in pans]
+
+    for move, movement in zip(moves, movements):
+        timeline += move + Timeline.from_steps([(None, LEAD_IN)])
+        if movement:
+            timeline += compile_movement(movement)
+        else:
+            timeline += Timeline.from_steps([(None, LOOK_HOLD)])
+        timeline += Timeline.from_steps([(None, LEAD_OUT)])
+    return timeline + SLAM_CUE
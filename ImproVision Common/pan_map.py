@@ -0,0 +1,260 @@
+### PAN MAP: WHERE EACH MUSICIAN SITS, IN SECONDS OF PANNING FROM HOME ###
+# Built by a calibration sweep at startup (see calibrate_pan_map) and saved as JSON.
+# Show a saved map: python pan_map.py [pan_map.json]
+
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+import pose_models
+from cue_scheduler import SystemClock, Timeline
+from gestures import stack_keypoints
+
+PAN_MAP_FORMAT_VERSION = 1
+PAN_SPEED = 24  # speed of the calibration sweep; cues must pan at the same speed for the offsets to hold
+DEFAULT_PIXELS_PER_SECOND = 1200.0  # image shift per second of panning, from the old hard-coded rates
+
+# Calibration sweep
+SWEEP_HALF_SPAN = 1.2  # seconds of panning from home to either end of the sweep
+SWEEP_STEP = 0.2       # seconds of panning between two looks
+SWEEP_SETTLE = 0.4     # seconds to wait after stopping before grabbing a frame
+MIN_NOSE_SCORE = 0.3   # noses less confident than this are ignored
+CLUSTER_GAP = 0.15     # seconds; sightings of one musician from different looks agree within this
+MIN_PAN = 0.05         # pans shorter than this are skipped
+
+
+def pan_command(seconds):
+    """The (command, duration) of a timed pan by a signed number of seconds (+ right, - left)."""
+    return ("right" if seconds > 0 else "left"), abs(seconds)
+
+
+class PanMap:
+    """
+    Pan offset of every seat: the seconds of panning at PAN_SPEED from home that center the musician,
+    positive to the right.
+
+    Parameters:
+    offsets (dict): seat -> signed pan offset in seconds.
+    pixels_per_second (float): How far the image shifts per second of panning, measured during the sweep.
+    frame_width (int): Width of the frames the map was made from.
+    """
+
+    def __init__(self, offsets, pixels_per_second=DEFAULT_PIXELS_PER_SECOND, frame_width=1920, pan_speed=PAN_SPEED):
+        self.offsets = dict(offsets)
+        self.pixels_per_second = pixels_per_second
+        self.frame_width = frame_width
+        self.pan_speed = pan_speed
+
+    def offsets_for(self, seats):
+        """Tuple of the offsets of the given seats in order, or None if any seat isn't in the map."""
+        if any(seat not in self.offsets for seat in seats):
+            return None
+        return tuple(self.offsets[seat] for seat in seats)
+
+    def pan_to(self, seat, from_offset=0.0, hold=0.0):
+        """
+        Timeline of a single timed pan from a known offset (home by default) to a seat.
+
+        Returns:
+        The timeline, and the offset it ends at.
+        """
+        target = self.offsets[seat]
+        if abs(target - from_offset) < MIN_PAN:
+            return Timeline.from_steps([(None, hold)]), target
+        return Timeline.from_steps([pan_command(target - from_offset), ("ptzstop", hold)]), target
+
+    def pan_time_for_x(self, nose_x):
+        """
+        Duration and direction of the pan that centers a nose seen at nose_x in the current frame.
+
+        Returns:
+        (seconds, "left" or "right"), like time_for_turn_by_proportion_of_range.
+        """
+        return pan_command((nose_x - self.frame_width / 2) / self.pixels_per_second)
+
+    def to_dict(self):
+        return {
+            'format_version': PAN_MAP_FORMAT_VERSION,
+            'offsets': self.offsets,
+            'pixels_per_second': self.pixels_per_second,
+            'frame_width': self.frame_width,
+            'pan_speed': self.pan_speed,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['offsets'], data['pixels_per_second'], data['frame_width'], data['pan_speed'])
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+    def __repr__(self):
+        seats = ", ".join(f"{seat} {offset:+.2f} s" for seat, offset in self.offsets.items())
+        return f"PanMap({seats}; {self.pixels_per_second:.0f} px/s)"
+
+
+def load_pan_map(path, seats):
+    """
+    Loads a saved pan map, or returns None if there is none, it is from another version, or it lacks a seat
+    (e.g. the instrument order changed), so the caller knows to calibrate.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Couldn't read the pan map {path}: {e}")
+        return None
+    if data.get('format_version') != PAN_MAP_FORMAT_VERSION or any(seat not in data['offsets'] for seat in seats):
+        print(f"Pan map {path} doesn't match the current seats, it needs recalibrating.")
+        return None
+    pan_map = PanMap.from_dict(data)
+    if pan_map.pan_speed != PAN_SPEED:
+        print(f"Pan map {path} was made at pan speed {pan_map.pan_speed}, not {PAN_SPEED}; it needs recalibrating.")
+        return None
+    print(f"Loaded {pan_map}")
+    return pan_map
+
+
+def _look(cap, model, settle, clock=SystemClock):
+    """Waits for the camera to settle and returns the nose x of everyone in the newest frame, and its width."""
+    clock.sleep(settle)
+    cap.read()  # may still show the camera moving
+    ret, frame = cap.read()
+    if not ret:
+        return None, None
+    results = pose_models.estimate_poses(model, frame)
+    if not len(results):
+        return np.zeros(0), frame.shape[1]
+    noses = stack_keypoints(results)[:, pose_models.NOSE]
+    return np.sort(noses[noses[:, 2] >= MIN_NOSE_SCORE, 0]), frame.shape[1]
+
+
+def sweep_stage(cap, model, send, half_span=SWEEP_HALF_SPAN, step=SWEEP_STEP, settle=SWEEP_SETTLE, clock=SystemClock):
+    """
+    Pans from home to the left end of the sweep, then right in steps to the right end, running pose
+    inference after each step, and returns home.
+
+    Parameters:
+    cap: Frame source with read(), e.g. LatestFrameGrabber or PoseClient.
+    model: Pose model for pose_models.estimate_poses.
+    send (callable): Sends one camera command, e.g. PTZTransport.send.
+    clock: Waits with clock.sleep, e.g. SystemClock or a VirtualClock.
+
+    Returns:
+    A list of (camera offset in seconds, sorted nose x of everyone seen), and the frame width.
+    """
+    sightings = []
+    frame_width = None
+    send("home")
+    clock.sleep(3)
+    send("left", PAN_SPEED)
+    clock.sleep(half_span)
+    send("ptzstop")
+    offset = -half_span
+    looks = int(round(2 * half_span / step)) + 1
+    for i in range(looks):
+        if i:
+            send("right", PAN_SPEED)
+            clock.sleep(step)
+            send("ptzstop")
+            offset += step
+        noses, width = _look(cap, model, settle, clock)
+        if noses is None:
+            print(f"No frame at pan offset {offset:+.2f} s")
+            continue
+        frame_width = width
+        sightings.append((offset, noses))
+        print(f"Pan offset {offset:+.2f} s: {len(noses)} people")
+    send("home")
+    return sightings, frame_width
+
+
+def estimate_pixels_per_second(sightings, frame_width, default=DEFAULT_PIXELS_PER_SECOND):
+    """
+    How far people move across the image per second of panning, from the shift of the nearest nose between
+    consecutive looks. Falls back to default if the sweep didn't see anyone twice.
+    """
+    shifts = []
+    for (offset, noses), (next_offset, next_noses) in zip(sightings, sightings[1:]):
+        if not len(noses) or not len(next_noses):
+            continue
+        expected = default * (next_offset - offset)  # panning right moves people left
+        for x in noses:
+            shift = x - next_noses[np.argmin(np.abs(next_noses - (x - expected)))]
+            if 0 < shift < frame_width / 2:
+                shifts.append(shift / (next_offset - offset))
+    if len(shifts) < 3:
+        print(f"Too few repeated sightings to measure the pan rate, assuming {default:.0f} px/s")
+        return default
+    return float(np.median(shifts))
+
+
+def cluster_offsets(sightings, pixels_per_second, frame_width, gap=CLUSTER_GAP):
+    """
+    Turns every nose seen during the sweep into the pan offset that would center it, and groups the offsets
+    that belong to the same musician.
+
+    Returns:
+    A list of (median offset, number of sightings), left to right.
+    """
+    offsets = np.sort(np.concatenate([offset + (noses - frame_width / 2) / pixels_per_second
+                                      for offset, noses in sightings] or [np.zeros(0)]))
+    if not len(offsets):
+        return []
+    clusters = np.split(offsets, np.flatnonzero(np.diff(offsets) > gap) + 1)
+    return [(float(np.median(cluster)), len(cluster)) for cluster in clusters]
+
+
+def calibrate_pan_map(cap, model, send, seats, path=None, **sweep_params):
+    """
+    Sweeps across the stage and maps each seat to the pan offset of a musician, left to right.
+    The musicians seen in the most looks are taken, so a passer-by seen once doesn't take a seat.
+
+    Every look has to see everyone in frame, so model needs a person detector (init_pose_model with
+    person_detector=True, or a pose service started with --detect-people); whole-frame inference finds
+    one person at most.
+
+    Parameters:
+    seats (list): Seat names left to right, e.g. INSTRUMENT_ORDER.
+    path (str): Where to save the map, None to not save it.
+    sweep_params: Passed on to sweep_stage, e.g. its clock.
+
+    Returns:
+    The PanMap, or None if fewer musicians than seats were found.
+    """
+    if getattr(model, 'person_detector', True) is None:
+        print("Can't calibrate the pan map: the pose model has no person detector, so it sees one person at most.")
+        return None
+    start = time.perf_counter()
+    sightings, frame_width = sweep_stage(cap, model, send, **sweep_params)
+    if not sightings:
+        print("Calibration sweep got no frames.")
+        return None
+    pixels_per_second = estimate_pixels_per_second(sightings, frame_width)
+    clusters = cluster_offsets(sightings, pixels_per_second, frame_width)
+    if len(clusters) < len(seats):
+        print(f"Calibration sweep found {len(clusters)} musicians for {len(seats)} seats.")
+        return None
+
+    musicians = sorted(sorted(clusters, key=lambda cluster: cluster[1], reverse=True)[:len(seats)])
+    pan_map = PanMap({seat: round(offset, 3) for seat, (offset, _) in zip(seats, musicians)},
+                     round(pixels_per_second, 1), frame_width)
+    print(f"Calibrated {pan_map} in {time.perf_counter() - start:.1f} s")
+    if path is not None:
+        pan_map.save(path)
+    return pan_map
+
+
+if __name__ == "__main__":
+    print(PanMap.load(sys.argv[1] if len(sys.argv) > 1 else 'pan_map.json'))
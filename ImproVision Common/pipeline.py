@@ -0,0 +1,247 @@
+import multiprocessing as mp
+import queue
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+import pose_models
+from cue_scheduler import CueWorker
+from frame_ring import MAX_FRAME_SHAPE, FrameRing
+
+STOP = None  # sentinel that shuts a stage down
+
+
+class StageStats:
+    """
+    Throughput counters of one pipeline stage.
+
+    Parameters:
+    name (str): Stage name used in reports.
+    window (float): Seconds over which the throughput is computed.
+    """
+
+    def __init__(self, name, window=5.0):
+        self.name = name
+        self.window = window
+        self.processed = 0
+        self.dropped = 0  # items discarded because the next stage was still busy, or frames overwritten in the ring
+        self.busy_time = 0.0
+        self._events = deque()  # (finished at, busy seconds) within the window
+        self._lock = threading.Lock()
+
+    def record(self, busy_seconds, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self.processed += 1
+            self.busy_time += busy_seconds
+            self._events.append((now, busy_seconds))
+            while self._events and self._events[0][0] < now - self.window:
+                self._events.popleft()
+
+    def drop(self):
+        with self._lock:
+            self.dropped += 1
+
+    def snapshot(self, now=None):
+        """Items per second and fraction of time busy over the window, and the totals."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            recent = [busy for finished, busy in self._events if finished >= now - self.window]
+        return {
+            'fps': len(recent) / self.window,
+            'utilization': sum(recent) / self.window,
+            'processed': self.processed,
+            'dropped': self.dropped,
+        }
+
+
+def put_latest(q, item, stats=None):
+    """Puts an item on a bounded queue, discarding the oldest queued item if it is full (newest frame wins)."""
+    while True:
+        try:
+            q.put_nowait(item)
+            return
+        except queue.Full:
+            try:
+                q.get_nowait()
+                if stats is not None:
+                    stats.drop()
+            except queue.Empty:
+                pass
+
+
+def pose_worker(model_factory, ring_name, frames_in, poses_out):
+    """
+    Pose stage run in its own process: loads the model, then runs inference on frames read in place from the ring.
+    Sends back (FrameRef, keypoints, scores, inference seconds), or (FrameRef, None, None, 0) if the frame was
+    overwritten before inference finished.
+    """
+    model = model_factory()
+    ring = FrameRing.attach(ring_name, untrack=False) # shares the parent's resource tracker
+    poses_out.put('ready')
+    while True:
+        ref = frames_in.get()
+        if ref is STOP:
+            break
+        image = ring.view(ref)
+        if image is None:
+            poses_out.put((ref, None, None, 0.0))
+            continue
+        start = time.perf_counter()
+        results = pose_models.estimate_poses(model, image)
+        elapsed = time.perf_counter() - start
+        del image
+        if not ring.is_current(ref):
+            poses_out.put((ref, None, None, elapsed))
+            continue
+        if results:
+            keypoints = np.array([person.pred_instances.keypoints[0][:, :2] for person in results], dtype=np.float32)
+            scores = np.array([person.pred_instances.keypoint_scores[0] for person in results], dtype=np.float32)
+        else:  # nobody in frame (with a person detector)
+            keypoints, scores = np.zeros((0, 0, 2), dtype=np.float32), np.zeros((0, 0), dtype=np.float32)
+        poses_out.put((ref, keypoints, scores, elapsed))
+    ring.close()
+
+
+class PosePipeline:
+    """
+    Runs decode -> pose -> gesture -> actuation as separate stages connected by bounded queues, so pose estimation
+    keeps running while the camera performs a cue.
+
+    - decode: a thread that reads the newest frame from the capture and copies it into a shared-memory FrameRing.
+    - pose: a separate process that owns the model and reads frames from the ring in place (only FrameRefs and
+      keypoint arrays are pickled). Queues hold at most a couple of frames and drop the oldest when full.
+    - gesture: the caller's thread, in run(). Gets each frame with its keypoints; this is also where imshow goes.
+    - actuation: a CueWorker thread that runs submitted cues one at a time.
+
+    stats() / report() give each stage's throughput, utilization and drops.
+
+    Parameters:
+    cap: LatestFrameGrabber (or anything with read()).
+    model_factory: Picklable callable that loads the model in the pose process, e.g.
+    functools.partial(pose_models.init_pose_model, 'body', 'cuda').
+    queue_size (int): Capacity of the frame and pose queues.
+    report_interval (float): Seconds between stats printouts in run(), None to disable.
+    """
+
+    def __init__(self, cap, model_factory, queue_size=2, report_interval=10.0, max_frame_shape=None):
+        self.cap = cap
+        self.model_factory = model_factory
+        self.report_interval = report_interval
+        self.stage_stats = {name: StageStats(name) for name in ('decode', 'pose', 'gesture', 'actuation')}
+
+        # Enough slots for every frame that can be queued or in flight at once, plus the one being written
+        slots = 2 * queue_size + 4
+        self.ring = FrameRing(None, slots, max_frame_shape or MAX_FRAME_SHAPE)
+        # spawn, so the pose process gets its own CUDA context and none of this process's threads
+        context = mp.get_context('spawn')
+        self.frames_queue = context.Queue(maxsize=queue_size)
+        self.poses_queue = context.Queue(maxsize=queue_size)
+        self.actuator = None
+
+        self._stop = threading.Event()
+        self.pose_process = context.Process(target=pose_worker, name='pose-stage', daemon=True,
+                                            args=(model_factory, self.ring.name, self.frames_queue, self.poses_queue))
+        self._threads = [threading.Thread(target=self._decode_loop, name='decode-stage', daemon=True)]
+
+    def start(self, timeout=300):
+        """Starts the stages and waits for the pose process to load its model."""
+        self.pose_process.start()
+        if self.poses_queue.get(timeout=timeout) != 'ready':
+            raise RuntimeError("pose stage failed to start")
+        for thread in self._threads:
+            thread.start()
+        self.actuator = CueWorker(on_done=self.stage_stats['actuation'].record)
+
+    def _decode_loop(self):
+        stats = self.stage_stats['decode']
+        seq = 0
+        while not self._stop.is_set():
+            ret, image = self.cap.read()
+            if not ret:
+                continue
+            start = time.perf_counter()
+            seq += 1
+            ref = self.ring.write(image, seq, time.monotonic())
+            if ref is None:
+                print(f"Frame of shape {image.shape} doesn't fit in the frame ring, skipping it.")
+                continue
+            put_latest(self.frames_queue, ref, stats)
+            stats.record(time.perf_counter() - start)
+
+    @property
+    def actuating(self):
+        """Whether a cue is queued or running."""
+        return self.actuator is not None and self.actuator.busy
+
+    def submit(self, function, *args):
+        """
+        Hands a cue to the actuation stage without waiting for it.
+
+        Returns:
+        False if a cue is already queued or running (the new one is not queued).
+        """
+        if not self.actuator.submit(function, *args):
+            self.stage_stats['actuation'].drop()
+            return False
+        return True
+
+    def wait_for_actuation(self, timeout=None):
+        """Blocks until the running cue (if any) has finished. Returns False on timeout."""
+        return self.actuator.wait(timeout)
+
+    def run(self, on_poses):
+        """
+        Gesture stage. Calls on_poses(frame, keypoints, scores, ref) for every frame the pose stage finishes, with
+        keypoints (persons, K, 2) and scores (persons, K), until it returns False.
+        """
+        stats = self.stage_stats['gesture']
+        last_report = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                ref, keypoints, scores, inference_time = self.poses_queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            if keypoints is None:
+                self.stage_stats['pose'].drop()
+                continue
+            self.stage_stats['pose'].record(inference_time)
+
+            frame = self.ring.read(ref)
+            if frame is None:
+                stats.drop()
+                continue
+            start = time.perf_counter()
+            keep_going = on_poses(frame, keypoints, scores, ref)
+            stats.record(time.perf_counter() - start)
+            if keep_going is False:
+                break
+
+            if self.report_interval and time.monotonic() - last_report >= self.report_interval:
+                self.report()
+                last_report = time.monotonic()
+
+    def stats(self):
+        """Dict of stage -> throughput snapshot (see StageStats.snapshot)."""
+        now = time.monotonic()
+        return {name: stats.snapshot(now) for name, stats in self.stage_stats.items()}
+
+    def report(self):
+        print(" | ".join(f"{name} {s['fps']:.1f}/s, {s['utilization']:.0%} busy, {s['dropped']} dropped"
+                         for name, s in self.stats().items()))
+
+    def stop(self):
+        """Stops every stage; a running cue is finished first."""
+        self._stop.set()
+        if self.actuator is not None:
+            self.actuator.stop()
+        for thread in self._threads:
+            thread.join(timeout=30)
+        put_latest(self.frames_queue, STOP)
+        self.pose_process.join(timeout=5)
+        if self.pose_process.is_alive():
+            self.pose_process.terminate()
+        self.ring.close()
+        self.ring.unlink()
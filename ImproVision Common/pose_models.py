@@ -0,0 +1,201 @@
+### POSE MODEL SELECTION ###
+# Benchmark: python pose_models.py [--video recording.mp4] [--device cpu] [--frames 50]
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+import model_store
+
+# Checkout searched for configs before the ones shipped with the installed mmpose package ($MMPOSE_ROOT overrides it)
+MMPOSE_ROOT = '/home/cvrr/mmpose'
+WARMUP_FRAME_SHAPE = (1080, 1920, 3)  # the stage camera's resolution
+
+# mode -> (config relative to MMPOSE_ROOT, checkpoint, number of keypoints)
+POSE_MODES = {
+    # RTMPose-m wholebody: 133 keypoints incl. face and hands. What the games have always used.
+    'wholebody': ('configs/body_2d_keypoint/rtmpose/coco/rtmpose-m_8xb64-270e_coco-wholebody-256x192.py',
+                  'https://download.openmmlab.com/mmpose/v1/projects/rtmposev1/rtmpose-m_simcc-coco-wholebody_pt-aic-coco_270e-256x192-cd5e845c_20230123.pth',
+                  133),
+    # Body-only COCO models: 17 keypoints, which is all the gesture logic reads
+    'body': ('configs/body_2d_keypoint/rtmpose/coco/rtmpose-s_8xb256-420e_coco-256x192.py',
+             'https://download.openmmlab.com/mmpose/v1/projects/rtmposev1/rtmpose-s_simcc-aic-coco_pt-aic-coco_420e-256x192-fcb2599b_20230126.pth',
+             17),
+    'body-tiny': ('configs/body_2d_keypoint/rtmpose/coco/rtmpose-t_8xb256-420e_coco-256x192.py',
+                  'https://download.openmmlab.com/mmpose/v1/projects/rtmposev1/rtmpose-t_simcc-aic-coco_pt-aic-coco_420e-256x192-e613ba3f_20230127.pth',
+                  17),
+}
+
+# RTMDet-m person detector for multi-person inference: (config relative to MMPOSE_ROOT, checkpoint)
+PERSON_DETECTOR = ('demo/mmdetection_cfg/rtmdet_m_640-8xb32_coco-person.py',
+                   'https://download.openmmlab.com/mmpose/v1/projects/rtmpose/rtmdet_m_8xb32-100e_coco-obj365-person-235e8209.pth')
+MIN_PERSON_SCORE = 0.3  # person boxes below this are dropped
+
+# Keypoint indices the gesture logic reads. COCO-WholeBody starts with the 17 COCO body keypoints,
+# so these are the same whichever mode is loaded.
+# https://mmpose.readthedocs.io/en/latest/dataset_zoo/2d_wholebody_keypoint.html#coco-wholebody
+NOSE = 0
+LEFT_SHOULDER = 5
+RIGHT_SHOULDER = 6
+LEFT_WRIST = 9
+RIGHT_WRIST = 10
+BODY_KEYPOINTS = 17  # the COCO body keypoints every mode starts with
+
+
+def _local_checkpoint(ckpt_url):
+    """The model store's copy of a checkpoint, or the URL (mmengine downloads it) with a warning."""
+    ckpt = model_store.resolve_checkpoint(ckpt_url)
+    if ckpt is None:
+        print(f"Warning: {model_store.checkpoint_name(ckpt_url)} isn't in the model store "
+              f"({model_store.MODEL_STORE_DIR}), downloading it. Run 'python model_store.py fetch' to cache it.")
+        ckpt = ckpt_url
+    return ckpt
+
+
+def init_person_detector(device='cuda'):
+    """Loads the PERSON_DETECTOR model with mmdet, checkpoint from the model store like the pose models."""
+    from mmdet.apis import init_detector
+    detector_cfg, ckpt_url = PERSON_DETECTOR
+    return init_detector(model_store.resolve_config(detector_cfg, MMPOSE_ROOT), _local_checkpoint(ckpt_url), device=device)
+
+
+def detect_people(detector, frame, min_score=MIN_PERSON_SCORE):
+    """(persons, 4) x1, y1, x2, y2 boxes of the people the detector finds in a frame."""
+    from mmdet.apis import inference_detector
+    instances = inference_detector(detector, frame).pred_instances.cpu().numpy()
+    keep = (instances.labels == 0) & (instances.scores >= min_score)
+    return instances.bboxes[keep]
+
+
+def init_pose_model(mode='wholebody', device='cuda', backend='pytorch', int8=False, warmup=1, person_detector=False):
+    """
+    Initializes the pose model for human pose estimation.
+
+    The checkpoint comes from the local model store when it has it (see model_store.py), so a cold start needs
+    no network. After loading, warm-up inferences on a blank frame take the lazy CUDA/cuDNN (or ONNX Runtime)
+    setup cost, so the first real gesture isn't the slow one.
+
+    Parameters:
+    mode (str): A key of POSE_MODES. 'body' / 'body-tiny' are much cheaper than 'wholebody' and are enough
+    for the nose/wrist gestures.
+    device (str): 'cuda' or 'cpu'. Ignored by the ONNX backend, which always runs on CPU.
+    backend (str): 'pytorch' (mmpose) or 'onnx' (ONNX Runtime, model exported with pose_onnx.py).
+    int8 (bool): With the ONNX backend, load the int8-quantized model.
+    warmup (int): Number of warm-up inferences, 0 to skip.
+    person_detector (bool): Also load PERSON_DETECTOR (needs mmdet). estimate_poses then returns one result per
+    detected person rather than a single one for the whole frame, which tracking and the pan map need.
+
+    Returns:
+    The model. Its init_timings attribute holds the load time, the first (warm-up) inference time and
+    the time to first inference in seconds; its person_detector attribute the detector or None.
+    """
+    if mode not in POSE_MODES:
+        raise ValueError(f"Unknown pose mode '{mode}', expected one of {list(POSE_MODES)}")
+
+    start = time.perf_counter()
+    if backend == 'onnx':
+        from pose_onnx import OnnxPoseEstimator, onnx_model_path
+        model = OnnxPoseEstimator(onnx_model_path(mode, int8))
+    elif backend == 'pytorch':
+        from mmpose.apis import init_model
+        model_cfg, ckpt_url, _ = POSE_MODES[mode]
+        model = init_model(model_store.resolve_config(model_cfg, MMPOSE_ROOT), _local_checkpoint(ckpt_url), device=device)
+    else:
+        raise ValueError(f"Unknown pose backend '{backend}', expected 'pytorch' or 'onnx'")
+    detector = init_person_detector(device) if person_detector else None
+    loaded = time.perf_counter()
+
+    timings = {'load': loaded - start, 'first_inference': None, 'time_to_first_inference': None}
+    if warmup:
+        frame = np.zeros(WARMUP_FRAME_SHAPE, dtype=np.uint8)
+        for i in range(warmup):
+            if detector is not None:
+                detect_people(detector, frame)
+            estimate_poses(model, frame)  # the whole frame, as the detector finds nobody in a blank one
+            if i == 0:
+                timings['first_inference'] = time.perf_counter() - loaded
+                timings['time_to_first_inference'] = time.perf_counter() - start
+        print(f"Pose model {mode} ({backend}) loaded in {timings['load']:.2f} s, first inference took "
+              f"{timings['first_inference']:.2f} s, time to first inference {timings['time_to_first_inference']:.2f} s")
+    else:
+        print(f"Pose model {mode} ({backend}) loaded in {timings['load']:.2f} s, no warm-up")
+    model.init_timings = timings
+    model.person_detector = detector
+    return model
+
+
+def estimate_poses(model, frame):
+    """
+    Runs top-down pose estimation on a frame with whichever backend init_pose_model returned.
+    Results look like mmpose's: person.pred_instances.keypoints[0] is the (K, 2) keypoint array of a person.
+
+    Without a person detector (see init_pose_model) the whole frame is one person's box, so there is always
+    exactly one result; with one there is a result per detected person, and none if nobody is in frame.
+    """
+    detector = getattr(model, 'person_detector', None)
+    bboxes = None
+    if detector is not None:
+        bboxes = detect_people(detector, frame)
+        if not len(bboxes):
+            return []
+    if hasattr(model, 'estimate'):
+        return model.estimate(frame) if bboxes is None else model.estimate(frame, bboxes)
+    from mmpose.apis import inference_topdown
+    return inference_topdown(model, frame, bboxes)
+
+
+def benchmark_pose_modes(frames, modes=None, device='cpu', warmup=3):
+    """
+    Measures estimate_poses throughput of each pose mode on the same frames.
+
+    Returns:
+    A dict of mode -> frames per second.
+    """
+    results = {}
+    for mode in modes or list(POSE_MODES):
+        model = init_pose_model(mode, device, warmup=0)
+        for frame in frames[:warmup]:
+            estimate_poses(model, frame)
+        start = time.perf_counter()
+        for frame in frames:
+            estimate_poses(model, frame)
+        results[mode] = len(frames) / (time.perf_counter() - start)
+        print(f"{mode:>10}: {results[mode]:.1f} FPS on {device} ({POSE_MODES[mode][2]} keypoints)")
+
+    baseline = results.get('wholebody')
+    if baseline:
+        for mode, fps in results.items():
+            if mode != 'wholebody':
+                print(f"{mode} is {fps / baseline:.1f}x the FPS of wholebody")
+    return results
+
+
+def load_frames(video_path, count):
+    """Reads up to count frames from a recording, or makes synthetic 1080p frames if no recording is given."""
+    if video_path is None:
+        rng = np.random.default_rng(0)
+        return [rng.integers(0, 255, (1080, 1920, 3), dtype=np.uint8) for _ in range(count)]
+
+    import cv2
+    cap = cv2.VideoCapture(video_path)
+    frames = []
+    while len(frames) < count:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare pose model throughput.")
+    parser.add_argument('--video', default=None, help="Recording to benchmark on (default: synthetic frames)")
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--frames', type=int, default=50)
+    parser.add_argument('--modes', nargs='+', default=list(POSE_MODES), choices=list(POSE_MODES))
+    args = parser.parse_args()
+
+    benchmark_pose_modes(load_frames(args.video, args.frames), args.modes, args.device)
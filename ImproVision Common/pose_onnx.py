@@ -0,0 +1,210 @@
+### ONNX RUNTIME CPU BACKEND FOR THE RTMPOSE MODELS ###
+# Export:   python pose_onnx.py export --mode body
+# Quantize: python pose_onnx.py quantize --mode body [--video recording.mp4]   (static int8 if a recording is given)
+# Compare:  python pose_onnx.py compare --mode body --video recording.mp4 [--int8]
+
+import argparse
+import os
+import time
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+
+ONNX_MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'onnx_models')
+
+# RTMPose preprocessing (data_preprocessor and GetBBoxCenterScale in the mmpose configs)
+INPUT_SIZE = (192, 256)  # (width, height)
+BBOX_PADDING = 1.25
+SIMCC_SPLIT_RATIO = 2.0
+MEAN = np.array([123.675, 116.28, 103.53], dtype=np.float32)
+STD = np.array([58.395, 57.12, 57.375], dtype=np.float32)
+
+
+def onnx_model_path(mode, int8=False):
+    """Where the exported model for a pose mode lives."""
+    return os.path.join(ONNX_MODEL_DIR, f"rtmpose-{mode}{'-int8' if int8 else ''}.onnx")
+
+
+def export_onnx(mode, onnx_path=None):
+    """
+    Exports the RTMPose checkpoint of a pose mode to ONNX. The graph takes a normalized (N, 3, 256, 192) crop
+    and returns the SimCC x/y classification vectors; cropping and decoding stay in OnnxPoseEstimator.
+    """
+    import torch
+    from pose_models import init_pose_model
+
+    onnx_path = onnx_path or onnx_model_path(mode)
+    os.makedirs(os.path.dirname(onnx_path), exist_ok=True)
+    model = init_pose_model(mode, device='cpu', warmup=0).eval()
+
+    class SimCCHead(torch.nn.Module):
+        def __init__(self, pose_model):
+            super().__init__()
+            self.pose_model = pose_model
+
+        def forward(self, x):
+            return self.pose_model(x, None, mode='tensor')
+
+    dummy = torch.zeros(1, 3, INPUT_SIZE[1], INPUT_SIZE[0])
+    torch.onnx.export(SimCCHead(model), dummy, onnx_path, opset_version=13,
+                      input_names=['input'], output_names=['simcc_x', 'simcc_y'],
+                      dynamic_axes={'input': {0: 'batch'}, 'simcc_x': {0: 'batch'}, 'simcc_y': {0: 'batch'}})
+    print(f"Exported {mode} to {onnx_path}")
+    return onnx_path
+
+
+def quantize_int8(onnx_path, int8_path, calibration_frames=None):
+    """
+    Quantizes an exported model to int8. With calibration frames (recorded from the stage camera) activations are
+    quantized statically, which is faster and more accurate for a conv net; without them only weights are quantized.
+    """
+    from onnxruntime.quantization import CalibrationDataReader, QuantType, quantize_dynamic, quantize_static
+
+    if not calibration_frames:
+        quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QInt8)
+    else:
+        class FrameReader(CalibrationDataReader):
+            def __init__(self, frames):
+                self.inputs = iter([{'input': preprocess(frame)[0]} for frame in frames])
+
+            def get_next(self):
+                return next(self.inputs, None)
+
+        quantize_static(onnx_path, int8_path, FrameReader(calibration_frames),
+                        weight_type=QuantType.QInt8, activation_type=QuantType.QUInt8)
+    print(f"Quantized {onnx_path} to {int8_path}")
+    return int8_path
+
+
+def preprocess(frame, bbox=None):
+    """
+    Crops a bbox (default: the whole frame, as inference_topdown does without bboxes) to the model input
+    the same way mmpose's TopdownAffine does.
+
+    Returns:
+    The (1, 3, H, W) float32 input, and the bbox center and scale needed to map keypoints back.
+    """
+    height, width = frame.shape[:2]
+    x1, y1, x2, y2 = bbox if bbox is not None else (0, 0, width, height)
+    center = np.array([(x1 + x2) / 2, (y1 + y2) / 2], dtype=np.float32)
+    scale = np.array([x2 - x1, y2 - y1], dtype=np.float32) * BBOX_PADDING
+
+    # Match the input aspect ratio
+    aspect = INPUT_SIZE[0] / INPUT_SIZE[1]
+    if scale[0] > scale[1] * aspect:
+        scale[1] = scale[0] / aspect
+    else:
+        scale[0] = scale[1] * aspect
+
+    source = np.array([center - scale / 2, center + [scale[0] / 2, -scale[1] / 2], center + scale / 2], dtype=np.float32)
+    target = np.array([[0, 0], [INPUT_SIZE[0], 0], [INPUT_SIZE[0], INPUT_SIZE[1]]], dtype=np.float32)
+    crop = cv2.warpAffine(frame, cv2.getAffineTransform(source, target), INPUT_SIZE, flags=cv2.INTER_LINEAR)
+
+    rgb = crop[:, :, ::-1].astype(np.float32)
+    inputs = ((rgb - MEAN) / STD).transpose(2, 0, 1)[None]
+    return np.ascontiguousarray(inputs), center, scale
+
+
+def decode_simcc(simcc_x, simcc_y, center, scale):
+    """Argmax decoding of SimCC outputs back to frame coordinates. Returns (K, 2) keypoints and (K,) scores."""
+    x_locs = simcc_x.argmax(axis=-1)
+    y_locs = simcc_y.argmax(axis=-1)
+    scores = np.minimum(simcc_x.max(axis=-1), simcc_y.max(axis=-1))
+    keypoints = np.stack([x_locs, y_locs], axis=-1).astype(np.float32) / SIMCC_SPLIT_RATIO
+    keypoints = keypoints / np.array(INPUT_SIZE, dtype=np.float32) * scale + center - scale / 2
+    return keypoints, scores
+
+
+class OnnxPoseEstimator:
+    """
+    RTMPose running on ONNX Runtime's CPU execution provider.
+
+    estimate() returns results shaped like mmpose's PoseDataSample list, so pose_models.estimate_poses can hand
+    them to code that reads person.pred_instances.keypoints[0].
+
+    Parameters:
+    onnx_path (str): Exported (optionally int8) model, see export_onnx / quantize_int8.
+    num_threads (int): Intra-op threads; None lets ONNX Runtime pick.
+    """
+
+    def __init__(self, onnx_path, num_threads=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(onnx_path, options, providers=['CPUExecutionProvider'])
+        self.onnx_path = onnx_path
+
+    def estimate(self, frame, bboxes=None):
+        results = []
+        for bbox in (bboxes if bboxes is not None else [None]):
+            inputs, center, scale = preprocess(frame, bbox)
+            simcc_x, simcc_y = self.session.run(None, {'input': inputs})
+            keypoints, scores = decode_simcc(simcc_x[0], simcc_y[0], center, scale)
+            height, width = frame.shape[:2]
+            box = bbox if bbox is not None else (0, 0, width, height)
+            results.append(SimpleNamespace(pred_instances=SimpleNamespace(
+                keypoints=keypoints[None], keypoint_scores=scores[None], bboxes=np.array([box], dtype=np.float32))))
+        return results
+
+
+def compare_backends(mode, onnx_path, frames, pixel_tolerance=10.0):
+    """
+    Accuracy-parity and throughput check of an ONNX model against the PyTorch path on recorded frames.
+
+    Returns:
+    A dict with the mean / max keypoint distance in pixels, the fraction of keypoints within pixel_tolerance
+    and the frames per second of both backends.
+    """
+    from pose_models import estimate_poses, init_pose_model
+
+    torch_model = init_pose_model(mode, device='cpu')
+    onnx_model = OnnxPoseEstimator(onnx_path)
+
+    def run(model):
+        start = time.perf_counter()
+        keypoints = [estimate_poses(model, frame)[0].pred_instances.keypoints[0] for frame in frames]
+        return np.array(keypoints), len(frames) / (time.perf_counter() - start)
+
+    estimate_poses(torch_model, frames[0]), estimate_poses(onnx_model, frames[0]) # warm up
+    torch_keypoints, torch_fps = run(torch_model)
+    onnx_keypoints, onnx_fps = run(onnx_model)
+
+    distances = np.linalg.norm(np.asarray(torch_keypoints)[..., :2] - onnx_keypoints[..., :2], axis=-1)
+    report = {
+        'mean_error_px': float(distances.mean()),
+        'max_error_px': float(distances.max()),
+        'within_tolerance': float((distances <= pixel_tolerance).mean()),
+        'pytorch_fps': torch_fps,
+        'onnx_fps': onnx_fps,
+    }
+    print(f"{os.path.basename(onnx_path)} vs PyTorch on {len(frames)} frames: "
+          f"mean error {report['mean_error_px']:.2f} px, max {report['max_error_px']:.1f} px, "
+          f"{report['within_tolerance']:.1%} within {pixel_tolerance:.0f} px; "
+          f"{torch_fps:.1f} FPS (PyTorch CPU) -> {onnx_fps:.1f} FPS (ONNX Runtime)")
+    return report
+
+
+if __name__ == "__main__":
+    from pose_models import POSE_MODES, load_frames
+
+    parser = argparse.ArgumentParser(description="Export, quantize and check the ONNX pose backend.")
+    parser.add_argument('command', choices=['export', 'quantize', 'compare'])
+    parser.add_argument('--mode', default='wholebody', choices=list(POSE_MODES))
+    parser.add_argument('--video', default=None, help="Recorded frames for calibration / comparison")
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--int8', action='store_true', help="Compare the int8 model instead of the float one")
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        export_onnx(args.mode)
+    elif args.command == 'quantize':
+        frames = load_frames(args.video, args.frames) if args.video else None
+        quantize_int8(onnx_model_path(args.mode), onnx_model_path(args.mode, int8=True), frames)
+    else:
+        if args.video is None:
+            parser.error("compare needs --video with recorded frames")
+        compare_backends(args.mode, onnx_model_path(args.mode, args.int8), load_frames(args.video, args.frames))
@@ -0,0 +1,301 @@
+### SHARED POSE INFERENCE SERVICE ###
+# Start once per machine:  python pose_service.py [--mode body] [--backend onnx] [--detect-people] [--url rtsp://192.168.100.88/1]
+# Then set POSE_SERVICE = True in robot_conductor.py / multimodal_equilibrium.py; they connect instead of loading
+# their own model and stream, so switching games doesn't reload anything.
+
+import argparse
+import os
+import socket
+import struct
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+import pose_models
+from frame_ring import MAX_FRAME_SHAPE, FrameRef, FrameRing
+from video_source import LatestFrameGrabber
+
+SOCKET_PATH = '/tmp/improvision_pose.sock'
+FRAME_SHM_NAME = 'improvision_pose_frames'
+FRAME_SLOTS = 4  # ring of frames, so a client copying one frame isn't overwritten by the next
+SEND_TIMEOUT = 0.05  # seconds a slow client may hold up a broadcast before it is dropped
+
+# Per-frame message: seq, capture timestamp, persons, keypoints per person, frame height, width, ring slot (-1: none).
+# Followed by float32 keypoints (P, K, 2), keypoint scores (P, K) and bboxes (P, 4).
+HEADER = struct.Struct('<QdIIIIi')
+
+
+def pack_results(seq, timestamp, results, frame_shape, slot):
+    """Serializes estimate_poses results into one message."""
+    keypoints = np.array([person.pred_instances.keypoints[0][:, :2] for person in results], dtype=np.float32)
+    scores = np.array([person.pred_instances.keypoint_scores[0] for person in results], dtype=np.float32)
+    bboxes = np.array([person.pred_instances.bboxes[0] for person in results], dtype=np.float32)
+    persons, num_keypoints = (keypoints.shape[0], keypoints.shape[1]) if len(results) else (0, 0)
+    header = HEADER.pack(seq, timestamp, persons, num_keypoints, frame_shape[0], frame_shape[1], slot)
+    return header + keypoints.tobytes() + scores.tobytes() + bboxes.tobytes()
+
+
+def recv_exact(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("pose service closed the connection")
+        data += chunk
+    return bytes(data)
+
+
+def to_pose_results(keypoints, scores, bboxes):
+    """Wraps keypoint arrays like mmpose's PoseDataSample list: person.pred_instances.keypoints[0] is (K, 2)."""
+    return [SimpleNamespace(pred_instances=SimpleNamespace(
+        keypoints=keypoints[i:i + 1], keypoint_scores=scores[i:i + 1], bboxes=bboxes[i:i + 1]))
+        for i in range(len(keypoints))]
+
+
+class PoseService:
+    """
+    Owns the pose model and the camera stream and publishes every processed frame to local clients.
+
+    Keypoints go out over a Unix socket (a few kB per frame). The frame itself is written to a shared-memory ring
+    and only its slot number is sent, so clients that want to display it copy it without any pickling.
+
+    Parameters:
+    url (str): Stream URL.
+    model: Model from pose_models.init_pose_model.
+    socket_path (str): Unix socket clients connect to.
+    """
+
+    def __init__(self, url, model, socket_path=SOCKET_PATH, max_frame_shape=MAX_FRAME_SHAPE):
+        self.url = url
+        self.model = model
+        self.socket_path = socket_path
+        self.max_frame_shape = max_frame_shape
+        self.clients = []
+        self._clients_lock = threading.Lock()
+        self._stop = threading.Event()
+        self.frames_published = 0
+
+        FrameRing.remove_stale(FRAME_SHM_NAME)  # left behind by a service that was killed
+        self.frames = FrameRing(FRAME_SHM_NAME, FRAME_SLOTS, max_frame_shape)
+
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(socket_path)
+        self.server.listen()
+        self._accept_thread = threading.Thread(target=self._accept_loop, name='pose-service-accept', daemon=True)
+        self._accept_thread.start()
+
+    def _accept_loop(self):
+        while not self._stop.is_set():
+            try:
+                client, _ = self.server.accept()
+            except OSError:
+                return
+            client.settimeout(SEND_TIMEOUT)
+            with self._clients_lock:
+                self.clients.append(client)
+            print(f"Pose client connected ({len(self.clients)} connected)")
+
+    def publish(self, seq, timestamp, image, results):
+        ref = self.frames.write(image, seq)
+        message = pack_results(seq, timestamp, results, image.shape, -1 if ref is None else ref.slot)
+        with self._clients_lock:
+            for client in list(self.clients):
+                try:
+                    client.sendall(message)
+                except OSError:
+                    self.clients.remove(client)
+                    client.close()
+                    print(f"Pose client disconnected ({len(self.clients)} connected)")
+        self.frames_published += 1
+
+    def serve_forever(self):
+        """Runs inference on the newest frame of the stream and publishes it, until interrupted."""
+        cap = LatestFrameGrabber(self.url)
+        print(f"Pose service on {self.socket_path}, streaming {self.url}")
+        try:
+            while not self._stop.is_set():
+                frame = cap.read_latest()
+                if frame is None:
+                    print(f"No frame from the camera: {cap.health()}")
+                    continue
+                self.publish(frame.seq, frame.timestamp, frame.image, pose_models.estimate_poses(self.model, frame.image))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            cap.release()
+            self.close()
+
+    def close(self):
+        self._stop.set()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        try:
+            self.server.shutdown(socket.SHUT_RDWR)  # wakes the accept thread
+        except OSError:
+            pass
+        self.server.close()
+        with self._clients_lock:
+            for client in self.clients:
+                client.close()
+            self.clients.clear()
+        self.frames.close()
+        self.frames.unlink()
+
+
+class PoseClient:
+    """
+    Connects to a running PoseService. Stands in for both the video capture and the pose model in the game scripts:
+
+        cap = model = PoseClient()
+        ret, frame = cap.read()                           # newest frame the service has processed
+        result = pose_models.estimate_poses(model, frame) # its keypoints, no inference in this process
+
+    A background thread keeps only the newest message, so a client that is busy (e.g. running a cue) never
+    falls behind, and reconnects if the service restarts.
+
+    Parameters:
+    socket_path (str): Unix socket of the service.
+    reconnect_delay (float): Seconds between connection attempts while the service is down.
+    """
+
+    def __init__(self, socket_path=SOCKET_PATH, reconnect_delay=0.5):
+        self.socket_path = socket_path
+        self.reconnect_delay = reconnect_delay
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._sock = None
+        self._latest = None  # (header fields, keypoints, scores, bboxes)
+        self._last_read_seq = 0
+        self._last_results = []
+        self.last_timestamp = None  # capture time (time.monotonic, same clock in every process) of the last read
+        self._frames = None
+        self.connected = False
+        self.messages_received = 0
+        self.frames_skipped = 0  # messages overwritten before read() picked them up
+
+        self._connect()
+        self._thread = threading.Thread(target=self._receive_loop, name='pose-client', daemon=True)
+        self._thread.start()
+
+    def _connect(self):
+        try:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.socket_path)
+        except OSError:
+            self.connected = False
+            return False
+        self._sock = sock
+        self.connected = True
+        return True
+
+    def _attach_frames(self):
+        if self._frames is None:
+            try:
+                self._frames = FrameRing.attach(FRAME_SHM_NAME)
+            except FileNotFoundError:
+                return None
+        return self._frames
+
+    def _receive_loop(self):
+        while not self._stop.is_set():
+            if not self.connected and not self._connect():
+                self._stop.wait(self.reconnect_delay)
+                continue
+            try:
+                fields = HEADER.unpack(recv_exact(self._sock, HEADER.size))
+                persons, num_keypoints = fields[2], fields[3]
+                keypoints = np.frombuffer(recv_exact(self._sock, persons * num_keypoints * 8), dtype=np.float32)
+                scores = np.frombuffer(recv_exact(self._sock, persons * num_keypoints * 4), dtype=np.float32)
+                bboxes = np.frombuffer(recv_exact(self._sock, persons * 16), dtype=np.float32)
+            except (OSError, ConnectionError):
+                self.connected = False
+                self._sock.close()
+                if self._frames is not None:  # the service recreates the ring when it restarts
+                    self._frames.close()
+                    self._frames = None
+                continue
+
+            with self._condition:
+                if self._latest is not None and self._latest[0][0] > self._last_read_seq:
+                    self.frames_skipped += 1
+                self._latest = (fields, keypoints.reshape(persons, num_keypoints, 2),
+                                scores.reshape(persons, num_keypoints), bboxes.reshape(persons, 4))
+                self.messages_received += 1
+                self._condition.notify_all()
+
+    def _copy_frame(self, fields):
+        seq, timestamp, _, _, height, width, slot = fields
+        frames = self._attach_frames()
+        if slot < 0 or frames is None:
+            return None
+        return frames.read(FrameRef(slot, seq, (height, width, 3), timestamp))
+
+    def isOpened(self):
+        return self.connected
+
+    def read(self, timeout=2.0):
+        """cv2.VideoCapture-style read: returns (ret, frame) for the newest processed frame."""
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._latest is not None and self._latest[0][0] > self._last_read_seq, timeout)
+            if self._latest is None or self._latest[0][0] <= self._last_read_seq:
+                return False, None
+            fields, keypoints, scores, bboxes = self._latest
+            self._last_read_seq = fields[0]
+
+        frame = self._copy_frame(fields)
+        if frame is None:
+            return False, None
+        self._last_results = to_pose_results(keypoints, scores, bboxes)
+        self.last_timestamp = fields[1]
+        return True, frame
+
+    def estimate(self, frame=None):
+        """The service's pose results for the frame last returned by read(); frame is only for API compatibility."""
+        return self._last_results
+
+    @property
+    def frames_dropped(self):
+        """Same counter name as LatestFrameGrabber, so the scripts can log either."""
+        return self.frames_skipped
+
+    def frame_age(self):
+        """Seconds since the newest published frame was captured, or None before the first one."""
+        latest = self._latest
+        return None if latest is None else time.monotonic() - latest[0][1]
+
+    def health(self):
+        """Snapshot of the connection's state and counters, for logging."""
+        return {
+            'connected': self.connected,
+            'messages_received': self.messages_received,
+            'frames_skipped': self.frames_skipped,
+            'frame_age': self.frame_age(),
+        }
+
+    def release(self):
+        self._stop.set()
+        if self._sock is not None:
+            self._sock.close()
+        self._thread.join(timeout=1.0)
+        if self._frames is not None:
+            self._frames.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve pose keypoints of the stage camera to local clients.")
+    parser.add_argument('--url', default='rtsp://192.168.100.88/1')
+    parser.add_argument('--mode', default='wholebody', choices=list(pose_models.POSE_MODES))
+    parser.add_argument('--backend', default='pytorch', choices=['pytorch', 'onnx'])
+    parser.add_argument('--int8', action='store_true')
+    parser.add_argument('--device', default='cuda')
+    parser.add_argument('--socket', default=SOCKET_PATH)
+    parser.add_argument('--detect-people', action='store_true', help="Run the person detector, one pose per person")
+    args = parser.parse_args()
+
+    model = pose_models.init_pose_model(args.mode, args.device, args.backend, args.int8, person_detector=args.detect_people)
+    PoseService(args.url, model, args.socket).serve_forever()
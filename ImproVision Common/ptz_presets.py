@@ -0,0 +1,156 @@
+### PTZ PRESETS: ONE STORED CAMERA POSITION PER SEAT ###
+# Store the current position: python ptz_presets.py <camera ip> set <name> [preset file]
+# Recall one:                 python ptz_presets.py <camera ip> call <name> [preset file]
+
+import json
+import os
+import sys
+
+from cue_scheduler import SystemClock, Timeline
+from movement_compiler import PRESET_TRAVEL
+from pan_map import pan_command
+
+PRESET_FORMAT_VERSION = 1
+FIRST_PRESET = 1     # PTZOptics cameras keep preset 0 for their own use on some firmware
+PRESET_SETTLE = 1.0  # seconds to let the camera stop before storing a preset
+MOTION_COMMANDS = {"up", "down", "left", "right", "home"}
+
+
+class PresetManager:
+    """
+    Gives each named position (the seats of INSTRUMENT_ORDER, plus e.g. 'home') a camera preset slot,
+    stores and recalls them with the posset / poscall CGI commands, and keeps track of which preset the
+    camera is at. Moving to a stored preset is a single command and lands in the same place every time,
+    whatever the network latency.
+
+    Use send() in place of the transport's send (e.g. as the CueScheduler's send) so that relative moves
+    also update the active preset.
+
+    Parameters:
+    send (callable): Sends one camera command, e.g. PTZTransport.send.
+    names (list): Names of the positions, in slot order from first_slot.
+    path (str): JSON file recording which presets have been stored in the camera, None to not persist it.
+    """
+
+    def __init__(self, send, names, path=None, first_slot=FIRST_PRESET):
+        self._send = send
+        self.slots = {name: first_slot + i for i, name in enumerate(names)}
+        self.path = path
+        self.stored = {}  # name -> pan offset it was stored at (None if stored by hand)
+        self.active = None  # name of the preset the camera is at, None after a relative move
+        if path is not None and os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        with open(self.path) as f:
+            data = json.load(f)
+        if data.get('format_version') != PRESET_FORMAT_VERSION:
+            return
+        # Presets whose slot has changed since they were stored need storing again
+        self.stored = {name: offset for name, offset in data['stored'].items()
+                       if data['slots'].get(name) == self.slots.get(name)}
+
+    def _save(self):
+        if self.path is None:
+            return
+        with open(self.path, 'w') as f:
+            json.dump({'format_version': PRESET_FORMAT_VERSION, 'slots': self.slots, 'stored': self.stored}, f, indent=2)
+
+    def send(self, command, *args):
+        """Sends a command through the transport, updating the active preset."""
+        result = self._send(command, *args)
+        action = command.lower()
+        if action == "poscall" and result == "success":
+            self.active = next((name for name, slot in self.slots.items() if slot == args[0]), None)
+        elif action in MOTION_COMMANDS:
+            self.active = None
+        return result
+
+    def has(self, *names):
+        """Whether all the given presets have been stored."""
+        return all(name in self.stored for name in names)
+
+    def store(self, name, pan_offset=None):
+        """
+        Stores the camera's current position as the named preset.
+
+        Parameters:
+        pan_offset (float): Pan offset the camera was moved to (see pan_map), kept so the preset can be
+        stored again when the pan map changes.
+        """
+        if self.send("posset", self.slots[name]) != "success":
+            print(f"Couldn't store preset '{name}'")
+            return False
+        self.stored[name] = pan_offset
+        self.active = name
+        self._save()
+        print(f"Stored preset '{name}' in slot {self.slots[name]}")
+        return True
+
+    def recall(self, name):
+        """Moves the camera to a stored preset with a single command."""
+        if name not in self.stored:
+            print(f"Preset '{name}' hasn't been stored yet.")
+            return "failure"
+        return self.send("poscall", self.slots[name])
+
+    def slots_for(self, names):
+        """Tuple of the slots of the given presets, or None if any hasn't been stored."""
+        if not self.has(*names):
+            return None
+        return tuple(self.slots[name] for name in names)
+
+    def timeline_to(self, name, hold=PRESET_TRAVEL):
+        """Timeline recalling a preset and allowing hold seconds to get there."""
+        return Timeline([(0.0, ("poscall", self.slots[name]))], hold)
+
+    def store_from_pan_map(self, pan_map, seats, home_wait=3.0, clock=SystemClock):
+        """
+        Drives the camera to every seat of a PanMap with a timed pan from home and stores it as that seat's
+        preset, plus home itself. Seats whose preset was stored at the same offset, or aimed by hand, are skipped.
+        The waits go through clock.sleep, so a VirtualClock skips them.
+
+        Returns:
+        False if any preset couldn't be stored.
+        """
+        ok, moved = True, False
+        if 'home' in self.slots and 'home' not in self.stored:
+            self.send("home")
+            clock.sleep(home_wait)
+            ok = self.store('home') and ok
+        for seat in seats:
+            offset = pan_map.offsets[seat]
+            if seat in self.stored and self.stored[seat] in (None, offset):
+                continue # already stored here, or aimed by hand
+            moved = True
+            self.send("home")
+            clock.sleep(home_wait)
+            command, seconds = pan_command(offset)
+            self.send(command)
+            clock.sleep(seconds)
+            self.send("ptzstop")
+            clock.sleep(PRESET_SETTLE)
+            ok = self.store(seat, offset) and ok
+        if moved:
+            self.send("home")
+        return ok
+
+
+if __name__ == "__main__":
+    from ptz_transport import PTZTransport
+
+    if len(sys.argv) < 4 or sys.argv[2] not in ("set", "call"):
+        print("usage: python ptz_presets.py <camera ip> set|call <name> [preset file]")
+        sys.exit(1)
+    camera_ip, action, name = sys.argv[1:4]
+    path = sys.argv[4] if len(sys.argv) > 4 else 'ptz_presets.json'
+    names = []
+    if os.path.exists(path):
+        with open(path) as f:
+            names = sorted(json.load(f)['slots'].items(), key=lambda item: item[1])
+        names = [preset for preset, _ in names]
+    presets = PresetManager(PTZTransport(camera_ip).send, names if name in names else names + [name], path)
+    if action == "set":
+        presets.store(name)
+    else:
+        presets.recall(name)
@@ -0,0 +1,84 @@
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class PTZTransport:
+    """
+    Persistent HTTP transport to the PTZOptics camera's /cgi-bin/ptzctrl.cgi endpoint.
+
+    Keeps a pooled keep-alive connection open so that consecutive commands (e.g. an 'up'/'ptzstop' pair)
+    don't each pay for a fresh TCP handshake, applies a connect/read deadline to every command so a stalled
+    camera can't hang the conductor, and measures the round-trip time of each command.
+
+    Parameters:
+    camera_ip (str): IP address of the camera.
+    connect_timeout (float): Seconds allowed to establish a connection.
+    read_timeout (float): Seconds allowed for the camera to answer a command.
+    pool_size (int): Number of keep-alive connections held open to the camera.
+    """
+
+    def __init__(self, camera_ip, connect_timeout=0.5, read_timeout=1.0, pool_size=2, rtt_window=50):
+        self.base_url = f'http://{camera_ip}/cgi-bin/ptzctrl.cgi?ptzcmd&'
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.last_rtt = None  # seconds, round trip of the most recent command
+        self.rtt_samples = deque(maxlen=rtt_window)
+
+    def build_cgi_url(self, command, pan_speed=24, tilt_speed=20, focus_speed=10, zoom_speed=10):
+        """
+        Constructs the camera control URL based on the command and speeds provided.
+        For the preset commands "posset" (store the current position) and "poscall" (move to a stored one),
+        the second argument is the preset number instead of a speed, e.g. build_cgi_url("poscall", 3).
+        """
+        action = command.lower()
+        if action in ["up", "down", "left", "right"]:
+            return f"{self.base_url}{action}&{pan_speed}&{tilt_speed}"
+        elif action in ["posset", "poscall"]:
+            return f"{self.base_url}{action}&{int(pan_speed)}"
+        elif action in ["home", "ptzstop"]:
+            return f"{self.base_url}{action}"
+        elif action in ["focusin", "focusout", "focusstop"]:
+            return f"{self.base_url}{action}&{focus_speed}"
+        elif action in ["zoomin", "zoomout", "zoomstop"]:
+            return f"{self.base_url}{action}&{zoom_speed}"
+        else:
+            return f"{self.base_url}home&10&10"
+
+    def send(self, command, pan_speed=24, tilt_speed=20, focus_speed=10, zoom_speed=10):
+        """
+        Sends a command to the camera over the pooled session and checks the response status.
+
+        Returns:
+        "success" or "failure", as the per-script send_camera_control functions always have.
+        """
+        url = self.build_cgi_url(command, pan_speed, tilt_speed, focus_speed, zoom_speed)
+        start = time.perf_counter()
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+        except requests.RequestException as e:
+            print(f"Failed to execute command '{command}': {e}")
+            return "failure"
+        finally:
+            self.last_rtt = time.perf_counter() - start
+            self.rtt_samples.append(self.last_rtt)
+
+        if response.status_code == 200:
+            print(f"Command '{command}' was successful ({self.last_rtt * 1000:.1f} ms)")
+            return "success"
+        else:
+            print(f"Failed to execute command '{command}'")
+            return "failure"
+
+    def mean_rtt(self):
+        """Average round-trip time (seconds) over the recent command window, or None before the first command."""
+        if not self.rtt_samples:
+            return None
+        return sum(self.rtt_samples) / len(self.rtt_samples)
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,374 @@
+### MULTI-PERSON TRACKING AND SEAT ASSIGNMENT ###
+# Benchmark: python tracking.py
+
+import time
+
+import numpy as np
+
+from pose_models import BODY_KEYPOINTS, NOSE
+
+MIN_KEYPOINT_SCORE = 0.3  # keypoints below this don't count towards a person's box
+
+
+def keypoint_boxes(keypoints, scores=None, min_score=MIN_KEYPOINT_SCORE):
+    """
+    Tight (x1, y1, x2, y2) boxes around each person's confident keypoints, and a detection score (mean score
+    of the BODY_KEYPOINTS body keypoints, so the many low-scoring face and hand keypoints of the wholebody
+    model don't sink it). Top-down inference without a person detector reports the whole frame as every
+    person's bbox, so boxes are taken from the keypoints instead.
+
+    Parameters:
+    keypoints (np.ndarray): (persons, K, 3) keypoints with scores, or (persons, K, 2) plus scores.
+    scores (np.ndarray): (persons, K) keypoint scores, if not in keypoints.
+
+    Returns:
+    (persons, 4) boxes and (persons,) scores. People without confident keypoints get a score of 0.
+    """
+    keypoints = np.asarray(keypoints, dtype=np.float32)
+    if not len(keypoints):
+        return np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32)
+    keypoint_scores = keypoints[..., 2] if scores is None else np.asarray(scores, dtype=np.float32)
+    confident = keypoint_scores >= min_score
+    x = np.where(confident, keypoints[..., 0], np.nan)
+    y = np.where(confident, keypoints[..., 1], np.nan)
+    visible = confident.any(axis=1)
+    boxes = np.zeros((len(keypoints), 4), dtype=np.float32)
+    boxes[visible] = np.stack([np.nanmin(x[visible], axis=1), np.nanmin(y[visible], axis=1),
+                               np.nanmax(x[visible], axis=1), np.nanmax(y[visible], axis=1)], axis=1)
+    return boxes, np.where(visible, keypoint_scores[:, :BODY_KEYPOINTS].mean(axis=1), 0.0)
+
+
+def iou_matrix(a, b):
+    """Pairwise IoU of (N, 4) and (M, 4) boxes as an (N, M) array."""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.where(union > 0, intersection / np.maximum(union, 1e-9), 0.0)
+
+
+def greedy_match(cost):
+    """
+    Matches rows to columns by ascending cost, skipping infinite costs. For the handful of people on stage this
+    gives the same answer as the Hungarian algorithm in practice, without needing SciPy.
+
+    Returns:
+    A list of (row, column) pairs.
+    """
+    if not cost.size:
+        return []
+    order = np.argsort(cost, axis=None)
+    rows, columns = np.unravel_index(order, cost.shape)
+    used_rows, used_columns, matches = set(), set(), []
+    for row, column in zip(rows.tolist(), columns.tolist()):
+        if not np.isfinite(cost[row, column]):
+            break
+        if row in used_rows or column in used_columns:
+            continue
+        used_rows.add(row)
+        used_columns.add(column)
+        matches.append((row, column))
+    return matches
+
+
+class IdSlots:
+    """
+    Compact slots in per-person state arrays for track ids, which grow without bound over a performance.
+
+    Every id seen gets the lowest free slot, and the slots of ids not seen for more than lost_s seconds are
+    recycled, so the state arrays stay as large as the number of people recently in view. Negative ids
+    (people the tracker doesn't follow) get no slot.
+    """
+
+    def __init__(self, lost_s=1.0):
+        self.lost_s = lost_s
+        self.slot_of = {}  # id -> slot
+        self.last_seen = np.full(0, -np.inf)  # per slot
+
+    def __len__(self):
+        return len(self.last_seen)
+
+    def get(self, track_id):
+        """Slot of an id, or None."""
+        return self.slot_of.get(track_id)
+
+    def assign(self, ids, timestamp):
+        """
+        Slots of the ids of one frame. State arrays must then hold len(self) slots.
+
+        Returns:
+        (persons,) slots, -1 for negative ids, and (persons,) seconds since each id was last seen, inf for ids
+        that have just been given a slot (their state must start from scratch).
+        """
+        ids = np.asarray(ids, dtype=int)
+        for track_id, slot in list(self.slot_of.items()):
+            if timestamp - self.last_seen[slot] > self.lost_s:
+                del self.slot_of[track_id]
+
+        used = set(self.slot_of.values())
+        free = [slot for slot in range(len(self.last_seen)) if slot not in used]
+        slots, elapsed = np.full(len(ids), -1), np.full(len(ids), np.inf)
+        for k, track_id in enumerate(ids.tolist()):
+            if track_id < 0:
+                continue
+            slot = self.slot_of.get(track_id)
+            if slot is not None:
+                elapsed[k] = timestamp - self.last_seen[slot]
+            else:
+                if not free:
+                    size = max(2 * len(self.last_seen), 16)
+                    free = list(range(len(self.last_seen), size))
+                    self.last_seen = np.concatenate([self.last_seen, np.full(size - len(self.last_seen), -np.inf)])
+                slot = free.pop(0)
+                self.slot_of[track_id] = slot
+            slots[k] = slot
+        self.last_seen[slots[slots >= 0]] = timestamp
+        return slots, elapsed
+
+    def reset(self):
+        self.slot_of = {}
+        self.last_seen[:] = -np.inf
+
+
+class PersonTracker:
+    """
+    SORT / ByteTrack-style tracker that gives each person a stable id across frames.
+
+    Tracks are predicted forward with their centroid velocity and matched to detections by IoU and centroid
+    distance. Confident detections are matched first; tracks left over then get a second chance with weak
+    detections (a partly occluded player), which don't start new tracks by themselves. A track that isn't
+    matched is kept for max_age seconds, so a musician hidden behind a colleague for a moment keeps their id.
+
+    Parameters:
+    high_score (float): Detections at least this confident are matched first and may start tracks.
+    low_score (float): Weaker detections are ignored entirely.
+    min_iou (float): Pairs with less overlap only match if their centroids are close.
+    max_distance (float): Largest centroid distance for a match, in heights of the track's box.
+    max_age (float): Seconds an unmatched track is kept.
+    min_hits (int): Matches before a track counts as confirmed.
+    """
+
+    def __init__(self, high_score=0.5, low_score=0.2, min_iou=0.1, max_distance=0.5, max_age=3.0, min_hits=3):
+        self.high_score = high_score
+        self.low_score = low_score
+        self.min_iou = min_iou
+        self.max_distance = max_distance
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self.next_id = 0
+
+        # One row per live track
+        self.ids = np.zeros(0, dtype=int)
+        self.boxes = np.zeros((0, 4))
+        self.velocities = np.zeros((0, 2))  # centroid pixels per second
+        self.nose_x = np.zeros(0)
+        self.last_seen = np.zeros(0)
+        self.hits = np.zeros(0, dtype=int)
+
+    @property
+    def confirmed(self):
+        return self.hits >= self.min_hits
+
+    def _cost(self, track_rows, predicted, boxes):
+        if not len(track_rows) or not len(boxes):
+            return np.zeros((len(track_rows), len(boxes)))
+        track_boxes = predicted[track_rows]
+        iou = iou_matrix(track_boxes, boxes)
+        track_centers = (track_boxes[:, :2] + track_boxes[:, 2:]) / 2
+        centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+        heights = np.maximum(track_boxes[:, 3] - track_boxes[:, 1], 1.0)
+        distance = np.linalg.norm(track_centers[:, None] - centers[None], axis=-1) / heights[:, None]
+        cost = (1 - iou) + distance
+        return np.where((iou >= self.min_iou) | (distance <= self.max_distance), cost, np.inf)
+
+    def update(self, keypoints, timestamp, scores=None):
+        """
+        Assigns track ids to the people of one frame.
+
+        Parameters:
+        keypoints (np.ndarray): (persons, K, 3) keypoints with scores, or (persons, K, 2) plus scores.
+        timestamp (float): Capture time of the frame in seconds.
+        scores (np.ndarray): (persons, K) keypoint scores, if not in keypoints.
+
+        Returns:
+        (persons,) array of track ids, -1 for weak detections that match no track.
+        """
+        boxes, detection_scores = keypoint_boxes(keypoints, scores)
+        nose_x = np.asarray(keypoints, dtype=np.float32)[:, NOSE, 0] if len(boxes) else np.zeros(0)
+        assigned = np.full(len(boxes), -1, dtype=int)
+
+        dt = (timestamp - self.last_seen)[:, None]
+        shift = np.tile(self.velocities * dt, 2)
+        predicted = self.boxes + shift
+
+        strong = np.flatnonzero(detection_scores >= self.high_score)
+        weak = np.flatnonzero((detection_scores >= self.low_score) & (detection_scores < self.high_score))
+        unmatched_rows = np.arange(len(self.ids))
+        for detections in (strong, weak):
+            matches = greedy_match(self._cost(unmatched_rows, predicted, boxes[detections]))
+            for row_index, detection_index in matches:
+                row, detection = unmatched_rows[row_index], detections[detection_index]
+                center = (boxes[detection, :2] + boxes[detection, 2:]) / 2
+                old_center = (self.boxes[row, :2] + self.boxes[row, 2:]) / 2
+                elapsed = max(timestamp - self.last_seen[row], 1e-3)
+                self.velocities[row] = 0.5 * self.velocities[row] + 0.5 * (center - old_center) / elapsed
+                self.boxes[row] = boxes[detection]
+                self.nose_x[row] = nose_x[detection]
+                self.last_seen[row] = timestamp
+                self.hits[row] += 1
+                assigned[detection] = self.ids[row]
+            matched_rows = {unmatched_rows[row_index] for row_index, _ in matches}
+            unmatched_rows = np.array([row for row in unmatched_rows if row not in matched_rows], dtype=int)
+
+        # New tracks for confident detections nobody claimed
+        new = [detection for detection in strong if assigned[detection] < 0]
+        if new:
+            new_ids = np.arange(self.next_id, self.next_id + len(new))
+            self.next_id += len(new)
+            assigned[new] = new_ids
+            self.ids = np.concatenate([self.ids, new_ids])
+            self.boxes = np.concatenate([self.boxes, boxes[new]])
+            self.velocities = np.concatenate([self.velocities, np.zeros((len(new), 2))])
+            self.nose_x = np.concatenate([self.nose_x, nose_x[new]])
+            self.last_seen = np.concatenate([self.last_seen, np.full(len(new), timestamp)])
+            self.hits = np.concatenate([self.hits, np.ones(len(new), dtype=int)])
+
+        # Drop tracks that have been gone too long
+        alive = timestamp - self.last_seen <= self.max_age
+        if not alive.all():
+            self.ids, self.boxes, self.velocities = self.ids[alive], self.boxes[alive], self.velocities[alive]
+            self.nose_x, self.last_seen, self.hits = self.nose_x[alive], self.last_seen[alive], self.hits[alive]
+        return assigned
+
+    def track(self, track_id):
+        """Row of a live track in the state arrays, or None."""
+        rows = np.flatnonzero(self.ids == track_id)
+        return int(rows[0]) if len(rows) else None
+
+
+class SeatMap:
+    """
+    Binds track ids to seats, e.g. INSTRUMENT_ORDER, left to right.
+
+    The binding is made once the same number of confirmed people as there are seats has been visible for
+    bind_frames updates in a row (the quartet has sat down). It then follows the track ids, so it survives
+    short occlusions and people crossing. If a seated track is dropped (occluded longer than the tracker's
+    max_age), the next unseated track to appear takes over the free seat closest to where it was last seen.
+    It needs one pose per musician, i.e. a pose model with a person detector (see pose_models.init_pose_model).
+
+    Parameters:
+    seats (list): Seat names from left to right as seen by the camera.
+    bind_frames (int): Consecutive updates with a full ensemble needed before binding.
+    """
+
+    def __init__(self, seats, bind_frames=10):
+        self.seats = list(seats)
+        self.bind_frames = bind_frames
+        self.track_of_seat = {}  # seat -> track id
+        self.last_x = {}  # seat -> last known nose x of its musician
+        self._full_frames = 0
+
+    @property
+    def bound(self):
+        return bool(self.track_of_seat)
+
+    def seat_of(self, track_id):
+        for seat, seated_id in self.track_of_seat.items():
+            if seated_id == track_id:
+                return seat
+        return None
+
+    def update(self, tracker, visible_ids):
+        """
+        Updates the binding after tracker.update.
+
+        Parameters:
+        visible_ids (array-like): Track ids seen in this frame.
+        """
+        visible = [int(i) for i in visible_ids if i >= 0]
+        rows = [tracker.track(i) for i in visible]
+        confirmed = [(i, row) for i, row in zip(visible, rows) if row is not None and tracker.confirmed[row]]
+
+        if not self.bound:
+            self._full_frames = self._full_frames + 1 if len(confirmed) >= len(self.seats) else 0
+            if self._full_frames >= self.bind_frames:
+                # The largest boxes are the musicians closest to the camera, i.e. the ensemble rather than passers-by
+                heights = [tracker.boxes[row, 3] - tracker.boxes[row, 1] for _, row in confirmed]
+                ensemble = [confirmed[k] for k in np.argsort(heights)[::-1][:len(self.seats)]]
+                ensemble.sort(key=lambda item: tracker.nose_x[item[1]])
+                for seat, (track_id, row) in zip(self.seats, ensemble):
+                    self.track_of_seat[seat] = track_id
+                    self.last_x[seat] = float(tracker.nose_x[row])
+                print(f"Seats bound: {self.track_of_seat}")
+            return self.track_of_seat
+
+        # Follow seated tracks, and hand seats of dropped tracks to new, unseated ones
+        live = set(tracker.ids.tolist())
+        free = [seat for seat, track_id in self.track_of_seat.items() if track_id not in live]
+        for track_id, row in confirmed:
+            seat = self.seat_of(track_id)
+            if seat is None and free:
+                seat = min(free, key=lambda s: abs(self.last_x[s] - tracker.nose_x[row]))
+                free.remove(seat)
+                print(f"Track {track_id} takes over seat {seat}")
+                self.track_of_seat[seat] = track_id
+            if seat is not None:
+                self.last_x[seat] = float(tracker.nose_x[row])
+        return self.track_of_seat
+
+    def positions(self, tracker):
+        """Dict of seat -> nose x of its musician, for the seats whose musician is currently tracked."""
+        positions = {}
+        for seat, track_id in self.track_of_seat.items():
+            row = tracker.track(track_id)
+            if row is not None:
+                positions[seat] = float(tracker.nose_x[row])
+        return positions
+
+
+class EnsembleTracker:
+    """A PersonTracker plus a SeatMap: stable ids for everyone in frame and the seat each musician sits in."""
+
+    def __init__(self, seats, tracker=None, bind_frames=10):
+        self.tracker = tracker or PersonTracker()
+        self.seat_map = SeatMap(seats, bind_frames)
+
+    def update(self, keypoints, timestamp, scores=None):
+        """Tracks one frame. Returns the (persons,) track ids, -1 for untracked detections (see PersonTracker.update)."""
+        ids = self.tracker.update(keypoints, timestamp, scores)
+        self.seat_map.update(self.tracker, ids)
+        return ids
+
+    def musician_positions(self):
+        """Dict of instrument -> nose x, the musician_positions format of execute_one_measure."""
+        return self.seat_map.positions(self.tracker)
+
+
+def benchmark_tracker(people=4, frames=2000, keypoints_per_person=133):
+    """Times EnsembleTracker.update on a synthetic ensemble swaying in place. Returns microseconds per frame."""
+    rng = np.random.default_rng(0)
+    base = np.zeros((people, keypoints_per_person, 3), dtype=np.float32)
+    for p in range(people):
+        base[p, :, 0] = rng.uniform(300 + 350 * p, 500 + 350 * p, keypoints_per_person)
+        base[p, :, 1] = rng.uniform(300, 900, keypoints_per_person)
+    base[..., 2] = 0.9
+
+    tracker = EnsembleTracker([f"seat {p}" for p in range(people)])
+    start = time.perf_counter()
+    for i in range(frames):
+        frame = base.copy()
+        frame[..., 0] += 20 * np.sin(i / 10 + np.arange(people))[:, None]
+        tracker.update(frame[rng.permutation(people)], i / 10)
+    elapsed = (time.perf_counter() - start) / frames * 1e6
+    print(f"{people} people: {elapsed:.0f} us per frame, {tracker.tracker.next_id} track ids issued, "
+          f"seats {tracker.seat_map.track_of_seat}")
+    return elapsed
+
+
+if __name__ == "__main__":
+    for people in (4, 8, 12):
+        benchmark_tracker(people)
@@ -0,0 +1,181 @@
+import random
+import threading
+import time
+from collections import namedtuple
+
+import cv2
+
+# A decoded frame, when it was captured (time.monotonic) and its sequence number in the stream
+Frame = namedtuple('Frame', ['image', 'timestamp', 'seq'])
+
+# Health states of a LatestFrameGrabber
+CONNECTING = 'connecting'      # first connection attempt(s)
+STREAMING = 'streaming'        # frames are arriving
+RECONNECTING = 'reconnecting'  # the stream dropped, backing off between reopen attempts
+STOPPED = 'stopped'            # released
+
+
+class LatestFrameGrabber:
+    """
+    Decodes a video stream on a background thread, keeps only the newest frame and reconnects when the stream drops.
+
+    Reading an RTSP stream synchronously between slow pose inferences lets OpenCV's buffer fill up, so gestures
+    end up being detected on frames that are seconds old. Here the decoder runs continuously and overwrites a
+    single-slot buffer; the inference loop always gets the most recent frame and older ones are dropped.
+
+    When a read fails the same thread reopens the stream with exponential backoff and jitter, sleeping between
+    attempts, so a camera that is down is neither flooded with RTSP setups nor allowed to peg a core that the
+    pose model and camera controller need.
+
+    Drop-in for the cv2.VideoCapture calls the scripts use (isOpened, read, release).
+
+    Parameters:
+    url (str): Stream URL, e.g. 'rtsp://192.168.100.88/1'.
+    initial_backoff (float): Seconds to wait before the first reopen attempt.
+    max_backoff (float): Upper bound on the wait between reopen attempts.
+    jitter (float): Fraction of the backoff that is randomized, so several clients don't retry in lockstep.
+    """
+
+    def __init__(self, url, initial_backoff=0.5, max_backoff=10.0, jitter=0.3):
+        self.url = url
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._latest = None
+        self._last_read_seq = 0
+        self.state = CONNECTING
+        self.frames_decoded = 0
+        self.frames_dropped = 0  # decoded frames that were overwritten before anyone read them
+        self.reconnects = 0
+        self.reconnect_durations = []  # seconds from losing the stream to reopening it
+
+        self.cap = self._open()
+        if self.cap.isOpened():
+            self.state = STREAMING
+        self._thread = threading.Thread(target=self._decode_loop, name='frame-grabber', daemon=True)
+        self._thread.start()
+
+    def _open(self):
+        cap = cv2.VideoCapture(self.url)
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return cap
+
+    def _set_state(self, state):
+        with self._condition:
+            self.state = state
+            self._condition.notify_all()
+
+    def _backoff_delays(self):
+        delay = self.initial_backoff
+        while True:
+            yield delay * (1 + self.jitter * (2 * random.random() - 1))
+            delay = min(delay * 2, self.max_backoff)
+
+    def _reconnect(self):
+        """Reopens the stream with backoff until it delivers a frame again or the grabber is released."""
+        lost_at = time.monotonic()
+        if self.state == STREAMING:
+            self._set_state(RECONNECTING)
+            print(f"Lost video stream {self.url}, reconnecting.")
+        self.cap.release()
+
+        for attempt, delay in enumerate(self._backoff_delays(), start=1):
+            if self._stop.wait(delay):
+                return
+            self.cap = self._open()
+            if self.cap.isOpened():
+                break
+            self.cap.release()
+            print(f"Error: Couldn't open {self.url} (attempt {attempt}), retrying.")
+
+        self.reconnects += 1
+        self.reconnect_durations.append(time.monotonic() - lost_at)
+
+    def _decode_loop(self):
+        while not self._stop.is_set():
+            if not self.cap.isOpened():
+                self._reconnect()
+                continue
+
+            ret, image = self.cap.read()
+            if not ret:
+                self._reconnect()
+                continue
+
+            with self._condition:
+                self.state = STREAMING
+                self.frames_decoded += 1
+                if self._latest is not None and self._latest.seq > self._last_read_seq:
+                    self.frames_dropped += 1
+                self._latest = Frame(image, time.monotonic(), self.frames_decoded)
+                self._condition.notify_all()
+
+    def isOpened(self):
+        return self.state == STREAMING
+
+    def read_latest(self, timeout=2.0):
+        """
+        Waits for a frame newer than the last one returned and returns it as a Frame.
+
+        Returns:
+        None if no new frame arrived within the timeout, e.g. while reconnecting.
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self.state == STOPPED or (self._latest is not None and self._latest.seq > self._last_read_seq),
+                timeout)
+            if self._latest is None or self._latest.seq <= self._last_read_seq:
+                return None
+            self._last_read_seq = self._latest.seq
+            return self._latest
+
+    def peek(self, after_seq=0, timeout=2.0):
+        """
+        Waits for a frame with a sequence number above after_seq and returns it as a Frame, without marking it
+        as read, so a second consumer (e.g. a camera_motion.MotionEstimator) doesn't take frames from the main loop.
+
+        Returns:
+        None if no such frame arrived within the timeout.
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self.state == STOPPED or (self._latest is not None and self._latest.seq > after_seq),
+                timeout)
+            if self._latest is None or self._latest.seq <= after_seq:
+                return None
+            return self._latest
+
+    def read(self, timeout=2.0):
+        """cv2.VideoCapture-style read of the newest frame: returns (ret, frame)."""
+        frame = self.read_latest(timeout)
+        if frame is None:
+            return False, None
+        return True, frame.image
+
+    def frame_age(self):
+        """Seconds since the newest frame was captured, or None before the first frame."""
+        latest = self._latest
+        return None if latest is None else time.monotonic() - latest.timestamp
+
+    def health(self):
+        """Snapshot of the stream's health and counters, for logging."""
+        durations = self.reconnect_durations
+        return {
+            'state': self.state,
+            'frames_decoded': self.frames_decoded,
+            'frames_dropped': self.frames_dropped,
+            'frame_age': self.frame_age(),
+            'reconnects': self.reconnects,
+            'mean_reconnect_time': sum(durations) / len(durations) if durations else None,
+            'max_reconnect_time': max(durations) if durations else None,
+        }
+
+    def release(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=1.0)
+        self._set_state(STOPPED)
+        self.cap.release()
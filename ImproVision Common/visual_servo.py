@@ -0,0 +1,217 @@
+### VISUAL SERVOING: KEEP A MUSICIAN CENTERED WITH A PID ON NOSE-X ###
+# Tracking mode: python visual_servo.py [camera ip]
+
+import sys
+import time
+from collections import namedtuple
+
+import numpy as np
+
+import pose_models
+from cue_scheduler import SystemClock
+from gestures import stack_keypoints
+
+DEADBAND = 40          # pixels from the frame center within which the camera stops
+RELEASE_BAND = 80      # pixels the nose must drift out before the camera starts moving again
+SETTLE_FRAMES = 3      # consecutive frames inside the dead-band that count as centered
+COMMAND_INTERVAL = 0.2 # seconds between two commands, however often the error changes
+MAX_PAN_SPEED = 24     # PTZOptics pan speeds run from 1 to 24
+MIN_PAN_SPEED = 1
+MIN_NOSE_SCORE = 0.3
+POSE_MODE = 'body' # model for the tracking mode, see pose_models.POSE_MODES
+
+# One centering: from the nose leaving the dead-band to it settling back in
+CenteringReport = namedtuple('CenteringReport', ['settling_time', 'commands', 'start_error', 'final_error'])
+
+
+class PID:
+    """
+    PID controller on a normalized error, with a clamped integral and the derivative taken on the error's
+    change between timestamped samples.
+
+    Parameters:
+    kp, ki, kd (float): Gains.
+    integral_limit (float): Bound of the integral term's accumulator, against wind-up.
+    output_limit (float): The output is clipped to [-output_limit, output_limit].
+    """
+
+    def __init__(self, kp=1.2, ki=0.2, kd=0.1, integral_limit=0.5, output_limit=1.0):
+        self.kp, self.ki, self.kd = kp, ki, kd
+        self.integral_limit = integral_limit
+        self.output_limit = output_limit
+        self.reset()
+
+    def reset(self):
+        self.integral = 0.0
+        self.previous_error = None
+        self.previous_time = None
+
+    def update(self, error, timestamp):
+        derivative = 0.0
+        if self.previous_time is not None and timestamp > self.previous_time:
+            dt = timestamp - self.previous_time
+            self.integral = float(np.clip(self.integral + error * dt, -self.integral_limit, self.integral_limit))
+            derivative = (error - self.previous_error) / dt
+        self.previous_error, self.previous_time = error, timestamp
+        output = self.kp * error + self.ki * self.integral + self.kd * derivative
+        return float(np.clip(output, -self.output_limit, self.output_limit))
+
+
+class CenteringServo:
+    """
+    Pans to keep a nose at the frame center. The PID output sets the pan speed, so the camera slows down as
+    the musician comes to the center instead of overshooting it with fixed pulses.
+
+    Commands are only sent when the direction or speed changes, and no more often than command_interval,
+    so one centering costs a handful of HTTP calls. Inside the dead-band the camera is stopped; it only
+    moves again once the nose drifts beyond the release band.
+
+    Every centering (nose leaves the dead-band until it has been back for settle_frames frames) is reported
+    as a CenteringReport with its settling time and command count, printed and kept in reports.
+
+    Parameters:
+    send (callable): Sends one camera command with a pan speed, e.g. PTZTransport.send.
+    pid (PID): Controller on the error normalized by half the frame width.
+    clock: Time source of stop() and track_person, e.g. SystemClock or a VirtualClock.
+    """
+
+    def __init__(self, send, pid=None, deadband=DEADBAND, release_band=RELEASE_BAND, settle_frames=SETTLE_FRAMES,
+                 command_interval=COMMAND_INTERVAL, max_speed=MAX_PAN_SPEED, min_speed=MIN_PAN_SPEED, clock=SystemClock):
+        self.send = send
+        self.pid = pid or PID()
+        self.deadband = deadband
+        self.release_band = release_band
+        self.settle_frames = settle_frames
+        self.command_interval = command_interval
+        self.max_speed = max_speed
+        self.min_speed = min_speed
+        self.clock = clock
+        self.reports = []
+
+        self.moving = None  # (direction, speed) last sent, None when stopped
+        self.centered = True
+        self._last_command = -np.inf
+        self._started = None  # (timestamp, error) of the current centering
+        self._commands = 0
+        self._frames_inside = 0
+
+    def _command(self, command, timestamp, speed=None):
+        if speed is None:
+            self.send(command)
+        else:
+            self.send(command, speed)
+        self._last_command = timestamp
+        self._commands += 1
+
+    def stop(self, timestamp=None):
+        """Stops the camera if it is moving. timestamp defaults to the servo's clock."""
+        if self.moving is not None:
+            self._command("ptzstop", self.clock.monotonic() if timestamp is None else timestamp)
+            self.moving = None
+
+    def update(self, nose_x, timestamp, frame_width=1920):
+        """
+        Steers towards one measurement of the nose position.
+
+        Parameters:
+        nose_x (float): Nose x in pixels, None if the musician wasn't found (the camera is stopped).
+        timestamp (float): When the frame was captured.
+
+        Returns:
+        A CenteringReport when a centering has just settled, else None.
+        """
+        if nose_x is None:
+            self.stop(timestamp)
+            self.pid.reset()
+            return None
+        error = nose_x - frame_width / 2
+
+        if self.centered:
+            if abs(error) <= self.release_band:
+                return None
+            self.centered = False
+            self._started = (timestamp, error)
+            self._commands = 0
+            self._frames_inside = 0
+            self.pid.reset()
+
+        if abs(error) <= self.deadband:
+            self.stop(timestamp)
+            self.pid.reset()
+            self._frames_inside += 1
+            if self._frames_inside < self.settle_frames:
+                return None
+            started_at, start_error = self._started
+            report = CenteringReport(timestamp - started_at, self._commands, start_error, error)
+            self.reports.append(report)
+            self.centered = True
+            print(f"Centered in {report.settling_time:.2f} s with {report.commands} commands "
+                  f"({start_error:+.0f} px -> {error:+.0f} px)")
+            return report
+        self._frames_inside = 0
+
+        output = self.pid.update(error / (frame_width / 2), timestamp)
+        speed = int(np.clip(round(abs(output) * self.max_speed), self.min_speed, self.max_speed))
+        wanted = ("right" if output > 0 else "left", speed)
+        if wanted != self.moving and timestamp - self._last_command >= self.command_interval:
+            self._command(wanted[0], timestamp, speed)
+            self.moving = wanted
+        return None
+
+    def summary(self):
+        """Mean settling time and commands per centering over the reports so far, or None."""
+        if not self.reports:
+            return None
+        return {
+            'centerings': len(self.reports),
+            'mean_settling_time': float(np.mean([r.settling_time for r in self.reports])),
+            'mean_commands': float(np.mean([r.commands for r in self.reports])),
+        }
+
+
+def target_nose(results, previous_x):
+    """
+    Nose x of the person to follow: the one nearest to previous_x, where the target was last seen
+    (start with the frame center). None if nobody's nose is visible.
+    """
+    if not len(results):
+        return None
+    noses = stack_keypoints(results)[:, pose_models.NOSE]
+    noses = noses[noses[:, 2] >= MIN_NOSE_SCORE]
+    if not len(noses):
+        return None
+    return float(noses[np.argmin(np.abs(noses[:, 0] - previous_x)), 0])
+
+
+def track_person(cap, model, servo, frame_width=1920):
+    """Keeps the person nearest the center centered until interrupted; prints the servo summary at the end."""
+    previous_x = frame_width / 2
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                servo.stop()
+                continue
+            now = servo.clock.monotonic()
+            timestamp = now - (cap.frame_age() or 0) if hasattr(cap, 'frame_age') else now
+            nose_x = target_nose(pose_models.estimate_poses(model, frame), previous_x)
+            if nose_x is not None:
+                previous_x = nose_x
+            servo.update(nose_x, timestamp, frame.shape[1])
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servo.stop()
+        print(servo.summary())
+
+
+if __name__ == "__main__":
+    from ptz_transport import PTZTransport
+    from video_source import LatestFrameGrabber
+
+    camera_ip = sys.argv[1] if len(sys.argv) > 1 else "192.168.100.88"
+    camera = PTZTransport(camera_ip)
+    camera.send("home")
+    time.sleep(4)
+    model = pose_models.init_pose_model(POSE_MODE, 'cuda')
+    track_person(LatestFrameGrabber(f'rtsp://{camera_ip}/1'), model, CenteringServo(camera.send))
@@ -3,13 +3,19 @@ import re
 from typing import List, Tuple
 import math
 import itertools
-import requests
+import os
+import sys
 import time
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ImproVision Common'))
+from ptz_transport import PTZTransport
+from cue_scheduler import CueScheduler
+from movement_compiler import compile_movement, compile_sweep
 
 DEVICE = 'cuda'
 CAMERA_IP = "192.168.100.88"
-BASE_URL = f'http://{CAMERA_IP}/cgi-bin/ptzctrl.cgi?ptzcmd&'
+CAMERA = PTZTransport(CAMERA_IP)
+SCHEDULER = CueScheduler(CAMERA.send)
 
 
 ### CHORD ANALYSIS FUNCTIONS ###
@@ -157,116 +163,18 @@ def send_camera_control(command, pan_speed=24, tilt_speed=20, focus_speed=10, zo
     """
     Sends a command to the camera with optional speed parameters and checks the response status.
     """
-    def build_cgi_url(command, pan_speed, tilt_speed, focus_speed, zoom_speed):
-        """
-        Constructs the camera control URL based on the command and speeds provided.
-        """
-        action = command.lower()
-        if action in ["up", "down", "left", "right"]:
-            return f"{BASE_URL}{action}&{pan_speed}&{tilt_speed}"
-        elif action in ["home", "ptzstop"]:
-            return f"{BASE_URL}{action}"
-        elif action in ["focusin", "focusout", "focusstop"]:
-            return f"{BASE_URL}{action}&{focus_speed}"
-        elif action in ["zoomin", "zoomout", "zoomstop"]:
-            return f"{BASE_URL}{action}&{zoom_speed}"
-        else:
-            return f"{BASE_URL}home&10&10"
-
-    url = build_cgi_url(command, pan_speed, tilt_speed, focus_speed, zoom_speed)
-    #print(f"Sending camera command: {url}")  # Print the URL for debugging
-    response = requests.get(url)
-    if response.status_code == 200:
-        print(f"Command '{command}' was successful")
-        return "success"
-    else:
-        print(f"Failed to execute command '{command}'")
-        return "failure"
+    return CAMERA.send(command, pan_speed, tilt_speed, focus_speed, zoom_speed) # one keep-alive connection, see ptz_transport
 
 def execute_movement_for_instrument(movement):
     #print(f"Executing movement: {movement}")  # Print the movement being executed
-    if movement == "up half":
-        send_camera_control("up")
-        time.sleep(0.7)
-        send_camera_control("ptzstop")
-        time.sleep(0.7)
-        send_camera_control("down")
-        time.sleep(0.6)
-        send_camera_control("ptzstop")
-    elif movement == "up whole":
-        send_camera_control("up")
-        time.sleep(0.6)
-        send_camera_control("ptzstop")
-        time.sleep(0.5)
-        send_camera_control("up")
-        time.sleep(0.6)
-        send_camera_control("ptzstop")
-        time.sleep(0.7)
-        send_camera_control("down")
-        time.sleep(0.75)
-        send_camera_control("ptzstop")
-    elif movement == "down half":
-        send_camera_control("down")
-        time.sleep(0.7)
-        send_camera_control("ptzstop")
-        time.sleep(0.7)
-        send_camera_control("up")
-        time.sleep(0.7)
-        send_camera_control("ptzstop")
-    elif movement == "down whole":
-        send_camera_control("down")
-        time.sleep(0.5)
-        send_camera_control("ptzstop")
-        time.sleep(0.5)
-        send_camera_control("down")
-        time.sleep(0.5)
-        send_camera_control("ptzstop")
-        time.sleep(0.7)
-        send_camera_control("up")
-        time.sleep(0.7)
-        send_camera_control("ptzstop")
-    elif movement == "stay":
-        # No movement required
-        time.sleep(1)
+    SCHEDULER.run(compile_movement(movement))
     print(f"Finished executing movement: {movement}")  
 
 def execute_chord_movements(chord, movements):
-    # Center
-    send_camera_control("home")
-    time.sleep(1)
-
-    # Start by panning to the far left
-    send_camera_control("left")  
-    time.sleep(0.7)
-    send_camera_control("ptzstop")
-
-    # Iterate over notes in the chord
-    for i, (note, movement) in enumerate(zip(chord, movements)):
-        time.sleep(0.5)
-        print(f"Executing movement for {note}: {movement}")
-        execute_movement_for_instrument(movement)
-        
-        time.sleep(0.5)
-        
-        # Pan to the next note position on the right
-        if i < len(chord) - 1:
-            send_camera_control("right")
-            time.sleep(0.5)  
-            send_camera_control("ptzstop")
-    
-    # Final 'slam' cue
-    send_camera_control("home")
-    time.sleep(2)
-    send_camera_control('ptzstop')
-    time.sleep(0.5)
-    send_camera_control('up')
-    time.sleep(0.7)
-    send_camera_control('down')
-    time.sleep(1.5)
-    send_camera_control('ptzstop')
-    time.sleep(2)
-    send_camera_control('home')
-    time.sleep(1)
+    # Compiled sweep: center, pan to the far left, then each note position towards the right, then the 'slam' cue
+    for note, movement in zip(chord, movements):
+        print(f"Movement for {note}: {movement}")
+    SCHEDULER.run(compile_sweep(tuple(movements)))
 
 def main():
     HOST = '127.0.0.1'  # The server's hostname or IP address
@@ -1,35 +1,55 @@
+import argparse
 import socket
 import re
 from typing import List, Tuple
 import math
 import itertools
-import requests
+import os
 import time
 import cv2
 import numpy as np
-from mmpose.apis import init_model, inference_topdown
 import sys
 from itertools import product
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ImproVision Common'))
+from ptz_transport import PTZTransport
+from cue_scheduler import CommandRecorder, CueScheduler, SystemClock, VirtualClock
+from movement_compiler import compile_movement, compile_sweep
+from video_source import LatestFrameGrabber
+from pose_service import PoseClient
+from gestures import GestureStateMachine, stack_keypoints
+from keypoint_filters import apply_filter, make_keypoint_filter
+from tracking import PersonTracker
+import pose_models
 
 # Constants
 DEVICE = 'cuda'
+POSE_MODE = 'wholebody' # or 'body' / 'body-tiny' for the lighter 17-keypoint models, see pose_models.POSE_MODES
+POSE_BACKEND = 'pytorch' # or 'onnx' to run on CPU with ONNX Runtime (export with pose_onnx.py first)
+POSE_INT8 = False # with the onnx backend, use the int8-quantized model
+POSE_SERVICE = False # use the shared pose_service.py (model and stream already loaded) instead of loading them here
+DETECT_PEOPLE = True # one pose per musician (RTMDet person detector), so gestures are told apart by person
 CAMERA_IP = "192.168.100.88"
-BASE_URL = f'http://{CAMERA_IP}/cgi-bin/ptzctrl.cgi?ptzcmd&'
-HAND_RAISE_THRESHOLD = 50  
-HEAD_PROXIMITY_THRESHOLD = 100  
+CAMERA = PTZTransport(CAMERA_IP)
+RTSP_URL = f'rtsp://{CAMERA_IP}/1'
+SCHEDULER = CueScheduler(CAMERA.send)
+# Gesture thresholds in shoulder widths rather than pixels, so they hold at any distance from the camera.
+# A gesture has to be held for GESTURE_HOLD_MS before it counts, so a high bow stroke doesn't trigger it.
+HAND_RAISE_THRESHOLD = 0.3 # wrist above the nose
+HEAD_PROXIMITY_THRESHOLD = 0.6 # wrist to nose distance
+GESTURE_HOLD_MS = 300
+GESTURE_STATE = GestureStateMachine(raise_enter=HAND_RAISE_THRESHOLD, head_enter=HEAD_PROXIMITY_THRESHOLD,
+                                    head_release=HEAD_PROXIMITY_THRESHOLD + 0.2, hold_ms=GESTURE_HOLD_MS)
+KEYPOINT_FILTER = None # or 'one-euro' / 'kalman' to smooth jittery keypoints at low inference FPS, see keypoint_filters
+KEYPOINT_SMOOTHER = make_keypoint_filter(KEYPOINT_FILTER)
+# Stable ids across frames, so hold timers and smoothing stay with each musician whatever order mmpose lists them in
+TRACKER = PersonTracker()
+# A person with a hand raised and a hand at their head at once is ambiguous, as in the original per-frame check
+EXCLUSIVE_GESTURES = {"hand_raised": "hand_to_head", "hand_to_head": "hand_raised"}
 
 
 ### POSE FUNCTIONS ###
 
-def init_pose_model():
-    """
-    Initializes the pose model for human pose estimation.
-    """
-    model_cfg = '/home/cvrr/mmpose/configs/body_2d_keypoint/rtmpose/coco/rtmpose-m_8xb64-270e_coco-wholebody-256x192.py'
-    ckpt = 'https://download.openmmlab.com/mmpose/v1/projects/rtmposev1/rtmpose-m_simcc-coco-wholebody_pt-aic-coco_270e-256x192-cd5e845c_20230123.pth'
-    return init_model(model_cfg, ckpt, device=DEVICE)
-
 def draw_keypoints(frame, keypoints, color=(0, 255, 0)):
     """
     Draws keypoints on camera stream.
@@ -42,62 +62,55 @@ def draw_keypoints(frame, keypoints, color=(0, 255, 0)):
             cv2.circle(frame, (int(keypoint[0]), int(keypoint[1])), 3, color, -1)
             cv2.putText(frame, str(i), (int(keypoint[0]), int(keypoint[1])), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 1)
 
-def detect_gestures(keypoints):
+def detect_gestures(keypoints, timestamp, scores=None, ids=None):
     """
-    Detects two gestures: Raised Hand and Hand to Head
+    Detects two gestures: Raised Hand and Hand to Head, for every person at once.
+    A gesture doesn't count while the same person is also making the other one (see EXCLUSIVE_GESTURES).
+
+    Parameters:
+    keypoints (np.ndarray): (persons, K, 3) keypoints with scores, see gestures.stack_keypoints.
+    timestamp (float): Capture time of the frame (the stream loop's clock.monotonic).
+    ids (np.ndarray): Track id of each person, see TRACKER; -1 for untracked people, who make no gestures.
+
+    Returns:
+    (gesture, person) pairs for the gestures that have just been held long enough, see GESTURE_STATE.
     """
-    nose = keypoints[0]
-    left_wrist = keypoints[9]
-    right_wrist = keypoints[10]
-    
-    # Detect Raised Hand
-    left_hand_raised = left_wrist[1] < nose[1] - HAND_RAISE_THRESHOLD
-    right_hand_raised = right_wrist[1] < nose[1] - HAND_RAISE_THRESHOLD
-    
-    # Detect Hand to Head
-    left_hand_to_head = np.linalg.norm(np.array(left_wrist[:2]) - np.array(nose[:2])) < HEAD_PROXIMITY_THRESHOLD
-    right_hand_to_head = np.linalg.norm(np.array(right_wrist[:2]) - np.array(nose[:2])) < HEAD_PROXIMITY_THRESHOLD
-    
-    return (left_hand_raised or right_hand_raised), (left_hand_to_head or right_hand_to_head)
+    return [(gesture, person) for gesture, person in GESTURE_STATE.update(keypoints, timestamp, scores, ids)
+            if gesture in EXCLUSIVE_GESTURES and not GESTURE_STATE.is_holding(EXCLUSIVE_GESTURES[gesture], person)]
 
-def process_video_stream(cap, model):
+def process_video_stream(cap, model, clock=SystemClock):
     """
-    Main video processing loop.
+    Main video processing loop. clock times the warm-up and the frames, e.g. SystemClock or a VirtualClock.
     """
-    start_time = time.time()
+    start_time = clock.monotonic()
     while True:
         ret, frame = cap.read()
         if not ret:
-            print("Failed to read frame from camera. Attempting Camera Stream restart.")
-            cap.release()
-            cv2.destroyAllWindows()
-            while not cap.isOpened():
-                cap = cv2.VideoCapture(f'rtsp://{CAMERA_IP}/1')
-                if cap.isOpened():
-                    ret, frame = cap.read()
-                else:
-                    print("Error: Couldn't open the camera. Attempting restart.")
-                    time.sleep(1)
+            # The grabber reconnects on its own thread with backoff; read() just waits for the next frame
+            print(f"Failed to read frame from camera. Stream health: {cap.health()}")
+            continue
 
-        if time.time() - start_time < 3:
+        if clock.monotonic() - start_time < 3:
             cv2.imshow('Camera Stream', frame)
             if cv2.waitKey(1) & 0xFF == ord('q'):
                 break
             continue  # Skip detection for the first 3 seconds
 
-        result = inference_topdown(model, frame)
+        result = pose_models.estimate_poses(model, frame)
         if len(result) > 0:
-            for person in result:
-                keypoints = person.pred_instances.keypoints[0]
+            timestamp = clock.monotonic() - (cap.frame_age() or 0)
+            people_keypoints = stack_keypoints(result)
+            ids = TRACKER.update(people_keypoints, timestamp)
+            people_keypoints = apply_filter(KEYPOINT_SMOOTHER, people_keypoints, timestamp, ids=ids)
+            for keypoints in people_keypoints:
                 draw_keypoints(frame, keypoints)
 
-                hand_raised, hand_to_head = detect_gestures(keypoints)
-
-                if hand_raised and not hand_to_head:
+            for gesture, person in detect_gestures(people_keypoints, timestamp, ids=ids):
+                if gesture == "hand_raised":
                     print("Hand Raised detected!")
                     save_image(frame, "hand_raised.jpg")
                     return "Hand Raised"
-                elif hand_to_head and not hand_raised:
+                else:
                     print("Hand to Head detected!")
                     save_image(frame, "hand_to_head.jpg")
                     return "Hand to Head"
@@ -207,6 +220,20 @@ def find_closest_constrained_chord(notes, desired_quality, max_movement=2):
     else:
         return None, float('inf')
 
+def note_movements(original_chord, new_chord):
+    """Movement of each note from one chord to the other: "stay", "up half", "down whole", ..."""
+    movements = []
+    for original, new in zip(original_chord, new_chord):
+        semitone_diff = note_to_midi(new) - note_to_midi(original)
+        if semitone_diff == 0:
+            movement = "stay"
+        elif semitone_diff > 0:
+            movement = "up whole" if semitone_diff == 2 else "up half"
+        else:
+            movement = "down whole" if semitone_diff == -2 else "down half"
+        movements.append(movement)
+    return movements
+
 
 
 
@@ -216,124 +243,62 @@ def send_camera_control(command, pan_speed=24, tilt_speed=20, focus_speed=10, zo
     """
     Sends a command to the camera with optional speed parameters and checks the response status.
     """
-    def build_cgi_url(command, pan_speed, tilt_speed, focus_speed, zoom_speed):
-        """
-        Constructs the camera control URL based on the command and speeds provided.
-        """
-        action = command.lower()
-        if action in ["up", "down", "left", "right"]:
-            return f"{BASE_URL}{action}&{pan_speed}&{tilt_speed}"
-        elif action in ["home", "ptzstop"]:
-            return f"{BASE_URL}{action}"
-        elif action in ["focusin", "focusout", "focusstop"]:
-            return f"{BASE_URL}{action}&{focus_speed}"
-        elif action in ["zoomin", "zoomout", "zoomstop"]:
-            return f"{BASE_URL}{action}&{zoom_speed}"
-        else:
-            return f"{BASE_URL}home&10&10"
-
-    url = build_cgi_url(command, pan_speed, tilt_speed, focus_speed, zoom_speed)
-    #print(f"Sending camera command: {url}")  # Print the URL for debugging
-    response = requests.get(url)
-    if response.status_code == 200:
-        print(f"Command '{command}' was successful")
-        return "success"
-    else:
-        print(f"Failed to execute command '{command}'")
-        return "failure"
+    return CAMERA.send(command, pan_speed, tilt_speed, focus_speed, zoom_speed) # one keep-alive connection, see ptz_transport
 
 def execute_movement_for_instrument(movement):
     #print(f"Executing movement: {movement}")  # Print the movement being executed
-    if movement == "up half":
-        send_camera_control("up")
-        time.sleep(0.7)
-        send_camera_control("ptzstop")
-        time.sleep(0.7)
-        send_camera_control("down")
-        time.sleep(0.6)
-        send_camera_control("ptzstop")
-    elif movement == "up whole":
-        send_camera_control("up")
-        time.sleep(0.6)
-        send_camera_control("ptzstop")
-        time.sleep(0.5)
-        send_camera_control("up")
-        time.sleep(0.6)
-        send_camera_control("ptzstop")
-        time.sleep(0.7)
-        send_camera_control("down")
-        time.sleep(0.75)
-        send_camera_control("ptzstop")
-    elif movement == "down half":
-        send_camera_control("down")
-        time.sleep(0.7)
-        send_camera_control("ptzstop")
-        time.sleep(0.7)
-        send_camera_control("up")
-        time.sleep(0.7)
-        send_camera_control("ptzstop")
-    elif movement == "down whole":
-        send_camera_control("down")
-        time.sleep(0.5)
-        send_camera_control("ptzstop")
-        time.sleep(0.5)
-        send_camera_control("down")
-        time.sleep(0.5)
-        send_camera_control("ptzstop")
-        time.sleep(0.7)
-        send_camera_control("up")
-        time.sleep(0.7)
-        send_camera_control("ptzstop")
-    elif movement == "stay":
-        # No movement required
-        time.sleep(1)
+    SCHEDULER.run(compile_movement(movement))
     print(f"Finished executing movement: {movement}")  
 
 def execute_chord_movements(chord, movements):
-    # Center
-    send_camera_control("home")
-    time.sleep(1)
-
-    # Start by panning to the far left
-    send_camera_control("left")  
-    time.sleep(0.7)
-    send_camera_control("ptzstop")
-
-    # Iterate over notes in the chord
-    for i, (note, movement) in enumerate(zip(chord, movements)):
-        time.sleep(0.5)
-        print(f"Executing movement for {note}: {movement}")
-        execute_movement_for_instrument(movement)
-        
-        time.sleep(0.5)
-        
-        # Pan to the next note position on the right
-        if i < len(chord) - 1:
-            send_camera_control("right")
-            time.sleep(0.5)  
-            send_camera_control("ptzstop")
-    
-    # Final 'slam' cue
-    send_camera_control("home")
-    time.sleep(2)
-    send_camera_control('ptzstop')
-    time.sleep(0.5)
-    send_camera_control('up')
-    time.sleep(0.7)
-    send_camera_control('down')
-    time.sleep(1.5)
-    send_camera_control('ptzstop')
-    time.sleep(2)
-    send_camera_control('home')
-    time.sleep(1)
-
+    # Compiled sweep: center, pan to the far left, then each note position towards the right, then the 'slam' cue
+    for note, movement in zip(chord, movements):
+        print(f"Movement for {note}: {movement}")
+    SCHEDULER.run(compile_sweep(tuple(movements)))
 
+def simulate_chord_changes(chord_movements, clock=None):
+    """
+    Plays the sweeps of a sequence of chord changes back to back on a virtual clock, recording the commands
+    instead of moving the camera, and returns the recorded schedule, a list of ScheduledCommand with their
+    virtual send times.
 
+    Parameters:
+    chord_movements (list): One list of note movements (e.g. ["stay", "up half", ...]) per chord change.
+    clock (VirtualClock): Clock to play on, a new one starting at 0 by default.
+    """
+    clock = clock or VirtualClock()
+    recorder = CommandRecorder(clock.monotonic)
+    scheduler = CueScheduler(recorder.send, clock=clock.monotonic, sleep=clock.sleep)
+    start, wall_start = clock.monotonic(), time.perf_counter()
+    for movements in chord_movements:
+        scheduler.run(compile_sweep(tuple(movements)), verbose=False)
+    print(f"Simulated {len(chord_movements)} chord changes: {len(recorder.schedule)} commands over "
+          f"{clock.monotonic() - start:.1f} s in {time.perf_counter() - wall_start:.3f} s")
+    return recorder.schedule
+
+def simulate_chords(chords, qualities=("Major", "Minor")):
+    """
+    Works out the change of every chord to every quality, as main() does for the detected notes, and replays
+    the camera sweeps with simulate_chord_changes (--simulate), without camera, video or pitch server.
 
+    Parameters:
+    chords (list): Chords as lists of note names, e.g. [["C4", "E4", "A4"]].
+    """
+    chord_movements = []
+    for chord, quality in product(chords, qualities):
+        closest_chord, _ = find_closest_constrained_chord(chord, quality)
+        if closest_chord:
+            chord_movements.append(note_movements(chord, closest_chord))
+        else:
+            print(f"No {quality} chord variation of {chord} found within constraints.")
+    return simulate_chord_changes(chord_movements)
 
 def main():
-    model = init_pose_model()
-    cap = cv2.VideoCapture(f'rtsp://{CAMERA_IP}/1')
+    if POSE_SERVICE:
+        cap = model = PoseClient() # frames and keypoints from the shared pose service
+    else:
+        model = pose_models.init_pose_model(POSE_MODE, DEVICE, POSE_BACKEND, POSE_INT8, person_detector=DETECT_PEOPLE)
+        cap = LatestFrameGrabber(RTSP_URL) # decodes on a background thread, always hands out the newest frame
     if not cap.isOpened():
         print("Error: Couldn't open the camera.")
         sys.exit(1)
@@ -386,23 +351,14 @@ def main():
                         print(f"Total Semitone Movement: {total_movement}")
 
                         # Calculate movements for each note
-                        note_movements = []
-                        for original, new in zip(original_chord, closest_chord):
-                            semitone_diff = note_to_midi(new) - note_to_midi(original)
-                            if semitone_diff == 0:
-                                movement = "stay"
-                            elif semitone_diff > 0:
-                                movement = "up whole" if semitone_diff == 2 else "up half"
-                            else:
-                                movement = "down whole" if semitone_diff == -2 else "down half"
-                            note_movements.append(movement)
+                        movements = note_movements(original_chord, closest_chord)
 
                         print("\nMovements for each note:")
-                        for original, new, movement in zip(original_chord, closest_chord, note_movements):
+                        for original, new, movement in zip(original_chord, closest_chord, movements):
                             print(f"Move {original} to {new}: {movement}")
 
                         print("\nStarting camera movements:")
-                        execute_chord_movements(closest_chord, note_movements)
+                        execute_chord_movements(closest_chord, movements)
                     else:
                         print(f"\nNo {desired_quality} chord variation found within constraints.")
 
@@ -421,4 +377,16 @@ def main():
     cv2.destroyAllWindows()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Steer the quartet to a major or minor chord with gestures.")
+    parser.add_argument('--simulate', action='store_true',
+                        help="Replay the chord changes of --chords on a virtual clock without camera, video or pitch "
+                             "server and print the command schedule")
+    parser.add_argument('--chords', nargs='+', default=["C4,E4,A4", "D4,F4,B4", "E4,G4,C5", "G3,B3,E4"],
+                        help="With --simulate, the chords to change, each as comma-separated notes")
+    args = parser.parse_args()
+
+    if args.simulate:
+        for command in simulate_chords([chord.split(',') for chord in args.chords]):
+            print(f"{command.time:8.3f}  {command.command} {' '.join(map(str, command.args))}")
+        sys.exit()
     main()
\ No newline at end of file
@@ -0,0 +1,94 @@
+### BATCH ANALYSIS OF A MIDI CORPUS FOR THE GUIDED HARMONY GAME ###
+# Usage: python analyze_corpus.py <midi directory> [-o corpus_summary.npz] [-j workers]
+
+import argparse
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from score_analysis import IRREGULAR, MOVEMENT_NAMES, NO_MOVEMENT, robot_instruction_matrix
+
+MIDI_EXTENSIONS = ('.mid', '.midi')
+HISTOGRAM_CODES = [0, 1, 2, -1, -2, IRREGULAR, NO_MOVEMENT]
+HISTOGRAM_COLUMNS = [MOVEMENT_NAMES.get(code, "none").replace(" ", "_") for code in HISTOGRAM_CODES]
+
+
+def find_midi_files(directory):
+    """All MIDI files below a directory, sorted so the output order is reproducible."""
+    midi_files = []
+    for root, _, files in os.walk(directory):
+        midi_files += [os.path.join(root, f) for f in files if f.lower().endswith(MIDI_EXTENSIONS)]
+    return sorted(midi_files)
+
+
+def analyze_file(midi_file_name):
+    """
+    Summarizes one MIDI file for screening: number of measures and instruments, a histogram of movement codes
+    (including the irregular step count, column 'irregular') and the largest number of musicians that have to
+    move in the same measure.
+
+    Returns:
+    A dict of column -> value. Files that can't be parsed get measures = -1 and the error message.
+    """
+    row = {'path': midi_file_name, 'measures': -1, 'instruments': 0, 'max_simultaneous_movers': 0, 'error': ''}
+    row.update({column: 0 for column in HISTOGRAM_COLUMNS})
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore') # pretty_midi warns about every slightly malformed file
+            codes = robot_instruction_matrix(midi_file_name).codes
+    except Exception as e:
+        row['error'] = f"{type(e).__name__}: {e}"
+        return row
+
+    row['measures'], row['instruments'] = codes.shape
+    counts = np.bincount(codes.ravel().astype(np.int16) + 128, minlength=256)
+    for code, column in zip(HISTOGRAM_CODES, HISTOGRAM_COLUMNS):
+        row[column] = int(counts[code + 128])
+    if codes.size:
+        movers = (codes != 0) & (np.abs(codes.astype(np.int16)) <= 2) # half and whole steps, the ones the robot cues
+        row['max_simultaneous_movers'] = int(movers.sum(axis=1).max())
+    return row
+
+
+def analyze_corpus(midi_files, workers=None):
+    """
+    Fans analyze_file out over a process pool.
+
+    Returns:
+    A dict of column -> NumPy array with one entry per file, in the order of midi_files.
+    """
+    workers = workers or os.cpu_count()
+    chunksize = max(1, len(midi_files) // (workers * 16)) # big enough to amortize IPC, small enough to balance load
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        rows = list(pool.map(analyze_file, midi_files, chunksize=chunksize))
+
+    columns = ['path', 'measures', 'instruments'] + HISTOGRAM_COLUMNS + ['max_simultaneous_movers', 'error']
+    table = {column: np.array([row[column] for row in rows]) for column in columns}
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Screen a directory of MIDI files for the Guided Harmony game.")
+    parser.add_argument('directory', help="Directory searched recursively for .mid/.midi files")
+    parser.add_argument('-o', '--output', default='corpus_summary.npz', help="Columnar output file (.npz)")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="Worker processes (default: all cores)")
+    args = parser.parse_args()
+
+    midi_files = find_midi_files(args.directory)
+    print(f"Found {len(midi_files)} MIDI files in {args.directory}")
+
+    start = time.perf_counter()
+    table = analyze_corpus(midi_files, args.workers)
+    elapsed = time.perf_counter() - start
+
+    np.savez_compressed(args.output, **table)
+    failed = int((table['measures'] < 0).sum()) if len(midi_files) else 0
+    print(f"Analyzed {len(midi_files)} files in {elapsed:.1f} s ({len(midi_files) / max(elapsed, 1e-9):.0f} files/s), "
+          f"{failed} failed. Summary written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
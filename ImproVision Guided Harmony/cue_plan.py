@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import time
+
+from cue_scheduler import Timeline
+from movement_compiler import MOVEMENT_VOCABULARY, SLAM_CUE, compile_sweep
+from score_analysis import MOVEMENT_NAMES, robot_instruction_matrix
+
+PLAN_FORMAT_VERSION = 2
+CUE_PLAN_DIR = '.cue_plans'  # created next to the MIDI file
+
+
+class CuePlan:
+    """
+    Precompiled camera cues for a whole score: per measure, the movement of every instrument in
+    instrument_order and the single compiled timeline that performs them.
+
+    Measure numbers are 1-indexed, as in robot_instructions. pan_offsets are the calibrated pan offsets
+    (see pan_map) and preset_slots the camera presets (see ptz_presets) the sweeps were compiled for.
+    """
+
+    def __init__(self, midi_sha256, instrument_order, movements, timelines, pan_offsets=None, preset_slots=None):
+        self.midi_sha256 = midi_sha256
+        self.instrument_order = list(instrument_order)
+        self.pan_offsets = None if pan_offsets is None else tuple(pan_offsets)
+        self.preset_slots = None if preset_slots is None else tuple(preset_slots)
+        self.movements = movements  # list of tuples, one movement (or None) per instrument
+        self.timelines = timelines  # list of Timeline, one per measure
+
+    def __len__(self):
+        return len(self.timelines)
+
+    def measure(self, measure_number):
+        """Timeline for the given measure number."""
+        return self.timelines[measure_number - 1]
+
+    def measure_movements(self, measure_number):
+        """Dict of instrument -> movement for the given measure number, like one entry of robot_instructions."""
+        return dict(zip(self.instrument_order, self.movements[measure_number - 1]))
+
+    def to_dict(self):
+        return {
+            'format_version': PLAN_FORMAT_VERSION,
+            'midi_sha256': self.midi_sha256,
+            'vocabulary': vocabulary_fingerprint(),
+            'instrument_order': self.instrument_order,
+            'pan_offsets': None if self.pan_offsets is None else list(self.pan_offsets),
+            'preset_slots': None if self.preset_slots is None else list(self.preset_slots),
+            'movements': [list(m) for m in self.movements],
+            'timelines': [t.to_dict() for t in self.timelines],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['midi_sha256'], data['instrument_order'],
+                   [tuple(m) for m in data['movements']],
+                   [Timeline.from_dict(t) for t in data['timelines']], data.get('pan_offsets'), data.get('preset_slots'))
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+
+def file_sha256(path):
+    """SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def vocabulary_fingerprint():
+    """Short hash of everything besides the MIDI file that the compiled timelines depend on."""
+    source = repr((sorted(MOVEMENT_VOCABULARY.items()), SLAM_CUE.events, SLAM_CUE.duration))
+    return hashlib.sha256(source.encode()).hexdigest()[:16]
+
+
+def cache_file_name(midi_sha256, pan_offsets=None, preset_slots=None):
+    """
+    Cache file of a plan: the MIDI hash plus how the plan aims (fixed pans, pan offsets or presets, with a hash
+    of the offsets / slots), so plans compiled for different aiming don't overwrite each other.
+    """
+    if preset_slots is not None:
+        aiming = 'presets-' + hashlib.sha256(repr(list(preset_slots)).encode()).hexdigest()[:8]
+    elif pan_offsets is not None:
+        aiming = 'pan-' + hashlib.sha256(repr(list(pan_offsets)).encode()).hexdigest()[:8]
+    else:
+        aiming = 'fixed'
+    return f'{midi_sha256}-{aiming}.json'
+
+
+def compile_cue_plan(midi_file_name, instrument_order, midi_sha256=None, pan_offsets=None, preset_slots=None):
+    """
+    Parses the MIDI file once and compiles the camera timeline of every measure.
+
+    Parameters:
+    midi_file_name (str): The path to the MIDI file.
+    instrument_order (list): Instruments from left to right, e.g. INSTRUMENT_ORDER.
+    pan_offsets (tuple): Calibrated pan offset of each instrument (PanMap.offsets_for), None for fixed pans.
+    preset_slots (tuple): Camera preset of each instrument (PresetManager.slots_for); used instead of pans.
+    """
+    midi_sha256 = midi_sha256 or file_sha256(midi_file_name)
+    codes = robot_instruction_matrix(midi_file_name).select(instrument_order).codes
+    movements = [tuple(MOVEMENT_NAMES.get(code) for code in row) for row in codes.tolist()] # NO_MOVEMENT -> None
+    pan_offsets = None if pan_offsets is None else tuple(pan_offsets)
+    preset_slots = None if preset_slots is None else tuple(preset_slots)
+    timelines = [compile_sweep(m, pan_offsets, preset_slots) for m in movements]
+    return CuePlan(midi_sha256, instrument_order, movements, timelines, pan_offsets, preset_slots)
+
+
+def load_cue_plan(midi_file_name, instrument_order, cache_dir=None, pan_offsets=None, preset_slots=None):
+    """
+    Returns the cue plan for a MIDI file, compiling it only if there is no valid plan cached on disk.
+
+    Plans are cached in cache_dir, one file per MIDI file and aiming (see cache_file_name), and are recompiled
+    when the instrument order or the movement vocabulary have changed since they were written.
+    """
+    start = time.perf_counter()
+    midi_sha256 = file_sha256(midi_file_name)
+    cache_dir = cache_dir or os.path.join(os.path.dirname(os.path.abspath(midi_file_name)), CUE_PLAN_DIR)
+    cache_path = os.path.join(cache_dir, cache_file_name(midi_sha256, pan_offsets, preset_slots))
+
+    if os.path.exists(cache_path):
+        with open(cache_path) as f:
+            data = json.load(f)
+        if (data.get('format_version') == PLAN_FORMAT_VERSION
+                and data.get('vocabulary') == vocabulary_fingerprint()
+                and data.get('instrument_order') == list(instrument_order)
+                and data.get('pan_offsets') == (None if pan_offsets is None else list(pan_offsets))
+                and data.get('preset_slots') == (None if preset_slots is None else list(preset_slots))):
+            plan = CuePlan.from_dict(data)
+            print(f"Loaded cached cue plan for {midi_file_name} ({len(plan)} measures, {time.perf_counter() - start:.3f} s)")
+            return plan
+
+    plan = compile_cue_plan(midi_file_name, instrument_order, midi_sha256, pan_offsets, preset_slots)
+    os.makedirs(cache_dir, exist_ok=True)
+    plan.save(cache_path)
+    print(f"Compiled cue plan for {midi_file_name} ({len(plan)} measures, {time.perf_counter() - start:.3f} s)")
+    return plan
+
+
+def execute_planned_measure(plan, measure_number, scheduler):
+    """
+    Executes the precompiled cue for one measure of a CuePlan. Only indexes into the plan, no MIDI parsing.
+
+    Parameters:
+    plan (CuePlan): The precompiled cues, see load_cue_plan.
+    measure_number (int): 1-indexed measure to perform.
+    scheduler: Runs the measure's timeline, e.g. a CueScheduler.
+    """
+    if measure_number < 1 or measure_number > len(plan):
+        print(f"Measure number {measure_number} is out of range for the given MIDI file.")
+        return
+
+    # The compiled sweep pans to each musician in turn, in instrument order: straight to their calibrated
+    # position if the plan was compiled with the pan map, otherwise by the fixed far-left / next-right pans
+    for instrument, movement in plan.measure_movements(measure_number).items():
+        if movement:
+            print(f"Movement for {instrument}: {movement}")
+        else:
+            print(f"{instrument} has no specific movement. 'Looking' at the instrument.")
+
+    scheduler.run(plan.measure(measure_number))
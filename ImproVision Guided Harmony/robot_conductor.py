@@ -1,127 +1,110 @@
-import pretty_midi
+import argparse
 import time
 import cv2
 import numpy as np
-import requests
-from mmpose.apis import MMPoseInferencer, init_model, inference_topdown
+import functools
+import os
+import sys
 import matplotlib.pyplot as plt
 import time
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ImproVision Common'))
+from ptz_transport import PTZTransport
+from cue_scheduler import CommandRecorder, CueScheduler, CueWorker, SystemClock, Timeline, VirtualClock
+from movement_compiler import compile_movement
+from score_analysis import robot_instructions
+from cue_plan import execute_planned_measure, load_cue_plan
+from video_source import LatestFrameGrabber
+from pose_service import PoseClient
+from pipeline import PosePipeline
+from gestures import GestureQueue, GestureStateMachine, stack_keypoints
+from keypoint_filters import apply_filter, make_keypoint_filter
+from tracking import EnsembleTracker
+from pan_map import calibrate_pan_map, load_pan_map
+from ptz_presets import PresetManager
+from camera_motion import ClosedLoopPans, MotionEstimator, MotionRates, frame_feed
+import pose_models
+
 # Constants
 INSTRUMENT_ORDER = ['Violin I', 'Violin II', 'Viola', 'Violoncello']
 #CAMERA_URL = 'http://192.168.100.88/cgi-bin/ptzctrl.cgi?ptzcmd&'
 MIDI_FILE_NAME = 'next_right_thing_2.mid'
 DEVICE = 'cuda'
+POSE_MODE = 'wholebody' # or 'body' / 'body-tiny' for the lighter 17-keypoint models, see pose_models.POSE_MODES
+POSE_BACKEND = 'pytorch' # or 'onnx' to run on CPU with ONNX Runtime (export with pose_onnx.py first)
+POSE_INT8 = False # with the onnx backend, use the int8-quantized model
+# Find each person with the RTMDet person detector (needs mmdet) and estimate one pose per person. Without it the
+# whole frame is a single person, so seat binding and the pan map calibration can't tell the musicians apart.
+# With POSE_SERVICE, start the service with --detect-people instead.
+DETECT_PEOPLE = True
+POSE_SERVICE = False # use the shared pose_service.py (model and stream already loaded) instead of loading them here
+PIPELINED = False # decode / pose / gesture / cue stages run concurrently (pose in its own process, see pipeline.py)
 CAMERA_IP = "192.168.100.88"
-BASE_URL = f'http://{CAMERA_IP}/cgi-bin/ptzctrl.cgi?ptzcmd&'
-
-def robot_instructions(midi_file_name):
+RTSP_URL = f'rtsp://{CAMERA_IP}/1'
+# One camera preset per seat plus home; cues recall them with one command each
+PRESETS_PATH = 'ptz_presets.json'
+USE_PRESETS = True # store presets from the pan map and aim with them instead of timed pans
+RETURN_HOME = Timeline.from_steps([(None, 2), ("home", 2)])
+GESTURE_DEBOUNCE = 2.0 # seconds before the same gesture counts again, however fast frames are processed
+# A hand must stay raised (by shoulder-width-normalized thresholds) for GESTURE_HOLD_MS to count as a gesture
+GESTURE_HOLD_MS = 300
+# Temporal smoothing of the keypoints before gesture checks: None, 'one-euro' or 'kalman' (see keypoint_filters).
+# Worth turning on when inference runs at a few FPS on CPU and wrist positions flicker.
+KEYPOINT_FILTER = None
+# Pan offset of each musician, measured by a calibration sweep on the first run and reused afterwards;
+# set CALIBRATE_PAN_MAP to sweep again (e.g. after the chairs moved)
+PAN_MAP_PATH = 'pan_map.json'
+CALIBRATE_PAN_MAP = False
+PAN_MAP = None # loaded or calibrated in __main__
+MOTION_RATES_PATH = 'motion_rates.json'
+# Without presets, stop each pan of the cues when the video shows the camera has turned far enough (see
+# camera_motion.ClosedLoopPans) instead of after a fixed time; needs a local video stream
+CLOSED_LOOP_PANS = True
+
+# Camera, cue and gesture state, made by setup_stage() in __main__ rather than on import: the pipeline's pose
+# process is spawned and re-imports this script, and must not open the camera or load any of these files
+CLOCK = RECORDER = CAMERA = PRESETS = SCHEDULER = None
+CUE_RUNNER = None # performs the measure cues: SCHEDULER, or ClosedLoopPans around it (see choose_cue_runner)
+GESTURES = GESTURE_STATE = KEYPOINT_SMOOTHER = ENSEMBLE = MOTION_RATES = None
+
+def setup_stage(simulate=False):
     """
-    Analyzes a MIDI file to prepare measure-by-measure signaling instructions for a robot.
-    
-    Parameters:
-    midi_file_name (str): The path to the MIDI file to be analyzed. Currently assumed to be in 4/4 time at 120 bpm.
-    Arbitrary number of instruments and measures.
-    
-    Returns:
-    A list of dictionaries, each representing a measure and containing instruments with their movements. 
-    """
-    midi_data = pretty_midi.PrettyMIDI(midi_file_name)
-    instructions = []
-
-    for instrument in midi_data.instruments:
-        if not instrument.is_drum: # Skip drums, MIDI treats those weirdly
-            previous_pitch = None
-            previous_measure = None
-
-            for note in sorted(instrument.notes, key=lambda x: x.start):
-                # Assuming 4/4 time signature and 120 bpm
-                measure_number = int(note.start / (60 / 120) / 4) + 1 # 60/120/4 because 60secs/120bpm in 4/4 time
-
-                if previous_pitch is not None and previous_measure is not None and measure_number != previous_measure:
-                    pitch_difference = note.pitch - previous_pitch
-                    movement = determine_robot_movement(pitch_difference)
-
-                    while len(instructions) < measure_number - 1:
-                        instructions.append({}) # Add a new dictionary for each new measure
-
-                    instrument_name = instrument.name or f"Program {instrument.program}"
-                    instructions[measure_number - 2][instrument_name] = movement # -2 because we skip the first measure (i.e., moving into measure 1) & list indexing
-
-                previous_pitch = note.pitch
-                previous_measure = measure_number
-    
-    return instructions
-
-def determine_robot_movement(pitch_difference):
-    """Determines the movement for the robot based on pitch difference."""
-    if pitch_difference == 0:
-        return "stay"
-    elif pitch_difference == 1:
-        return "up half"
-    elif pitch_difference == 2:
-        return "up whole"
-    elif pitch_difference == -1:
-        return "down half"
-    elif pitch_difference == -2:
-        return "down whole"
-    else:
-        return "irregular"
+    Creates the camera transport, cue scheduler, presets and the gesture / tracking state used by the game.
+    With simulate (--simulate), CLOCK is a VirtualClock and commands are only recorded by RECORDER, so the score
+    replays without camera or video (see simulate_performance); all timing goes through CLOCK either way.
+    """
+    global CLOCK, RECORDER, CAMERA, PRESETS, SCHEDULER, GESTURES, GESTURE_STATE, KEYPOINT_SMOOTHER, ENSEMBLE, MOTION_RATES
+    CLOCK = VirtualClock() if simulate else SystemClock()
+    RECORDER = CommandRecorder(CLOCK.monotonic)
+    CAMERA = PTZTransport(CAMERA_IP)
+    PRESETS = PresetManager(RECORDER.send if simulate else CAMERA.send, ['home'] + INSTRUMENT_ORDER, PRESETS_PATH)
+    SCHEDULER = CueScheduler(PRESETS.send, clock=CLOCK.monotonic, sleep=CLOCK.sleep if CLOCK.simulated else None)
+    # Gestures made while a cue runs wait here; one pending 'next' / 'skip' each, anything older than a minute is stale
+    GESTURES = GestureQueue(debounce=GESTURE_DEBOUNCE, max_age=60, max_pending=1)
+    GESTURE_STATE = GestureStateMachine(hold_ms=GESTURE_HOLD_MS)
+    KEYPOINT_SMOOTHER = make_keypoint_filter(KEYPOINT_FILTER)
+    # Stable ids for everyone in frame; the musicians are bound to INSTRUMENT_ORDER seats left to right once all are seated
+    ENSEMBLE = EnsembleTracker(INSTRUMENT_ORDER)
+    # Pan / tilt rates measured from the video during closed-loop moves, kept across runs
+    MOTION_RATES = MotionRates(MOTION_RATES_PATH)
 
 def send_camera_control(command, pan_speed=24, tilt_speed=20, focus_speed=10, zoom_speed=10): # updated to include speed parameter
     """
     Sends a command to the camera with optional speed parameters and checks the response status.
     """
-    def build_cgi_url(command, pan_speed, tilt_speed, focus_speed, zoom_speed):
-        """
-        Constructs the camera control URL based on the command and speeds provided.
-        """
-        action = command.lower()
-        if action in ["up", "down", "left", "right"]:
-            return f"{BASE_URL}{action}&{pan_speed}&{tilt_speed}"
-        elif action in ["home", "ptzstop"]:
-            return f"{BASE_URL}{action}"
-        elif action in ["focusin", "focusout", "focusstop"]:
-            return f"{BASE_URL}{action}&{focus_speed}"
-        elif action in ["zoomin", "zoomout", "zoomstop"]:
-            return f"{BASE_URL}{action}&{zoom_speed}"
-        else:
-            return f"{BASE_URL}home&10&10"
+    return PRESETS.send(command, pan_speed, tilt_speed, focus_speed, zoom_speed) # one keep-alive connection, see ptz_transport
 
-    url = build_cgi_url(command, pan_speed, tilt_speed, focus_speed, zoom_speed)
-    response = requests.get(url)
-    if response.status_code == 200:
-        print(f"Command '{command}' was successful")
-        return "success"
-    else:
-        print(f"Failed to execute command '{command}'")
-        return "failure"
+def movement_timeline(movement):
+    """
+    Builds the camera timeline for the specified movement instruction, followed by a return home (used by execute_one_measure).
+    """
+    return compile_movement(movement) + RETURN_HOME
 
 def execute_movement(movement): # also currently unused
     """
     Executes the camera movement based on the specified movement instruction.
     """
-    movements = {
-        "up half": ("up", 0.7),
-        "up whole": [("up", 0.5), ("up", 0.5)],
-        "down half": ("down", 0.7),
-        "down whole": [("down", 0.5), ("down", 0.5)]
-    }
-    commands = movements.get(movement)
-    if commands:
-        if isinstance(commands, list): # If multiple commands per movement (i.e., whole steps)
-            for cmd, delay in commands:
-                send_camera_control(cmd)
-                time.sleep(delay)
-                send_camera_control("ptzstop")
-        else:
-            cmd, delay = commands
-            send_camera_control(cmd)
-            time.sleep(delay)
-            send_camera_control("ptzstop")
-    time.sleep(2)
-    send_camera_control("home")
-    time.sleep(2)
+    SCHEDULER.run(movement_timeline(movement))
 
 def execute_one_measure(midi_file_name, measure_number, musician_positions): # currently unused, this is the more complex thing
     """
@@ -133,74 +116,56 @@ def execute_one_measure(midi_file_name, measure_number, musician_positions): # c
         return
 
     measure_instructions = instructions_by_measure[measure_number - 1]
-    send_camera_control("home") # Center
-    time.sleep(4)
 
+    use_presets = USE_PRESETS and PRESETS.has(*INSTRUMENT_ORDER)
+    timeline = Timeline() if use_presets else Timeline.from_steps([("home", 4)]) # Center
     for instrument in INSTRUMENT_ORDER:
-        if instrument in musician_positions:
+        if use_presets:
+            # One poscall lands on the musician wherever the camera is
+            timeline += PRESETS.timeline_to(instrument) + Timeline.from_steps([(None, 1)])
+        elif instrument in musician_positions:
             x_pos = musician_positions[instrument]
             move_time, direction = time_for_turn_by_proportion_of_range(x_pos)
-            send_camera_control(direction)
-            time.sleep(move_time)
-            send_camera_control("ptzstop")
-
-            time.sleep(1)
-            movement = measure_instructions.get(instrument)
-            if movement:
-                print(f"Executing movement for {instrument}: {movement}")
-                execute_movement(movement) # See helper function above
-            else:
-                print(f"{instrument} has no specific movement.")
-                time.sleep(1)
-
-            # Pan to the next musician
-            if instrument != INSTRUMENT_ORDER[-1]:
-                next_instrument = INSTRUMENT_ORDER[INSTRUMENT_ORDER.index(instrument) + 1]
-                if next_instrument in musician_positions:
-                    next_x_pos = musician_positions[next_instrument]
-                    next_move_time, next_direction = time_for_turn_by_proportion_of_range(next_x_pos)
-                    send_camera_control(next_direction)
-                    time.sleep(next_move_time)
-                    send_camera_control("ptzstop")
+            timeline += Timeline.from_steps([(direction, move_time), ("ptzstop", 1)])
+        else:
+            continue
+
+        movement = measure_instructions.get(instrument)
+        if movement:
+            print(f"Queueing movement for {instrument}: {movement}")
+            timeline += movement_timeline(movement) # See helper function above
+        else:
+            print(f"{instrument} has no specific movement.")
+            timeline += Timeline.from_steps([(None, 1)])
+
+        # Pan to the next musician
+        if not use_presets and instrument != INSTRUMENT_ORDER[-1]:
+            next_instrument = INSTRUMENT_ORDER[INSTRUMENT_ORDER.index(instrument) + 1]
+            if next_instrument in musician_positions:
+                next_x_pos = musician_positions[next_instrument]
+                next_move_time, next_direction = time_for_turn_by_proportion_of_range(next_x_pos)
+                timeline += Timeline.from_steps([(next_direction, next_move_time), ("ptzstop", 0)])
 
     # Final slam cue
-    send_camera_control("home")
-    time.sleep(3)
-    send_camera_control("ptzstop")
-    time.sleep(1)
-    send_camera_control("up")
-    time.sleep(0.7)
-    send_camera_control("down")
-    time.sleep(0.7)
+    timeline += Timeline.from_steps([("home", 3), ("ptzstop", 1), ("up", 0.7), ("down", 0.7)])
+    SCHEDULER.run(timeline)
 
 def time_for_turn_by_proportion_of_range(target_nose_x): # also currently unused
     """
     Calculates the duration and direction for the camera to turn based on the target nose x-coordinate.
+    Uses the rates measured by closed-loop pans if there are any, else the one measured by the calibration
+    sweep when there is a PAN_MAP, else the original fixed rates (camera_motion.DEFAULT_RATES).
     """
-    left_range = .62 
-    right_range = .56
-    max_x_left = 301/1920
-    max_x_right = 1736/1920
-    rate_left = (1920/2 - 301)/.62  
-    rate_right = (1736 - 1920/2)/.56  
-
     if target_nose_x > 1920/2:
         direction = "right"
-        target_motion_time = (target_nose_x - 1920/2) /  rate_right
     else:
         direction = "left"
-        target_motion_time = (1920/2 - target_nose_x) / rate_left
+    if PAN_MAP is not None and not MOTION_RATES.is_measured(direction):
+        return PAN_MAP.pan_time_for_x(target_nose_x)
+    target_motion_time = MOTION_RATES.time_for(direction, abs(target_nose_x - 1920/2))
 
     return target_motion_time, direction
 
-def init_pose_model():
-    """
-    Initializes the pose model for human pose estimation.
-    """
-    model_cfg = '/home/cvrr/mmpose/configs/body_2d_keypoint/rtmpose/coco/rtmpose-m_8xb64-270e_coco-wholebody-256x192.py'
-    ckpt = 'https://download.openmmlab.com/mmpose/v1/projects/rtmposev1/rtmpose-m_simcc-coco-wholebody_pt-aic-coco_270e-256x192-cd5e845c_20230123.pth'
-    return init_model(model_cfg, ckpt, device=DEVICE)
-
 def is_hand_above_head(person_landmarks): # check later, currently unused
     """
     Checks if any hand is raised above the head.
@@ -210,126 +175,80 @@ def is_hand_above_head(person_landmarks): # check later, currently unused
     right_wrist_y = person_landmarks['right_wrist'][1]
     return left_wrist_y < nose_y or right_wrist_y < nose_y
 
-def get_musician_positions(results): # check later too
+def get_musician_positions():
     """
-    Extracts the positions of the musicians from the pose estimation results.
+    Nose x of each seated musician, as tracked by ENSEMBLE.
+
+    Returns:
+    A dict of instrument -> nose x in pixels, for the musicians currently tracked (empty until the seats are bound).
     """
-    positions = {}
-    for person in results:
-        keypoints = person['keypoints']
-        person_landmarks = {
-            'nose': keypoints[0],
-            'left_wrist': keypoints[9],
-            'right_wrist': keypoints[10]
-        }
-        nose_x = person_landmarks['nose'][0]
-        positions[person['bbox'][0][0]] = nose_x  # Map bbox x-coordinate to instrument name
-    return positions
+    return ENSEMBLE.musician_positions()
 
-def simple_execute_one_measure(midi_file_name, measure_number): # just for now, use actual positions later
-    instructions_by_measure = robot_instructions(midi_file_name)
+# Signals to the musicians that the score is over; improve later
+END_OF_SCORE_CUE = Timeline.from_steps([
+    ("left", 0.8), ("ptzstop", 0),
+    ("right", 1), ("ptzstop", 0),
+    ("left", 1), ("ptzstop", 0),
+    ("right", 1), ("ptzstop", 0),
+])
 
-    if measure_number < 1 or measure_number > len(instructions_by_measure):
-        print(f"Measure number {measure_number} is out of range for the given MIDI file.")
-        return
-
-    measure_instructions = instructions_by_measure[measure_number - 1]
+def simulate_performance(plan, repeats=1):
+    """
+    Runs every measure of a CuePlan back to back, then the end-of-score cue, on the virtual clock (--simulate),
+    so a whole performance replays in well under a second with the timing it would have on the camera.
 
-    # Center
-    send_camera_control("home")
-    time.sleep(1)
+    Parameters:
+    plan (CuePlan): The precompiled cues.
+    repeats (int): How many times to play the score through, e.g. to time longer runs.
 
-    ### REPLACE: find person on far left ###
-    # Start by panning to the far left
-    send_camera_control("left")  
-    time.sleep(0.7)  # Wait a bit
-    send_camera_control("ptzstop")  # Stop the camera movement
+    Returns:
+    The recorded schedule, a list of ScheduledCommand with their virtual send times.
+    """
+    RECORDER.clear()
+    start, wall_start = CLOCK.monotonic(), time.perf_counter()
+    for _ in range(repeats):
+        for measure_number in range(1, len(plan) + 1):
+            SCHEDULER.run(plan.measure(measure_number), verbose=False)
+    SCHEDULER.run(END_OF_SCORE_CUE, verbose=False)
+    print(f"Simulated {repeats * len(plan)} measures: {len(RECORDER.schedule)} commands over "
+          f"{CLOCK.monotonic() - start:.1f} s of performance in {time.perf_counter() - wall_start:.3f} s")
+    return RECORDER.schedule
+
+def simple_execute_one_measure(plan, measure_number): # just for now, use actual positions later
+    execute_planned_measure(plan, measure_number, CUE_RUNNER)
+
+def aiming():
+    """
+    How the cue plan reaches each musician: by their presets if USE_PRESETS and they are stored,
+    else by timed pans to the PAN_MAP offsets, else by the fixed pans. Keyword arguments for load_cue_plan.
+    """
+    if USE_PRESETS and PRESETS.has(*INSTRUMENT_ORDER):
+        return {'preset_slots': PRESETS.slots_for(INSTRUMENT_ORDER)}
+    if PAN_MAP is not None:
+        return {'pan_offsets': PAN_MAP.offsets_for(INSTRUMENT_ORDER)}
+    return {}
 
-    # Iterate over instruments in order
-    for instrument in INSTRUMENT_ORDER:
-        time.sleep(.5)
-        movement = measure_instructions.get(instrument)
-        if movement:
-            print(f"Executing movement for {instrument}: {movement}")
-            execute_movement_for_instrument(movement) # See helper function below
-        else:
-            print(f"{instrument} has no specific movement. 'Looking' at the instrument.")
-            time.sleep(1)
-        
-        time.sleep(0.5)
-
-        # Pan to the next instrument on the right
-        if instrument != INSTRUMENT_ORDER[-1]:
-            ### REPLACE: find next person towards the right ###
-            send_camera_control("right")
-            time.sleep(.5)  
-            send_camera_control("ptzstop")
-    
-    # Final 'slam' cue
-    send_camera_control("home")
-    time.sleep(2)
-    send_camera_control('ptzstop')
-    time.sleep(0.5)
-    send_camera_control('up')
-    time.sleep(0.7)
-    send_camera_control('down')
-    time.sleep(1.5)
-    send_camera_control('ptzstop')
-    time.sleep(2)
-    send_camera_control('home')
-    time.sleep(1)
-
-def execute_movement_for_instrument(movement): # only used for simple_execute_one_measure
+def choose_cue_runner(cap):
+    """
+    Sets CUE_RUNNER: ClosedLoopPans watching cap if CLOSED_LOOP_PANS and the cues pan (no presets), else SCHEDULER.
+    Only a capture with peek() is watched, so the pans don't take frames from the pose loop.
+    """
+    global CUE_RUNNER
+    CUE_RUNNER = SCHEDULER
+    if CLOSED_LOOP_PANS and 'preset_slots' not in aiming() and hasattr(cap, 'peek'):
+        pixels_per_second = PAN_MAP.pixels_per_second if PAN_MAP is not None else None
+        CUE_RUNNER = ClosedLoopPans(SCHEDULER, MotionEstimator(frame_feed(cap, CLOCK)), MOTION_RATES, pixels_per_second,
+                                    clock=CLOCK)
+        print("Pans are closed-loop.")
+
+def execute_movement_for_instrument(movement):
     """
     Executes the camera movement based on the specified movement instruction.
 
     Parameters:
     movement (str): The movement instruction (e.g., "up half", "up whole").
     """
-    if movement == "up half":
-        send_camera_control("up")
-        time.sleep(0.7)
-        send_camera_control("ptzstop")
-        # Return to horizontal
-        time.sleep(0.7)
-        send_camera_control("down")
-        time.sleep(0.6)
-        send_camera_control("ptzstop")
-    elif movement == "up whole":
-        send_camera_control("up")
-        time.sleep(0.6)
-        send_camera_control("ptzstop")
-        time.sleep(0.5)  # Pause between half steps
-        send_camera_control("up")
-        time.sleep(0.6)
-        send_camera_control("ptzstop")
-        # Return to horizontal
-        time.sleep(0.7)
-        send_camera_control("down")
-        time.sleep(0.75)
-        send_camera_control("ptzstop")
-    elif movement == "down half":
-        send_camera_control("down")
-        time.sleep(0.7)
-        send_camera_control("ptzstop")
-        # Return to horizontal
-        time.sleep(0.7)
-        send_camera_control("up")
-        time.sleep(0.7)
-        send_camera_control("ptzstop")
-    elif movement == "down whole":
-        send_camera_control("down")
-        time.sleep(0.5)
-        send_camera_control("ptzstop")
-        time.sleep(0.5)  # Pause between half steps
-        send_camera_control("down")
-        time.sleep(0.5)
-        send_camera_control("ptzstop")
-        # Return to horizontal
-        time.sleep(0.7)
-        send_camera_control("up")
-        time.sleep(0.7)
-        send_camera_control("ptzstop")
+    SCHEDULER.run(compile_movement(movement))
 
 def draw_keypoints(frame, keypoints, color=(0, 255, 0)):
     # Ensure that keypoints is an array of arrays [[x, y, confidence], ...]
@@ -340,158 +259,105 @@ def draw_keypoints(frame, keypoints, color=(0, 255, 0)):
         elif len(keypoint) == 2:  # If no confidence is provided
             cv2.circle(frame, (int(keypoint[0]), int(keypoint[1])), 3, color, -1)
 
-def process_video_stream(cap, model, instructions):
+def track_people(people_keypoints, timestamp, scores=None):
     """
-    Processes the video stream to detect hand-raising gestures and execute movements.
+    Runs ENSEMBLE on one frame, so per-person state follows track ids. People it doesn't track (weak detections,
+    e.g. a half-occluded player) get -1, and no gesture or smoothing state.
+
+    Parameters:
+    people_keypoints (np.ndarray): (persons, K, 3) from gestures.stack_keypoints, or (persons, K, 2) plus scores.
+
+    Returns:
+    (persons,) array with the track id of every person, -1 for untracked ones.
+    """
+    return ENSEMBLE.update(people_keypoints, timestamp, scores)
+
+def queue_gestures(people_keypoints, timestamp, scores=None, ids=None):
     """
-    measure_number = 1  # Initialize measure number
-    time.sleep(.5) 
+    Pushes the gestures seen in one frame onto GESTURES, stamped with the frame's capture time.
+    One hand raised (and held, see GESTURE_STATE) is 'next', both hands is 'skip'.
 
-    # to avoid detection of same raised hand in multiple consecutive frames, add debounce mechanism
-    #debounce_time = 10
-    #last_detection_time = time.time()
-    debounce_frames = 500
-    last_hand_raise_frame = -debounce_frames
+    Parameters:
+    people_keypoints (np.ndarray): (persons, K, 3) from gestures.stack_keypoints, or (persons, K, 2) plus scores.
+    ids (np.ndarray): Track id of each person, see track_people.
+    """
+    for gesture, person in GESTURE_STATE.update(people_keypoints, timestamp, scores, ids):
+        kind = {"one_hand_raised": "next", "both_hands_raised": "skip"}.get(gesture)
+        if kind and GESTURES.push(kind, timestamp, person):
+            print(f"{'Skip' if kind == 'skip' else 'Hand raised'} gesture detected!")
+
+def conduct_next_measure(state, plan, cues):
+    """
+    Starts the next measure when a queued gesture asks for it, without waiting for the cue to finish:
+    a 'next' gesture once the running cue is done (so it runs back to back with it), a 'skip' gesture
+    right away, cancelling the running cue.
+
+    Parameters:
+    state (dict): Holds the current 'measure_number'.
+    cues (CueWorker): Runs the cues in the background.
+
+    Returns:
+    False once the end of the score has been cued.
+    """
+    if cues.busy:
+        if GESTURES.pop("skip") is None:
+            return True
+        print("Skipping the rest of the current cue.")
+        GESTURES.pop("next") # raising both hands usually shows up as one hand first; the skip replaces it
+        while cues.busy:
+            CUE_RUNNER.cancel()
+            cues.wait(0.05)
+    elif GESTURES.pop() is None:
+        return True
+
+    state['measure_number'] += 1
+    measure_number = state['measure_number']
+    print(f"Moving on to measure number: {measure_number}")
+
+    if measure_number > len(plan)+1:
+        print("All measures completed.")
+        cues.submit(SCHEDULER.run, END_OF_SCORE_CUE)
+        return False
+    cues.submit(execute_planned_measure, plan, measure_number-1, CUE_RUNNER)
+    return True
+
+def process_video_stream(cap, model, plan):
+    """
+    Processes the video stream to detect hand-raising gestures and execute movements.
+    Cues run on a CueWorker, so gestures keep being detected (and queued) while the camera moves.
+    """
+    state = {'measure_number': 1}  # Initialize measure number
+    cues = CueWorker()
+    CLOCK.sleep(.5)
 
     i = 0
     while True:
         i += 1
         ret, frame = cap.read()
 
-        # Set the desired frame rate (e.g., 2 frames per second)
-        desired_fps = 1
-        delay = int(1000 / desired_fps)
-
         if not ret:
-            print("Failed to read frame from camera.")
-            print("Attempting Camera Stream restart.")
-            #break
-            #continue
-            cap.release()
-            cv2.destroyAllWindows()
-            # Initialize the camera
-            while not cap.isOpened():
-                cap = cv2.VideoCapture('rtsp://192.168.100.88/1')
-
-                # Ensure camera is ready
-                if not cap.isOpened():
-                    print("Error: Couldn't open the camera.")
-                    print("Attempting restart.")
-                    #exit()
-                else:
-                    ret, frame = cap.read()
-
-        print("Frame read successfully "+str(i))
-
-        result = inference_topdown(model, frame)
-        #print(f"Raw inference result: {result}")
-        #print(type(result))
-
-        hand_raised_detected = False
-
-        #if len(result) > 0 and 'predictions' in result[0]:
-        #if len(result) > 0 and (time.time() - last_detection_time > debounce_time): # and 'predictions' in result:
-        if len(result) > 0 and (i - last_hand_raise_frame >= debounce_frames):
-
-            for person in result:
-                keypoints = person.pred_instances.keypoints[0] # keypoints for one person
-                #print("Detected keypoints:")
-                #print(keypoints)
-                #print(len(keypoints))
+            # The grabber reconnects on its own thread with backoff; read() just waits for the next frame
+            print(f"Failed to read frame from camera. Stream health: {cap.health()}")
+            continue
 
-                draw_keypoints(frame, keypoints) #visual debugging
+        frame_age = cap.frame_age() or 0
+        print(f"Frame read successfully {i} (age {frame_age:.3f} s, dropped {cap.frames_dropped})")
 
-                # https://mmpose.readthedocs.io/en/latest/dataset_zoo/2d_wholebody_keypoint.html#coco-wholebody 
-                # https://github.com/jin-s13/COCO-WholeBody
-                nose = keypoints[0] # bc nose is keypoint 1
-                left_arm = keypoints[9] # left hand is keypoint 10
-                right_arm = keypoints[10] # right hand is keypoint 11
-
-                print(f"Nose position: {nose}")
-                print(f"Left arm position: {left_arm}")
-                print(f"Right arm position: {right_arm}")
-
-                # Check if either arm is above the nose by comparing y coordinates. Assuming y increases towards bottom of frame.
-                if left_arm[1] < nose[1] or right_arm[1] < nose[1]:
-                #if left_arm[1] < nose[1] - 50 or right_arm[1] < nose[1] - 50:
-                    print("Hand raised detected!")
-                    hand_raised_detected = True
-                    last_hand_raise_frame = i
-                    last_detection_time = time.time()
-                    break # break out if raised hand is detected
-
-            # if hand_raised_detected:
-            #     measure_number += 1
-            #     print(f"Moving on to measure number: {measure_number}")
-            #     execute_one_measure(MIDI_FILE_NAME, measure_number, )
-            #     if measure_number > len(instructions):
-            #         print("All measures completed.")
-            #         break
-
-            #p1 = result[0]
-            # print(type(p1))
-            # print(p1)
-            # print("Keypoints")
-            # print(p1.pred_instances)
-            # print("did that work")
-            #print(p1.pred_instances.keypoints) # gives pixel locations of detected keypoints
-            #print("let's go")
-            #print(p1['keypoints'])
-            # ['predictions']
-            # p2 = p1[0]
-            # p3 = p2[0]
-            # p4 = p3['keypoints']
-            
-            #person_nose = result['predictions'][0][0]['keypoints'][0]
-            #check = result['predictions'][0][0]['bbox'][0][0]
-
-            #if not check - 0 < 0.5:
-                #print("Person Found")
-                #print(person_nose)
-        
-            # musician_positions = get_musician_positions(result[0]['predictions'])
-            # print(f"Musician positions: {musician_positions}")
-
-            # execute_one_measure(MIDI_FILE_NAME, measure_number, musician_positions)
-            # print(f"Executed measure number: {measure_number}")
-            # time.sleep(2)
-            
-            # # Check if any musician raised their hand to move to the next measure
-            # if any(is_hand_above_head(person['keypoints']) for person in result['predictions']):
-            #     measure_number += 1  # Move to the next measure
-            #     print(f"Moving on to measure number: {measure_number}")
-            #     if measure_number > len(instructions):
-            #         print("All measures completed.")
-            #         break
+        result = pose_models.estimate_poses(model, frame)
 
+        if len(result) > 0:
+            timestamp = CLOCK.monotonic() - frame_age
+            people_keypoints = stack_keypoints(result) # (persons, keypoints, x / y / score)
+            ids = track_people(people_keypoints, timestamp)
+            people_keypoints = apply_filter(KEYPOINT_SMOOTHER, people_keypoints, timestamp, ids=ids)
+            for keypoints in people_keypoints:
+                draw_keypoints(frame, keypoints) #visual debugging
+            queue_gestures(people_keypoints, timestamp, ids=ids)
         else:
             print("No valid predictions found in the frame.")
 
-        if hand_raised_detected:
-            measure_number += 1
-            print(f"Moving on to measure number: {measure_number}")
-
-            # Pause detection and execute the next measure
-            simple_execute_one_measure(MIDI_FILE_NAME, measure_number-1)
-            
-            if measure_number > len(instructions)+1:
-                print("All measures completed.")
-                # insert some sequence of commands that indicate to musicians that score is over; improve later
-                send_camera_control("left")
-                time.sleep(0.8)
-                send_camera_control("ptzstop")
-                send_camera_control("right")
-                time.sleep(1)
-                send_camera_control("ptzstop")
-                send_camera_control("left")
-                time.sleep(1)
-                send_camera_control("ptzstop")
-                send_camera_control("right")
-                time.sleep(1)
-                send_camera_control("ptzstop")
-                break
-
-        # Wait for a specific amount of time (in milliseconds)
+        if not conduct_next_measure(state, plan, cues):
+            break
 
         if i % 20 == 0:
             cv2.imshow('Camera Stream', frame)
@@ -499,27 +365,83 @@ def process_video_stream(cap, model, instructions):
             if cv2.waitKey(1) & 0xFF == ord('q'):
                 break
 
-        #time.sleep(1)
-
-        # if cv2.waitKey(1) & 0xFF == ord('q'):
-        #     break
-
+    cues.wait()
+    cues.stop()
     cap.release()
     cv2.destroyAllWindows()
 
+def process_video_stream_pipelined(cap, plan):
+    """
+    Same game as process_video_stream, but on a PosePipeline: decoding, pose estimation (in its own process),
+    gesture checks and the camera cues run concurrently.
+    """
+    pipeline = PosePipeline(cap, functools.partial(pose_models.init_pose_model, POSE_MODE, DEVICE, POSE_BACKEND, POSE_INT8,
+                                                          person_detector=DETECT_PEOPLE))
+    pipeline.start()
+    state = {'frame': 0, 'measure_number': 1}
+
+    def on_poses(frame, keypoints, scores, ref):
+        state['frame'] += 1
+        ids = track_people(keypoints, ref.timestamp, scores)
+        keypoints = apply_filter(KEYPOINT_SMOOTHER, keypoints, ref.timestamp, scores, ids)
+
+        for person_keypoints in keypoints:
+            draw_keypoints(frame, person_keypoints) #visual debugging
+
+        if state['frame'] % 20 == 0:
+            cv2.imshow('Camera Stream', frame)
+            # Exit the loop if 'q' key is pressed
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                return False
+
+        queue_gestures(keypoints, ref.timestamp, scores, ids)
+        return conduct_next_measure(state, plan, pipeline.actuator)
+
+    try:
+        pipeline.run(on_poses)
+        pipeline.wait_for_actuation()
+        pipeline.report()
+    finally:
+        pipeline.stop()
+        cap.release()
+        cv2.destroyAllWindows()
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Conduct the quartet through the score with the PTZ camera.")
+    parser.add_argument('--simulate', action='store_true',
+                        help="Replay the score on a virtual clock without camera or video and print the command schedule")
+    parser.add_argument('--repeats', type=int, default=1, help="With --simulate, play the score this many times")
+    args = parser.parse_args()
+
+    setup_stage(args.simulate)
+    if args.simulate:
+        # No camera or video: aim with whatever presets / pan map were saved and replay the score
+        PAN_MAP = load_pan_map(PAN_MAP_PATH, INSTRUMENT_ORDER)
+        plan = load_cue_plan(MIDI_FILE_NAME, INSTRUMENT_ORDER, **aiming())
+        for command in simulate_performance(plan, args.repeats):
+            print(f"{command.time:8.3f}  {command.command} {' '.join(map(str, command.args))}")
+        sys.exit()
+
     # Send camera to home position
     send_camera_control("home")
-    time.sleep(4)
+    CLOCK.sleep(4)
+
+    if POSE_SERVICE:
+        # The pose service owns the model and the stream; the client reads its frames and keypoints
+        cap = model = PoseClient()
+    elif PIPELINED:
+        # The pose model is loaded in the pipeline's pose process
+        model = None
+        cap = LatestFrameGrabber(RTSP_URL)
+    else:
+        # Initialize the pose model
+        model = pose_models.init_pose_model(POSE_MODE, DEVICE, POSE_BACKEND, POSE_INT8, person_detector=DETECT_PEOPLE)
 
-    # Initialize the pose model
-    model = init_pose_model()
-    
-    # Initialize the inferencer
-    #inferencer = MMPoseInferencer('wholebody')
+        # Initialize the inferencer
+        #inferencer = MMPoseInferencer('wholebody')
 
-    # Initialize the camera
-    cap = cv2.VideoCapture('rtsp://192.168.100.88/1')
+        # Initialize the camera; frames are decoded on a background thread so inference always sees the newest one
+        cap = LatestFrameGrabber(RTSP_URL)
 
     # Ensure camera is ready
     if not cap.isOpened():
@@ -529,10 +451,29 @@ if __name__ == "__main__":
     # send_camera_control("home")
     # time.sleep(4)
 
-    # Load MIDI instructions
-    instructions = robot_instructions(MIDI_FILE_NAME)
-    print(f"Loaded instructions: {instructions}")
+    # Find where the musicians sit, sweeping the stage if there is no saved pan map yet
+    PAN_MAP = None if CALIBRATE_PAN_MAP else load_pan_map(PAN_MAP_PATH, INSTRUMENT_ORDER)
+    if PAN_MAP is None and model is None:
+        # The pipelined mode's model lives in the pose process; rather than loading a second one here, calibrate
+        # with a single-process run (PIPELINED = False) first
+        print("No pan map, using the fixed pans. Run once with PIPELINED = False to calibrate one.")
+    elif PAN_MAP is None and not DETECT_PEOPLE:
+        print("No pan map, using the fixed pans. Calibrating one needs DETECT_PEOPLE = True.")
+    elif PAN_MAP is None:
+        PAN_MAP = calibrate_pan_map(cap, model, CAMERA.send, INSTRUMENT_ORDER, PAN_MAP_PATH, clock=CLOCK)
+        if PAN_MAP is None:
+            print("Calibration failed, using the fixed pans.")
+    if USE_PRESETS and PAN_MAP is not None:
+        # Presets already stored at the same offsets (or aimed by hand) are kept
+        PRESETS.store_from_pan_map(PAN_MAP, INSTRUMENT_ORDER, clock=CLOCK)
+
+    # Load the precompiled cue plan (compiled and cached on first run)
+    plan = load_cue_plan(MIDI_FILE_NAME, INSTRUMENT_ORDER, **aiming())
+    choose_cue_runner(cap)
 
     # Process the video stream
-    process_video_stream(cap, model, instructions)
+    if PIPELINED and not POSE_SERVICE:
+        process_video_stream_pipelined(cap, plan)
+    else:
+        process_video_stream(cap, model, plan)
 
@@ -0,0 +1,187 @@
+import numpy as np
+import pretty_midi
+
+# Notes that start within this many seconds before a downbeat count as being on it (float noise in tick -> time conversion)
+DOWNBEAT_TOLERANCE = 1e-6
+
+
+def measure_starts(midi_data):
+    """
+    Start times (in seconds) of every measure, following the file's own tempo map and time signature changes.
+    Files without time signature events are treated as 4/4 by pretty_midi.
+    """
+    return midi_data.get_downbeats()
+
+
+def assign_measures(downbeats, note_starts):
+    """
+    Buckets note start times into 1-indexed measure numbers with a single searchsorted.
+    Notes before the first downbeat (pickups) belong to measure 1.
+    """
+    measures = np.searchsorted(downbeats, note_starts + DOWNBEAT_TOLERANCE, side='right')
+    return np.maximum(measures, 1)
+
+
+def instrument_movements(midi_file_name):
+    """
+    Finds, per instrument, the pitch change from the last note of one measure to the first note of the next.
+
+    Parameters:
+    midi_file_name (str): The path to the MIDI file to be analyzed.
+
+    Returns:
+    A list of (instrument name, measure numbers, pitch differences) with one entry per non-drum instrument.
+    The measure number is the measure the instrument moves into; both are NumPy int arrays.
+    """
+    midi_data = pretty_midi.PrettyMIDI(midi_file_name)
+    downbeats = measure_starts(midi_data)
+    movements = []
+
+    for instrument in midi_data.instruments:
+        if instrument.is_drum or not instrument.notes: # Skip drums, MIDI treats those weirdly
+            continue
+
+        starts = np.fromiter((note.start for note in instrument.notes), dtype=float, count=len(instrument.notes))
+        pitches = np.fromiter((note.pitch for note in instrument.notes), dtype=int, count=len(instrument.notes))
+        order = np.argsort(starts, kind='stable')
+        starts, pitches = starts[order], pitches[order]
+
+        measures = assign_measures(downbeats, starts)
+        changes = np.flatnonzero(measures[1:] != measures[:-1]) + 1 # first note of each new measure
+
+        instrument_name = instrument.name or f"Program {instrument.program}"
+        movements.append((instrument_name, measures[changes], pitches[changes] - pitches[changes - 1]))
+
+    return movements
+
+
+# Movement codes used in InstructionMatrix: the semitone step itself for stay / half / whole steps,
+# plus two sentinels that can't be confused with a step.
+NO_MOVEMENT = -128 # instrument has no instruction in this measure
+IRREGULAR = 127 # larger leaps, which the robot can't signal
+MOVEMENT_NAMES = {0: "stay", 1: "up half", 2: "up whole", -1: "down half", -2: "down whole", IRREGULAR: "irregular"}
+MOVEMENT_CODES = {name: code for code, name in MOVEMENT_NAMES.items()}
+
+
+def pitch_differences_to_codes(pitch_differences):
+    """Vectorized determine_robot_movement: maps pitch differences to int8 movement codes."""
+    pitch_differences = np.asarray(pitch_differences)
+    return np.where(np.abs(pitch_differences) <= 2, pitch_differences, IRREGULAR).astype(np.int8)
+
+
+class InstructionMatrix:
+    """
+    Compact measure x instrument table of movement codes, an alternative to the list of dicts from robot_instructions.
+
+    Row i holds the movements into measure i + 2, i.e. the same indexing as robot_instructions (row 0 is its first dict).
+    Measure numbers passed to the methods are 1-indexed like everywhere else in the conductor.
+
+    Parameters:
+    codes (np.ndarray): int8 array of shape (measures, instruments) holding movement codes.
+    instruments (list): Instrument name of each column.
+    """
+
+    def __init__(self, codes, instruments):
+        self.codes = np.asarray(codes, dtype=np.int8)
+        self.instruments = list(instruments)
+        self.instrument_index = {name: i for i, name in enumerate(self.instruments)}
+
+    def __len__(self):
+        return self.codes.shape[0]
+
+    def measure(self, measure_number):
+        """Movement codes of every instrument for one measure (a view, no copy)."""
+        return self.codes[measure_number - 1]
+
+    def instrument(self, instrument_name):
+        """Movement codes of one instrument over the whole score (a view, no copy)."""
+        return self.codes[:, self.instrument_index[instrument_name]]
+
+    def movements(self, measure_number):
+        """Dict of instrument -> movement name for one measure, like one entry of robot_instructions."""
+        return {name: MOVEMENT_NAMES[code] for name, code in zip(self.instruments, self.measure(measure_number).tolist())
+                if code != NO_MOVEMENT}
+
+    def select(self, instrument_order):
+        """
+        Returns a matrix with columns in the given order. Instruments the score doesn't have get NO_MOVEMENT.
+        """
+        codes = np.full((len(self), len(instrument_order)), NO_MOVEMENT, dtype=np.int8)
+        for column, name in enumerate(instrument_order):
+            if name in self.instrument_index:
+                codes[:, column] = self.instrument(name)
+        return InstructionMatrix(codes, instrument_order)
+
+    def to_instructions(self):
+        """Converts back to the list of dicts format returned by robot_instructions."""
+        return [self.movements(measure_number) for measure_number in range(1, len(self) + 1)]
+
+    @classmethod
+    def from_instructions(cls, instructions):
+        """Builds a matrix from the list of dicts format returned by robot_instructions."""
+        instruments = list(dict.fromkeys(name for measure in instructions for name in measure))
+        index = {name: i for i, name in enumerate(instruments)}
+        codes = np.full((len(instructions), len(instruments)), NO_MOVEMENT, dtype=np.int8)
+        for row, measure in enumerate(instructions):
+            for name, movement in measure.items():
+                codes[row, index[name]] = MOVEMENT_CODES[movement]
+        return cls(codes, instruments)
+
+    def save(self, path):
+        """Saves to a .npz file."""
+        np.savez(path, codes=self.codes, instruments=np.array(self.instruments))
+
+    @classmethod
+    def load(cls, path):
+        """Loads a matrix written by save."""
+        with np.load(path) as data:
+            return cls(data['codes'], data['instruments'].tolist())
+
+
+def robot_instruction_matrix(midi_file_name):
+    """
+    Analyzes a MIDI file into an InstructionMatrix.
+
+    Parameters:
+    midi_file_name (str): The path to the MIDI file to be analyzed.
+    """
+    movements = instrument_movements(midi_file_name)
+    instruments = list(dict.fromkeys(name for name, _, _ in movements)) # unnamed duplicates share a column, as in the dicts
+    index = {name: i for i, name in enumerate(instruments)}
+    num_measures = max((int(measures.max()) - 1 for _, measures, _ in movements if len(measures)), default=0)
+
+    codes = np.full((num_measures, len(instruments)), NO_MOVEMENT, dtype=np.int8)
+    for instrument_name, measures, pitch_differences in movements:
+        # -2 because we skip the first measure (i.e., moving into measure 1) & row indexing
+        codes[measures - 2, index[instrument_name]] = pitch_differences_to_codes(pitch_differences)
+    return InstructionMatrix(codes, instruments)
+
+
+def robot_instructions(midi_file_name):
+    """
+    Analyzes a MIDI file to prepare measure-by-measure signaling instructions for a robot.
+
+    Parameters:
+    midi_file_name (str): The path to the MIDI file to be analyzed. Measures follow the file's tempo map and
+    time signatures. Arbitrary number of instruments and measures.
+
+    Returns:
+    A list of dictionaries, each representing a measure and containing instruments with their movements.
+    """
+    return robot_instruction_matrix(midi_file_name).to_instructions()
+
+
+def determine_robot_movement(pitch_difference):
+    """Determines the movement for the robot based on pitch difference."""
+    if pitch_difference == 0:
+        return "stay"
+    elif pitch_difference == 1:
+        return "up half"
+    elif pitch_difference == 2:
+        return "up whole"
+    elif pitch_difference == -1:
+        return "down half"
+    elif pitch_difference == -2:
+        return "down whole"
+    else:
+        return "irregular"
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The scripts import their shared modules by directory, as they do when run from their own folders
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory in ('ImproVision Common', 'ImproVision Guided Harmony', 'ImproVision Equilibrium'):
+    sys.path.insert(0, os.path.join(ROOT, directory))
+
+SAMPLE_MIDI = os.path.join(ROOT, 'ImproVision Guided Harmony', 'next_right_thing_2.mid')
@@ -0,0 +1,68 @@
+import cv2
+import numpy as np
+import pytest
+
+from camera_motion import DIRECTION_SIGNS, ClosedLoopPans, MotionEstimator, MotionRates, move_closed_loop
+from cue_scheduler import CommandRecorder, Timeline, VirtualClock
+
+
+def test_split_turns_pans_followed_by_a_stop_into_moves():
+    timeline = Timeline([(0.0, "home"), (2.0, "left"), (3.5, "ptzstop"), (4.0, "up"), (4.5, "ptzstop"),
+                         (5.0, "right"), (6.0, "ptzstop")], duration=8.0)
+    parts = ClosedLoopPans.split(timeline)
+
+    assert [part if isinstance(part, tuple) else (part.events, part.duration) for part in parts] == [
+        (((0.0, "home"),), 2.0),
+        ("left", 1.5),
+        (((0.5, "up"), (1.0, "ptzstop")), 1.5),
+        ("right", 1.0),
+        ((), 2.0),
+    ]
+
+
+def test_split_keeps_pans_without_a_stop_timed():
+    timeline = Timeline([(0.0, "left"), (1.0, "home"), (2.0, "right")], duration=3.0)
+    parts = ClosedLoopPans.split(timeline)
+    assert len(parts) == 1
+    assert parts[0].events == timeline.events and parts[0].duration == 3.0
+    assert ClosedLoopPans.split(Timeline())[0].events == ()
+
+
+class SimulatedCamera:
+    """A camera looking at a textured wall: turns at rate pixels per second while a move command is active."""
+
+    def __init__(self, clock, rate=600.0, fps=30.0):
+        rng = np.random.default_rng(0)
+        self.wall = cv2.GaussianBlur(rng.uniform(0, 255, (1600, 2400)).astype(np.float32), (0, 0), 3).astype(np.uint8)
+        self.clock, self.rate, self.fps = clock, rate, fps
+        self.position = np.array([800.0, 500.0])  # top-left corner of the view on the wall
+        self.recorder = CommandRecorder(clock.monotonic)
+        self.moving = None
+
+    def send(self, command, *args):
+        self.moving = None if command == "ptzstop" else command
+        return self.recorder.send(command, *args)
+
+    def next_frame(self, timeout=1.0):
+        self.clock.sleep(1 / self.fps)
+        if self.moving is not None:
+            # The scene shifts against the turn, e.g. left in the image when the camera pans right
+            self.position -= np.array(DIRECTION_SIGNS[self.moving]) * self.rate / self.fps
+        x, y = np.round(self.position).astype(int)
+        return self.wall[y:y + 360, x:x + 640], self.clock.monotonic(), 0
+
+
+@pytest.mark.parametrize('direction', ["right", "up"])
+def test_move_closed_loop_stops_on_target(direction):
+    clock = VirtualClock()
+    camera = SimulatedCamera(clock)
+    start = camera.position.copy()
+    rates = MotionRates()
+    travelled = move_closed_loop(camera.send, MotionEstimator(camera.next_frame), direction, 300, rates, clock=clock)
+
+    turned = float(np.dot(DIRECTION_SIGNS[direction], start - camera.position))
+    assert turned == pytest.approx(300, abs=camera.rate / camera.fps)
+    assert travelled == pytest.approx(turned, abs=3)
+    # Only the pan speed is sent, so tilts keep the camera's default tilt speed
+    assert [(c.command, c.args) for c in camera.recorder.schedule] == [(direction, (24,)), ("ptzstop", ())]
+    assert rates.is_measured(direction)
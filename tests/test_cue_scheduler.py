@@ -0,0 +1,74 @@
+import pytest
+
+from cue_scheduler import CommandRecorder, CueScheduler, Timeline, VirtualClock
+
+
+def virtual_scheduler(send_time=0.0):
+    """A scheduler on a VirtualClock whose camera takes send_time seconds to answer each command."""
+    clock = VirtualClock()
+    recorder = CommandRecorder(clock.monotonic)
+
+    def send(command, *args):
+        recorder.send(command, *args)
+        clock.sleep(send_time)
+
+    return CueScheduler(send, clock=clock.monotonic, sleep=clock.sleep), recorder, clock
+
+
+def test_from_steps_and_then():
+    first = Timeline.from_steps([("up", 0.7), ("ptzstop", 0.3), (None, 1.0)])
+    assert first.events == ((0.0, "up"), (0.7, "ptzstop"))
+    assert first.duration == pytest.approx(2.0)
+
+    joined = first + Timeline.from_steps([("home", 1.0)])
+    assert joined.events[-1] == (pytest.approx(2.0), "home")
+    assert joined.duration == pytest.approx(3.0)
+
+
+def test_dict_round_trip_keeps_tuple_commands():
+    timeline = Timeline([(0.0, ("poscall", 3)), (0.6, "ptzstop")], 1.0)
+    restored = Timeline.from_dict(timeline.to_dict())
+    assert restored.events == timeline.events
+    assert restored.duration == timeline.duration
+
+
+def test_commands_fire_at_their_deadlines():
+    scheduler, recorder, clock = virtual_scheduler()
+    timeline = Timeline.from_steps([("home", 1.0), ("left", 0.7), ("ptzstop", 0.5)])
+    reports = scheduler.run(timeline, verbose=False)
+
+    assert [(command.time, command.command) for command in recorder.schedule] == [
+        (0.0, "home"), (1.0, "left"), (pytest.approx(1.7), "ptzstop")]
+    assert clock.monotonic() == pytest.approx(timeline.duration)
+    assert all(report.jitter == pytest.approx(0.0) for report in reports)
+
+
+def test_latency_does_not_accumulate():
+    scheduler, recorder, clock = virtual_scheduler(send_time=0.1)
+    timeline = Timeline.from_steps([("up", 0.5)] * 20)
+    scheduler.run(timeline, verbose=False)
+
+    # Deadlines are absolute: the whole timeline takes its duration, not duration + 20 round trips
+    assert clock.monotonic() == pytest.approx(timeline.duration)
+    # Commands are sent early by the learned one-way latency
+    assert scheduler.latency == pytest.approx(0.05, abs=0.01)
+    assert recorder.schedule[-1].time == pytest.approx(timeline.events[-1][0] - scheduler.latency, abs=0.01)
+
+
+def test_cancel_stops_before_the_next_event():
+    clock = VirtualClock()
+    recorder = CommandRecorder(clock.monotonic)
+
+    def send(command, *args):
+        recorder.send(command, *args)
+        if command == "left":
+            scheduler.cancel()
+
+    scheduler = CueScheduler(send, clock=clock.monotonic, sleep=clock.sleep)
+    scheduler.run(Timeline.from_steps([("home", 1.0), ("left", 0.7), ("ptzstop", 0.5), ("up", 0.7)]), verbose=False)
+
+    assert scheduler.cancelled
+    assert not scheduler.busy
+    assert [command.command for command in recorder.schedule] == ["home", "left", "ptzstop"]  # ptzstop from the cancel
+    assert recorder.schedule[-1].time == pytest.approx(1.7)  # at the next event's deadline, instead of it
+    assert not scheduler.cancel()  # nothing running any more
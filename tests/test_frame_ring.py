@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from frame_ring import FrameRing
+
+
+@pytest.fixture
+def ring():
+    ring = FrameRing(slots=3, max_frame_shape=(4, 6, 3))
+    yield ring
+    ring.close()
+    ring.unlink()
+
+
+def frame(value, shape=(4, 6, 3)):
+    return np.full(shape, value, dtype=np.uint8)
+
+
+def test_write_then_read(ring):
+    ref = ring.write(frame(7), seq=1, timestamp=12.5)
+    assert (ref.slot, ref.seq, ref.shape, ref.timestamp) == (1, 1, (4, 6, 3), 12.5)
+    assert ring.is_current(ref)
+    np.testing.assert_array_equal(ring.view(ref), frame(7))
+    copy = ring.read(ref)
+    np.testing.assert_array_equal(copy, frame(7))
+    assert not np.shares_memory(copy, ring.view(ref))
+
+
+def test_smaller_frames_fit(ring):
+    ref = ring.write(frame(3, (2, 2, 3)), seq=1)
+    np.testing.assert_array_equal(ring.read(ref), frame(3, (2, 2, 3)))
+
+
+def test_overwritten_slot_reads_none(ring):
+    refs = [ring.write(frame(seq), seq) for seq in range(1, 5)]  # seq 4 reuses the slot of seq 1
+    assert not ring.is_current(refs[0])
+    assert ring.view(refs[0]) is None and ring.read(refs[0]) is None
+    for seq, ref in zip(range(2, 5), refs[1:]):
+        np.testing.assert_array_equal(ring.read(ref), frame(seq))
+
+
+def test_too_large_frame_is_refused(ring):
+    assert ring.write(frame(1, (8, 6, 3)), seq=1) is None
@@ -0,0 +1,151 @@
+import numpy as np
+
+from gestures import GestureQueue, GestureStateMachine
+from pose_models import LEFT_SHOULDER, LEFT_WRIST, NOSE, RIGHT_SHOULDER, RIGHT_WRIST
+
+
+def pose(left_wrist_y=500.0, right_wrist_y=500.0, size=1.0, left_wrist_x=350.0):
+    """
+    (17, 3) body keypoints with the nose at (500, 300) and shoulders size * 100 px apart, so wrist heights in
+    pixels above the nose are size * 100 times their height in body scales.
+    """
+    keypoints = np.zeros((17, 3), dtype=np.float32)
+    keypoints[:, :2] = (500, 450)
+    keypoints[:, 2] = 0.9
+    keypoints[NOSE, :2] = (500, 300)
+    keypoints[LEFT_SHOULDER, :2] = (500 - 50 * size, 400)
+    keypoints[RIGHT_SHOULDER, :2] = (500 + 50 * size, 400)
+    keypoints[LEFT_WRIST, :2] = (left_wrist_x, left_wrist_y)
+    keypoints[RIGHT_WRIST, :2] = (650, right_wrist_y)
+    return keypoints
+
+
+def test_queue_debounces_by_time():
+    queue = GestureQueue(debounce=2.0)
+    assert queue.push("next", 10.0)
+    assert not queue.push("next", 11.5)  # same gesture within 2 s
+    assert queue.push("skip", 11.5)  # other gestures aren't held up
+    assert queue.push("next", 12.0)
+    assert (queue.accepted, queue.debounced) == (3, 1)
+
+
+def test_queue_pops_oldest_first_and_by_kind():
+    queue = GestureQueue(debounce=0.0)
+    queue.push("next", 1.0, person=3)
+    queue.push("skip", 2.0)
+    queue.push("next", 3.0)
+    assert queue.pop("skip", now=3.0).timestamp == 2.0
+    event = queue.pop(now=3.0)
+    assert (event.kind, event.timestamp, event.person) == ("next", 1.0, 3)
+    assert len(queue) == 1
+
+
+def test_queue_expires_stale_events():
+    queue = GestureQueue(debounce=0.0, max_age=5.0)
+    queue.push("next", 0.0)
+    queue.push("next", 4.0)
+    assert [event.timestamp for event in queue.pending(now=7.0)] == [4.0]
+    assert queue.expired == 1
+    assert queue.pop(now=10.0) is None
+
+
+def test_queue_keeps_newest_when_full():
+    queue = GestureQueue(debounce=0.0, max_pending=1)
+    queue.push("next", 1.0)
+    queue.push("next", 2.0)
+    queue.push("skip", 2.5)
+    assert [(event.kind, event.timestamp) for event in queue.pending(now=3.0)] == [("next", 2.0), ("skip", 2.5)]
+
+
+def test_queue_stamps_with_its_clock():
+    queue = GestureQueue(clock=lambda: 42.0)
+    queue.push("next")
+    assert queue.pop().timestamp == 42.0
+
+
+def run(machine, frames):
+    """Feeds (timestamp, poses) frames to the machine; returns the (timestamp, gesture, person) that fired."""
+    fired = []
+    for timestamp, poses in frames:
+        fired += [(timestamp, gesture, person) for gesture, person in machine.update(np.stack(poses), timestamp)]
+    return fired
+
+
+def test_gesture_fires_once_after_the_hold_time():
+    machine = GestureStateMachine(hold_ms=300)
+    fired = run(machine, [(t / 10, [pose(left_wrist_y=200)]) for t in range(6)])
+    assert fired == [(0.3, 'hand_raised', 0), (0.3, 'one_hand_raised', 0)]
+    assert machine.is_active('one_hand_raised', 0)
+
+
+def test_brief_raise_does_not_fire():
+    machine = GestureStateMachine(hold_ms=300)
+    frames = [(0.0, [pose(left_wrist_y=200)]), (0.1, [pose(left_wrist_y=200)]), (0.2, [pose()]), (0.3, [pose()])]
+    assert run(machine, frames) == []
+
+
+def test_release_hysteresis():
+    machine = GestureStateMachine(raise_enter=0.3, raise_release=0.0, hold_ms=0, release_ms=200)
+    assert run(machine, [(0.0, [pose(left_wrist_y=200)])]) == [(0.0, 'hand_raised', 0), (0.0, 'one_hand_raised', 0)]
+
+    # 10 px above the nose: below the enter threshold, above the release one, so the gesture stays active
+    drifting = [(0.1 * t, [pose(left_wrist_y=290)]) for t in range(1, 6)]
+    assert run(machine, drifting) == []
+    assert machine.is_active('hand_raised', 0)
+
+    # Lowered for less than release_ms and raised again: still the same gesture
+    assert run(machine, [(0.6, [pose()]), (0.7, [pose(left_wrist_y=200)])]) == []
+    # Lowered for release_ms: released, so raising again fires again
+    assert run(machine, [(0.8, [pose()]), (1.05, [pose()])]) == []
+    assert not machine.is_active('hand_raised', 0)
+    assert run(machine, [(1.1, [pose(left_wrist_y=200)])]) == [(1.1, 'hand_raised', 0), (1.1, 'one_hand_raised', 0)]
+
+
+def test_thresholds_scale_with_the_body():
+    machine = GestureStateMachine(raise_enter=0.3, hold_ms=0)
+    # 40 px above the nose is 0.4 body scales for a 100 px wide musician, but only 0.2 for a 200 px wide one
+    assert run(machine, [(0.0, [pose(left_wrist_y=260), pose(left_wrist_y=260, size=2)])]) == [
+        (0.0, 'hand_raised', 0), (0.0, 'one_hand_raised', 0)]
+
+
+def test_both_hands_and_hand_to_head():
+    machine = GestureStateMachine(hold_ms=0)
+    fired = run(machine, [(0.0, [pose(left_wrist_y=200, right_wrist_y=200),
+                                 pose(left_wrist_y=280, left_wrist_x=510)])])
+    assert sorted(fired) == [(0.0, 'both_hands_raised', 0), (0.0, 'hand_raised', 0), (0.0, 'hand_to_head', 1)]
+
+
+def test_state_follows_ids():
+    machine = GestureStateMachine(hold_ms=200)
+    raised, lowered = pose(left_wrist_y=200), pose()
+    fired = []
+    # The raised hand belongs to id 7 whichever position it has in the frame
+    for t, order in enumerate([(raised, lowered), (lowered, raised), (raised, lowered)]):
+        ids = [7, 2] if order[0] is raised else [2, 7]
+        fired += machine.update(np.stack(order), t / 10, ids=ids)
+    assert fired == [('hand_raised', 7), ('one_hand_raised', 7)]
+
+
+def test_untracked_people_have_no_state():
+    machine = GestureStateMachine(hold_ms=0)
+    assert machine.update(np.stack([pose(left_wrist_y=200)]), 0.0, ids=[-1]) == []
+    assert machine.update(np.stack([pose(left_wrist_y=200), pose()]), 0.1, ids=[-1, 0]) == []
+
+
+def test_state_stays_compact_as_ids_grow():
+    machine = GestureStateMachine(hold_ms=0, lost_ms=1000)
+    for i in range(2000):
+        machine.update(np.stack([pose(), pose()]), i / 30, ids=[0, 1 + i])
+    assert machine.active.shape[1] <= 64
+    fired = machine.update(np.stack([pose(left_wrist_y=200)]), 2000 / 30, ids=[5000])
+    assert fired == [('hand_raised', 5000), ('one_hand_raised', 5000)]
+
+
+def test_is_holding_covers_the_hold_time():
+    machine = GestureStateMachine(hold_ms=300)
+    machine.update(np.stack([pose(left_wrist_y=200)]), 0.0)
+    assert machine.is_holding('hand_raised', 0) and not machine.is_active('hand_raised', 0)
+    assert not machine.is_holding('hand_to_head', 0)
+    machine.update(np.stack([pose(left_wrist_y=200)]), 0.3)
+    assert machine.is_holding('hand_raised', 0) and machine.is_active('hand_raised', 0)
+    assert not machine.is_holding('hand_raised', 9)
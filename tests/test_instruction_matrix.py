@@ -0,0 +1,30 @@
+import numpy as np
+
+from conftest import SAMPLE_MIDI
+from score_analysis import NO_MOVEMENT, InstructionMatrix, robot_instruction_matrix, robot_instructions
+
+
+def test_npz_round_trip(tmp_path):
+    matrix = robot_instruction_matrix(SAMPLE_MIDI)
+    path = tmp_path / 'instructions.npz'
+    matrix.save(path)
+    loaded = InstructionMatrix.load(path)
+
+    assert loaded.instruments == matrix.instruments
+    assert loaded.codes.dtype == np.int8
+    np.testing.assert_array_equal(loaded.codes, matrix.codes)
+    assert loaded.to_instructions() == robot_instructions(SAMPLE_MIDI)
+
+
+def test_instructions_round_trip():
+    instructions = [{'Violin I': 'up half', 'Viola': 'irregular'}, {'Violin I': 'stay'}, {}]
+    matrix = InstructionMatrix.from_instructions(instructions)
+    assert matrix.instruments == ['Violin I', 'Viola']
+    assert matrix.to_instructions() == instructions
+
+
+def test_select_fills_missing_instruments():
+    matrix = InstructionMatrix.from_instructions([{'Violin I': 'up half', 'Viola': 'down whole'}])
+    selected = matrix.select(['Viola', 'Violoncello', 'Violin I'])
+    assert selected.codes.tolist() == [[-2, NO_MOVEMENT, 1]]
+    assert selected.movements(1) == {'Viola': 'down whole', 'Violin I': 'up half'}
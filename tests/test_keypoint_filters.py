@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+from keypoint_filters import KalmanKeypointFilter, KeypointFilter, OneEuroFilter, apply_filter, make_keypoint_filter
+
+
+def noisy_still_keypoints(frames=200, persons=2, keypoints=17, seed=0):
+    rng = np.random.default_rng(seed)
+    truth = rng.uniform(0, 1080, (persons, keypoints, 2))
+    return truth + rng.normal(0, 5, (frames, persons, keypoints, 2))
+
+
+@pytest.mark.parametrize('kind', ['one-euro', 'kalman'])
+def test_filter_reduces_jitter(kind):
+    noisy = noisy_still_keypoints()
+    keypoint_filter = make_keypoint_filter(kind)
+    filtered = np.stack([keypoint_filter.filter(frame, i / 5.0) for i, frame in enumerate(noisy)])
+    raw_jitter = np.abs(np.diff(noisy[20:], axis=0)).mean()
+    assert np.abs(np.diff(filtered[20:], axis=0)).mean() < raw_jitter / 1.25
+
+
+@pytest.mark.parametrize('kind', ['one-euro', 'kalman'])
+def test_first_sighting_returns_measurement(kind):
+    keypoint_filter = make_keypoint_filter(kind)
+    keypoints = noisy_still_keypoints(frames=1)[0]
+    np.testing.assert_allclose(keypoint_filter.filter(keypoints, 0.0), keypoints)
+
+
+@pytest.mark.parametrize('kind', ['one-euro', 'kalman'])
+def test_state_follows_ids(kind):
+    keypoint_filter = make_keypoint_filter(kind)
+    near, far = np.zeros((1, 17, 2)), np.full((1, 17, 2), 1000.0)
+    keypoint_filter.filter(np.concatenate([near, far]), 0.0, ids=[3, 20])
+    # Swapped positions in the frame, but each id keeps filtering its own keypoints
+    filtered = keypoint_filter.filter(np.concatenate([far, near]), 0.2, ids=[20, 3])
+    assert np.all(filtered[0] > 900) and np.all(filtered[1] < 100)
+
+
+@pytest.mark.parametrize('kind', ['one-euro', 'kalman'])
+def test_lost_person_starts_over(kind):
+    keypoint_filter = make_keypoint_filter(kind, lost_s=1.0)
+    keypoint_filter.filter(np.zeros((1, 17, 2)), 0.0)
+    keypoints = np.full((1, 17, 2), 500.0)
+    np.testing.assert_allclose(keypoint_filter.filter(keypoints, 2.0), keypoints)
+
+
+def test_one_euro_follows_fast_motion():
+    slow, fast = OneEuroFilter(beta=0.0), OneEuroFilter(beta=0.05)
+    for i in range(10):
+        keypoints = np.full((1, 1, 2), 100.0 * i)
+        lagging, following = slow.filter(keypoints, i / 10), fast.filter(keypoints, i / 10)
+    assert abs(following - 900).max() < abs(lagging - 900).max()
+
+
+def test_kalman_trusts_confident_keypoints_more():
+    keypoint_filter = KalmanKeypointFilter()
+    keypoint_filter.filter(np.zeros((1, 2, 2)), 0.0)
+    filtered = keypoint_filter.filter(np.full((1, 2, 2), 10.0), 0.2, scores=np.array([[1.0, 0.1]]))
+    assert filtered[0, 0, 0] > filtered[0, 1, 0]
+
+
+def test_base_filter_is_abstract():
+    with pytest.raises(TypeError):
+        KeypointFilter()
+
+
+def test_make_keypoint_filter():
+    assert make_keypoint_filter(None) is None
+    assert make_keypoint_filter('none') is None
+    assert isinstance(make_keypoint_filter('kalman', process_noise=1.0), KalmanKeypointFilter)
+    with pytest.raises(ValueError):
+        make_keypoint_filter('median')
+
+
+def test_apply_filter():
+    keypoints = np.zeros((2, 17, 3), dtype=np.float32)
+    keypoints[..., 2] = 0.9
+    assert apply_filter(None, keypoints, 0.0) is keypoints
+    filtered = apply_filter(OneEuroFilter(), keypoints, 0.0)
+    assert filtered.shape == keypoints.shape and filtered is not keypoints
+    np.testing.assert_array_equal(filtered[..., 2], keypoints[..., 2])
+    assert len(apply_filter(OneEuroFilter(), np.zeros((0, 17, 3)), 0.0)) == 0
+
+
+@pytest.mark.parametrize('kind', ['one-euro', 'kalman'])
+def test_untracked_people_pass_through(kind):
+    keypoint_filter = make_keypoint_filter(kind)
+    keypoint_filter.filter(np.zeros((2, 17, 2)), 0.0, ids=[4, -1])
+    keypoints = np.full((2, 17, 2), 100.0)
+    filtered = keypoint_filter.filter(keypoints, 0.2, ids=[4, -1])
+    assert np.all(filtered[0] < 100)
+    np.testing.assert_array_equal(filtered[1], keypoints[1])
+    assert keypoint_filter.slots.get(-1) is None
@@ -0,0 +1,34 @@
+import os
+
+import pytest
+
+from model_store import resolve_config
+
+CONFIG = 'configs/body_2d_keypoint/rtmpose/coco/test-config.py'
+
+
+def checkout(root):
+    path = root / CONFIG
+    path.parent.mkdir(parents=True)
+    path.write_text('')
+    return str(root)
+
+
+def test_environment_root_comes_first(tmp_path, monkeypatch):
+    env_root, default_root = checkout(tmp_path / 'env'), checkout(tmp_path / 'default')
+    monkeypatch.setenv('MMPOSE_ROOT', env_root)
+    assert resolve_config(CONFIG, default_root) == os.path.join(env_root, CONFIG)
+
+
+def test_default_root_without_the_environment(tmp_path, monkeypatch):
+    default_root = checkout(tmp_path / 'default')
+    monkeypatch.setenv('MMPOSE_ROOT', str(tmp_path / 'missing'))
+    assert resolve_config(CONFIG, default_root) == os.path.join(default_root, CONFIG)
+    monkeypatch.delenv('MMPOSE_ROOT')
+    assert resolve_config(CONFIG, default_root) == os.path.join(default_root, CONFIG)
+
+
+def test_missing_config(tmp_path, monkeypatch):
+    monkeypatch.delenv('MMPOSE_ROOT', raising=False)
+    with pytest.raises(FileNotFoundError):
+        resolve_config(CONFIG, str(tmp_path))
@@ -0,0 +1,48 @@
+import pytest
+
+from cue_scheduler import Timeline
+from movement_compiler import SLAM_CUE, compile_movement, compile_sweep
+
+# (command, wait) steps the original execute_movement_for_instrument sent for each movement string
+BASELINE_STEPS = {
+    "up half": [("up", 0.7), ("ptzstop", 0.7), ("down", 0.6), ("ptzstop", 0)],
+    "up whole": [("up", 0.6), ("ptzstop", 0.5), ("up", 0.6), ("ptzstop", 0.7), ("down", 0.75), ("ptzstop", 0)],
+    "down half": [("down", 0.7), ("ptzstop", 0.7), ("up", 0.7), ("ptzstop", 0)],
+    "down whole": [("down", 0.5), ("ptzstop", 0.5), ("down", 0.5), ("ptzstop", 0.7), ("up", 0.7), ("ptzstop", 0)],
+}
+
+
+@pytest.mark.parametrize('movement', sorted(BASELINE_STEPS))
+def test_compile_movement_matches_baseline(movement):
+    expected = Timeline.from_steps(BASELINE_STEPS[movement])
+    timeline = compile_movement(movement)
+    assert timeline.events == expected.events
+    assert timeline.duration == pytest.approx(expected.duration)
+
+
+def test_stay_only_holds():
+    timeline = compile_movement("stay")
+    assert timeline.events == ()
+    assert timeline.duration == 1.0
+
+
+def test_unknown_movement_is_empty():
+    assert len(compile_movement("irregular")) == 0
+    assert compile_movement("irregular").duration == 0
+
+
+def test_sweep_visits_every_musician_and_ends_with_the_slam_cue():
+    movements = ("up half", None, "down whole", "stay")
+    timeline = compile_sweep(movements)
+    commands = [command for _, command in timeline.events]
+    assert commands[0] == "home"
+    assert commands.count("left") == 1 and commands.count("right") == len(movements) - 1
+    slam = [command for _, command in SLAM_CUE.events]
+    assert commands[-len(slam):] == slam
+
+
+def test_sweep_with_presets_recalls_each_slot():
+    timeline = compile_sweep(("stay", "up half"), preset_slots=(2, 3))
+    recalls = [command for _, command in timeline.events if isinstance(command, tuple)]
+    assert recalls == [("poscall", 2), ("poscall", 3)]
+    assert timeline.events[0] == (0.0, ("poscall", 2))  # no homing first
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+import multimodal_equilibrium as equilibrium
+from test_gestures import pose
+
+
+@pytest.fixture(autouse=True)
+def fresh_gesture_state():
+    equilibrium.GESTURE_STATE.reset()
+
+
+def hold(keypoints, ids=None, frames=4):
+    """Detects the gestures of the same frame repeated over hold_ms."""
+    fired = []
+    for i in range(frames):
+        fired += equilibrium.detect_gestures(np.stack(keypoints), i / 10, ids=ids)
+    return fired
+
+
+def test_gestures_are_reported_per_person():
+    raised, to_head = pose(left_wrist_y=200), pose(left_wrist_y=280, left_wrist_x=510)
+    assert sorted(hold([raised, to_head, pose()], ids=[4, 9, 2])) == [('hand_raised', 4), ('hand_to_head', 9)]
+
+
+def test_raised_hand_and_hand_to_head_at_once_is_ignored():
+    both = pose(left_wrist_y=280, left_wrist_x=510, right_wrist_y=200)
+    assert hold([both]) == []
+
+
+def test_gesture_started_during_the_other_ones_hold_is_ignored():
+    raised, both = pose(right_wrist_y=200), pose(left_wrist_y=280, left_wrist_x=510, right_wrist_y=200)
+    # The hand goes to the head while the other is being raised: neither counts
+    assert equilibrium.detect_gestures(np.stack([raised]), -0.2) == []
+    assert hold([both]) == []
+
+
+def test_untracked_people_make_no_gestures():
+    assert hold([pose(left_wrist_y=200)], ids=[-1]) == []
+
+
+def test_note_movements():
+    assert equilibrium.note_movements(["C4", "E4", "A4"], ["C4", "E4", "G4"]) == ["stay", "stay", "down whole"]
+    assert equilibrium.note_movements(["D4", "F4"], ["D#4", "F#4"]) == ["up half", "up half"]
+
+
+def test_chord_changes_replay_on_a_virtual_clock():
+    chord_movements = [equilibrium.note_movements(chord, equilibrium.find_closest_constrained_chord(chord, quality)[0])
+                       for chord in (["C4", "E4", "A4"], ["D4", "F4", "B4"]) for quality in ("Major", "Minor")]
+    sweeps = [equilibrium.compile_sweep(tuple(movements)) for movements in chord_movements]
+    clock = equilibrium.VirtualClock()
+    schedule = equilibrium.simulate_chord_changes(chord_movements, clock)
+
+    assert [c.command for c in schedule] == [command for sweep in sweeps for _, command in sweep.events]
+    assert clock.monotonic() == pytest.approx(sum(sweep.duration for sweep in sweeps))
+    # Back to back: each sweep starts where the previous one's duration ends
+    assert schedule[len(sweeps[0])].time == pytest.approx(sweeps[0].duration + sweeps[1].events[0][0])
+
+
+def test_simulate_chords_skips_unreachable_chords():
+    # Three Cs can't reach a major triad moving two semitones at most
+    schedule = equilibrium.simulate_chords([["C4", "C4", "C4"], ["C4", "E4", "A4"]], qualities=("Major",))
+    assert len(schedule) == len(equilibrium.compile_sweep(("stay", "stay", "down whole")))
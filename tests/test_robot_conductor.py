@@ -0,0 +1,33 @@
+import pytest
+
+pytest.importorskip('matplotlib')  # imported by the conductor for its plots
+
+import robot_conductor
+from conftest import SAMPLE_MIDI
+from cue_plan import load_cue_plan
+
+
+@pytest.fixture
+def stage(tmp_path, monkeypatch):
+    # Presets and motion rates are read relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    robot_conductor.setup_stage(simulate=True)
+    return load_cue_plan(SAMPLE_MIDI, robot_conductor.INSTRUMENT_ORDER, cache_dir=str(tmp_path))
+
+
+def test_performance_replays_on_the_virtual_clock(stage):
+    plan = stage
+    timelines = [plan.measure(m) for m in range(1, len(plan) + 1)] + [robot_conductor.END_OF_SCORE_CUE]
+    start = robot_conductor.CLOCK.monotonic()
+    schedule = robot_conductor.simulate_performance(plan)
+
+    assert len(schedule) == sum(len(timeline) for timeline in timelines)
+    assert robot_conductor.CLOCK.monotonic() - start == pytest.approx(sum(t.duration for t in timelines))
+    assert schedule[0].time == start + timelines[0].events[0][0]
+    assert [c.time for c in schedule] == sorted(c.time for c in schedule)
+
+
+def test_repeats_replay_the_score_again(stage):
+    once = len(robot_conductor.simulate_performance(stage))
+    end_of_score = len(robot_conductor.END_OF_SCORE_CUE)
+    assert len(robot_conductor.simulate_performance(stage, repeats=3)) == 3 * (once - end_of_score) + end_of_score
@@ -0,0 +1,38 @@
+import numpy as np
+
+from conftest import SAMPLE_MIDI
+from score_analysis import IRREGULAR, determine_robot_movement, pitch_differences_to_codes, robot_instructions
+
+# robot_instructions of the sample score as the original per-note implementation computed it
+BASELINE_INSTRUCTIONS = [
+    {'Violin I': 'up half', 'Violin II': 'stay', 'Viola': 'down whole', 'Violoncello': 'stay'},
+    {'Violin I': 'up whole', 'Violin II': 'up whole', 'Viola': 'stay', 'Violoncello': 'down half'},
+    {'Violin I': 'stay', 'Violin II': 'down whole', 'Viola': 'stay', 'Violoncello': 'stay'},
+    {'Violin I': 'up whole', 'Violin II': 'stay', 'Viola': 'down whole', 'Violoncello': 'up half'},
+    {'Violin I': 'stay', 'Violin II': 'stay', 'Viola': 'down half', 'Violoncello': 'stay'},
+    {'Violin I': 'stay', 'Violin II': 'stay', 'Viola': 'up half', 'Violoncello': 'stay'},
+    {'Violin I': 'up whole', 'Violin II': 'up whole', 'Viola': 'up whole', 'Violoncello': 'up whole'},
+    {'Violin I': 'stay', 'Violin II': 'up whole', 'Viola': 'stay', 'Violoncello': 'down whole'},
+    {'Violin I': 'down whole', 'Violin II': 'up half', 'Viola': 'up whole', 'Violoncello': 'stay'},
+    {'Violin I': 'stay', 'Violin II': 'down half', 'Viola': 'stay', 'Violoncello': 'stay'},
+    {'Violin I': 'stay', 'Violin II': 'up half', 'Viola': 'down whole', 'Violoncello': 'stay'},
+    {'Violin I': 'up whole', 'Violin II': 'up whole', 'Viola': 'stay', 'Violoncello': 'up whole'},
+    {'Violin I': 'stay', 'Violin II': 'stay', 'Viola': 'stay', 'Violoncello': 'down whole'},
+    {'Violin I': 'up half', 'Violin II': 'up whole', 'Viola': 'down whole', 'Violoncello': 'stay'},
+    {'Violin I': 'stay', 'Violin II': 'down whole', 'Viola': 'down half', 'Violoncello': 'stay'},
+]
+
+
+def test_robot_instructions_match_baseline():
+    assert robot_instructions(SAMPLE_MIDI) == BASELINE_INSTRUCTIONS
+
+
+def test_pitch_differences_to_codes_matches_determine_robot_movement():
+    differences = np.arange(-5, 6)
+    codes = pitch_differences_to_codes(differences)
+    assert codes.dtype == np.int8
+    for difference, code in zip(differences.tolist(), codes.tolist()):
+        expected = determine_robot_movement(difference)
+        assert (code == IRREGULAR) == (expected == "irregular")
+        if code != IRREGULAR:
+            assert code == difference
@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+
+from pose_models import BODY_KEYPOINTS, NOSE
+from tracking import EnsembleTracker, IdSlots, PersonTracker, greedy_match, keypoint_boxes
+
+
+def ensemble(people=4, score=0.9, keypoints_per_person=17, sway=0.0):
+    """(people, K, 3) keypoints of musicians sitting 350 px apart from left to right, swayed sideways by sway px."""
+    keypoints = np.zeros((people, keypoints_per_person, 3), dtype=np.float32)
+    spread = np.linspace(0, 1, keypoints_per_person)
+    for p in range(people):
+        keypoints[p, :, 0] = 300 + 350 * p + 200 * spread + sway
+        keypoints[p, :, 1] = 300 + 600 * spread
+        keypoints[p, NOSE, :2] = (400 + 350 * p + sway, 350)
+    keypoints[..., 2] = score
+    return keypoints
+
+
+def test_greedy_match_takes_cheapest_pairs_first():
+    cost = np.array([[1.0, 0.2, 5.0],
+                     [0.1, 0.3, np.inf],
+                     [np.inf, np.inf, np.inf]])
+    assert greedy_match(cost) == [(1, 0), (0, 1)]
+    assert greedy_match(np.zeros((0, 3))) == []
+
+
+def test_keypoint_boxes():
+    keypoints = ensemble(people=2, keypoints_per_person=BODY_KEYPOINTS + 10)
+    keypoints[:, BODY_KEYPOINTS:, 2] = 0.0  # face and hands not detected
+    keypoints[1, :, 2] = 0.1  # nobody
+    boxes, scores = keypoint_boxes(keypoints)
+    body = keypoints[0, :BODY_KEYPOINTS, :2]
+    np.testing.assert_allclose(boxes[0], [*body.min(axis=0), *body.max(axis=0)])
+    # The score only averages the body keypoints, so missing face and hand keypoints don't sink it
+    np.testing.assert_allclose(scores, [0.9, 0.0])
+    assert keypoint_boxes(np.zeros((0, 17, 3)))[0].shape == (0, 4)
+
+
+def test_ids_stay_with_people():
+    tracker = PersonTracker()
+    rng = np.random.default_rng(0)
+    first = tracker.update(ensemble(), 0.0)
+    assert sorted(first.tolist()) == [0, 1, 2, 3]
+    for i in range(1, 30):
+        order = rng.permutation(4)
+        ids = tracker.update(ensemble(sway=20 * np.sin(i / 3))[order], i / 10)
+        np.testing.assert_array_equal(ids, first[order])
+    assert tracker.next_id == 4
+    assert tracker.confirmed.all()
+
+
+def test_weak_detections_need_a_track():
+    tracker = PersonTracker(high_score=0.5, low_score=0.2)
+    weak = ensemble(people=1, score=0.3)
+    assert tracker.update(weak, 0.0).tolist() == [-1]
+    assert tracker.update(weak, 0.1).tolist() == [-1]
+    assert len(tracker.ids) == 0 and tracker.next_id == 0
+
+    # A confident detection starts a track that a weak detection (partly occluded) then keeps
+    track_id = tracker.update(ensemble(people=1), 0.3)[0]
+    assert tracker.update(weak, 0.4).tolist() == [track_id]
+
+
+def test_tracks_expire():
+    tracker = PersonTracker(max_age=1.0)
+    tracker.update(ensemble(people=1), 0.0)
+    tracker.update(np.zeros((0, 17, 3)), 0.5)
+    assert len(tracker.ids) == 1
+    tracker.update(np.zeros((0, 17, 3)), 1.5)
+    assert len(tracker.ids) == 0
+
+
+def test_seats_bind_left_to_right():
+    seats = ['violin 1', 'violin 2', 'viola', 'cello']
+    tracker = EnsembleTracker(seats, bind_frames=5)
+    rng = np.random.default_rng(1)
+    ids_by_x = {}
+    for i in range(10):
+        order = rng.permutation(4)
+        ids = tracker.update(ensemble()[order], i / 10)
+        ids_by_x.update(zip(order.tolist(), ids.tolist()))
+        # Tracks are confirmed after min_hits (3) frames and seated bind_frames frames after that
+        assert tracker.seat_map.bound == (i >= 6)
+    assert tracker.seat_map.track_of_seat == {seat: ids_by_x[p] for p, seat in enumerate(seats)}
+    assert tracker.musician_positions() == {seat: 400.0 + 350 * p for p, seat in enumerate(seats)}
+
+
+def test_id_slots_are_recycled():
+    slots = IdSlots(lost_s=1.0)
+    assigned, elapsed = slots.assign([7, -1, 3], 0.0)
+    assert assigned.tolist() == [0, -1, 1] and np.isinf(elapsed).all()
+    assigned, elapsed = slots.assign([3], 0.5)
+    assert assigned.tolist() == [1] and elapsed.tolist() == [0.5]
+    # Id 7 has been gone for more than lost_s, so its slot goes to the next new id
+    assigned, elapsed = slots.assign([3, 12], 1.2)
+    assert assigned.tolist() == [1, 0] and elapsed[0] == pytest.approx(0.7) and np.isinf(elapsed[1])
+    assert slots.get(7) is None and slots.get(12) == 0
+
+
+def test_id_slots_stay_compact():
+    slots = IdSlots(lost_s=1.0)
+    # A new id every frame, e.g. a player who keeps losing their track: slots stay bounded by lost_s
+    for i in range(1000):
+        assigned, _ = slots.assign([0, 1, 2, 3, 4 + i], i / 30)
+        assert assigned[:4].tolist() == [0, 1, 2, 3]
+    assert len(slots) <= 64
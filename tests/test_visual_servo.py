@@ -0,0 +1,80 @@
+import pytest
+
+from cue_scheduler import CommandRecorder, VirtualClock
+from visual_servo import PID, CenteringServo
+
+
+def test_pid_proportional_on_first_sample():
+    pid = PID(kp=2.0, ki=1.0, kd=1.0, output_limit=10.0)
+    assert pid.update(0.25, 0.0) == pytest.approx(0.5)
+    assert pid.integral == 0.0
+
+
+def test_pid_integral_and_derivative():
+    pid = PID(kp=0.0, ki=1.0, kd=0.0, output_limit=10.0)
+    pid.update(0.5, 0.0)
+    assert pid.update(0.5, 0.4) == pytest.approx(0.2)
+
+    pid = PID(kp=0.0, ki=0.0, kd=1.0, output_limit=10.0)
+    pid.update(0.5, 0.0)
+    assert pid.update(0.3, 0.1) == pytest.approx(-2.0)
+    # Samples without time passing don't divide by zero
+    assert pid.update(0.2, 0.1) == 0.0
+
+
+def test_pid_integral_does_not_wind_up():
+    pid = PID(kp=0.0, ki=1.0, kd=0.0, integral_limit=0.5, output_limit=10.0)
+    for i in range(100):
+        pid.update(1.0, i / 10)
+    assert pid.integral == 0.5
+    assert pid.update(-1.0, 10.0) == pytest.approx(0.4)
+
+
+def test_pid_output_clipped_and_reset():
+    pid = PID(kp=5.0, output_limit=1.0)
+    assert pid.update(1.0, 0.0) == 1.0
+    assert pid.update(-1.0, 0.1) == -1.0
+    pid.reset()
+    assert pid.integral == 0.0 and pid.previous_time is None
+
+
+def simulate_centering(servo, nose_x, frames=100, fps=10, pixels_per_speed=20):
+    """Moves the nose against the camera's pan (pixels_per_speed px per second per unit of pan speed)."""
+    for i in range(frames):
+        timestamp = i / fps
+        if servo.moving is not None:
+            direction, speed = servo.moving
+            nose_x -= (1 if direction == "right" else -1) * speed * pixels_per_speed / fps
+        report = servo.update(nose_x, timestamp)
+        if report is not None:
+            return report, nose_x
+    return None, nose_x
+
+
+def test_servo_centers_the_nose():
+    clock = VirtualClock()
+    recorder = CommandRecorder(clock.monotonic)
+    servo = CenteringServo(recorder.send, deadband=40, release_band=80, clock=clock)
+    report, nose_x = simulate_centering(servo, 1400.0)
+    assert report is not None and abs(nose_x - 960) <= 40
+    assert report.start_error == 440 and report.commands == len(recorder.schedule)
+    assert recorder.schedule[0].command == "right" and recorder.schedule[-1].command == "ptzstop"
+    assert servo.moving is None and servo.summary()['centerings'] == 1
+
+
+def test_servo_ignores_drift_inside_the_release_band():
+    recorder = CommandRecorder()
+    servo = CenteringServo(recorder.send, deadband=40, release_band=80)
+    for i, nose_x in enumerate([960, 1020, 900, 1035]):
+        assert servo.update(nose_x, i / 10) is None
+    assert recorder.schedule == []
+
+
+def test_servo_stop_uses_its_clock():
+    clock = VirtualClock(start=5.0)
+    recorder = CommandRecorder(clock.monotonic)
+    servo = CenteringServo(recorder.send, clock=clock)
+    servo.update(1500.0, 5.0)
+    clock.sleep(0.5)
+    servo.stop()
+    assert [(c.time, c.command) for c in recorder.schedule] == [(5.0, "right"), (5.5, "ptzstop")]